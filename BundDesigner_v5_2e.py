@@ -1,559 +1,1425 @@
-# BundDesigner_v5_2e.py
-# Script-tool version for EngineeringArcProTools.atbx (Detainment Bund 3d Design)
-# Requests addressed:
-#  • Per-feature CSV rows (one per centreline) + a merged TOTALS row at the bottom.
-#  • Persist dissolved centrelines as <base>_Centrelines_MergedByID when Merge by ID = True.
-#  • Smoother crest/design surfaces: built-in gentle smoothing (crest ~2 m radius by default).
-#  • Keeps mask safety & clean in_memory temp handling.
-#  • Multipatch from full TINs + footprint via ExtrudeBetween (no ExtractTin).
-# Usage:
-#  • Save to: O:\_arcpro maps and templates\_python scripts\BundDesign\BundDesigner_v5_2e.py
-#  • Point your Script Tool to this file. Param order 0–24 and the same ToolValidator as before.
-
-import os, traceback
-import arcpy
-from arcpy import env
-from arcpy.sa import *
-
-arcpy.env.overwriteOutput = True
-
-# ---- smoothing knobs (adjust here if you want stronger/weaker smoothing) ----
-SMOOTH_CREST_METERS  = 2.0   # mean filter radius around crest elevations; 0 = none
-SMOOTH_DESIGN_METERS = 0.0   # mean filter radius on the final design raster before merging; 0 = none
-
-# ---------- helpers ----------
-
-def _as_bool(s):
-    return str(s).strip().lower() in ("true","1","yes","y")
-
-
-def _safe(ws, name):
-    return os.path.join(ws, arcpy.ValidateTableName(name, ws) if ws.lower().endswith(".gdb") else name)
-
-
-def _tmp_fc(name_stub, memory_ok=True):
-    nm = f"tmp_{name_stub}"
-    if memory_ok:
-        return os.path.join("in_memory", nm)
-    return _safe(arcpy.env.scratchGDB, nm)
-
-
-def _f(v, dflt=None):
-    if v is None or v == "":
-        return dflt
-    try:
-        return float(v)
-    except Exception:
-        return dflt
-
-
-def _smooth_raster(ras, meters, cell):
-    try:
-        if meters and meters > 0:
-            r = max(1, int(round(meters / max(cell, 0.0001))))
-            return FocalStatistics(ras, NbrCircle(r, "CELL"), "MEAN", "DATA")
-    except Exception as ex:
-        arcpy.AddWarning(f"Smoothing skipped: {ex}")
-    return ras
-
-
-# ---------- core engine ----------
-
-def run_engine(params):
-    (
-        in_lines, id_field, design_mode,
-        height_field, start_h, end_h,
-        hag_field, hag_value,
-        dem_path,
-        crest_w, keep_crest, batter, taper,
-        datum, name_suffix, strip,
-        out_ws,
-        want_merged_surf, want_perfeat_surf, want_fill_ras,
-        want_mpatch, want_footprint, want_csv,
-        merge_by_id, extra_buf
-    ) = params
-
-    arcpy.AddMessage("### BundDesigner v5.2e (engine) START ###")
-
-    # Licenses
-    if arcpy.CheckExtension("Spatial") != "Available":
-        raise arcpy.ExecuteError("Spatial Analyst license not available.")
-    have_3d = (arcpy.CheckExtension("3D") == "Available")
-    if want_mpatch and not have_3d:
-        arcpy.AddWarning("3D Analyst not available — skipping multipatch output.")
-        want_mpatch = False
-
-    # Existence
-    if not arcpy.Exists(in_lines):
-        raise arcpy.ExecuteError(f"Missing centrelines: {in_lines}")
-    if not arcpy.Exists(dem_path):
-        raise arcpy.ExecuteError(f"Missing DEM: {dem_path}")
-    if not arcpy.Exists(out_ws):
-        raise arcpy.ExecuteError(f"Missing output workspace: {out_ws}")
-
-    # Mode checks
-    if design_mode == "Use Field":
-        f = [f for f in arcpy.ListFields(in_lines) if f.name == height_field]
-        if not f:
-            raise arcpy.ExecuteError(f"Design height field '{height_field}' not on {in_lines}.")
-        if f[0].type not in ("Double", "Single", "Integer", "SmallInteger"):
-            raise arcpy.ExecuteError(f"Design height field '{height_field}' must be numeric (found {f[0].type}).")
-    elif design_mode == "Use Start/End":
-        if start_h is None or end_h is None:
-            raise arcpy.ExecuteError("Start and End crest heights are required for 'Use Start/End' mode.")
-    elif design_mode == "Use HAG Field":
-        f = [f for f in arcpy.ListFields(in_lines) if f.name == hag_field]
-        if not f:
-            raise arcpy.ExecuteError(f"HAG field '{hag_field}' not on {in_lines}.")
-        if f[0].type not in ("Double", "Single", "Integer", "SmallInteger"):
-            raise arcpy.ExecuteError(f"HAG field '{hag_field}' must be numeric (found {f[0].type}).")
-    elif design_mode == "Use HAG Value":
-        if hag_value is None:
-            raise arcpy.ExecuteError("Height Above Ground Value is required for 'Use HAG Value' mode.")
-    else:
-        raise arcpy.ExecuteError(f"Unknown design_mode: {design_mode}")
-
-    # Env
-    arcpy.CheckOutExtension("Spatial")
-    dem = Raster(dem_path)
-    env.snapRaster = dem
-    env.cellSize = dem
-    env.extent = dem.extent
-    env.mask = None
-
-    # Names
-    base = os.path.splitext(os.path.basename(in_lines))[0]
-    suffix = f"_{datum}" if (name_suffix and datum) else ""
-    surf_path = _safe(out_ws, f"{base}_BundSurface{suffix}")
-    fill_path = _safe(out_ws, f"{base}_BundFill{suffix}")
-    fp_fc = _safe(out_ws, f"{base}_BundFootprint{suffix}")
-    mp_fc = _safe(out_ws, f"{base}_BundMultipatch{suffix}")
-    merged_id_fc = _safe(out_ws, f"{base}_Centrelines_MergedByID")
-    is_gdb = out_ws.lower().endswith(".gdb")
-    per_dir = out_ws if is_gdb else os.path.join(out_ws, "per_feature")
-
-    # Containers
-    if want_footprint:
-        if arcpy.Exists(fp_fc):
-            arcpy.management.Delete(fp_fc)
-        arcpy.management.CreateFeatureclass(out_ws, os.path.basename(fp_fc), "POLYGON", spatial_reference=arcpy.Describe(in_lines).spatialReference)
-        for fn, ft, ln in [("CentrelineID", "TEXT", 256), ("Area_ha", "DOUBLE", None), ("VertDatum", "TEXT", 32)]:
-            arcpy.management.AddField(fp_fc, fn, ft, field_length=ln)
-
-    merged_s = None
-    merged_f = None
-
-    # Merge by ID (optional) — and persist a copy if requested
-    lines = in_lines
-    if merge_by_id:
-        arcpy.AddMessage(f"Merging overlaps by ID '{id_field}'…")
-        tmp_merge = _tmp_fc("merge", memory_ok=False)
-        if arcpy.Exists(tmp_merge):
-            arcpy.management.Delete(tmp_merge)
-        stats = None
-        carry_field = height_field if design_mode == "Use Field" else (hag_field if design_mode == "Use HAG Field" else None)
-        if carry_field:
-            stats = [[carry_field, "MAX"]]
-        arcpy.management.Dissolve(in_lines, tmp_merge, id_field, statistics_fields=stats, multi_part="SINGLE_PART")
-        if carry_field:
-            mx = f"MAX_{carry_field}"
-            names = [f.name for f in arcpy.ListFields(tmp_merge)]
-            if mx in names:
-                if carry_field not in names:
-                    arcpy.management.AddField(tmp_merge, carry_field, "DOUBLE")
-                arcpy.management.CalculateField(tmp_merge, carry_field, f"!{mx}!")
-        lines = tmp_merge
-        try:
-            # persist to output gdb with stable name
-            if arcpy.Exists(merged_id_fc):
-                arcpy.management.Delete(merged_id_fc)
-            arcpy.management.CopyFeatures(tmp_merge, merged_id_fc)
-            arcpy.AddMessage(f"Saved merged centrelines → {merged_id_fc}")
-        except Exception as ex:
-            arcpy.AddWarning(f"Could not save Centrelines_MergedByID: {ex}")
-
-    # Iterate features and accumulate per-feature rows for CSV
-    per_rows = []
-    dsc = arcpy.Describe(lines)
-    oid = dsc.OIDFieldName
-    flds = [oid, id_field, "SHAPE@", "SHAPE@LENGTH"]
-    if design_mode == "Use Field":
-        flds.insert(2, height_field)
-    if design_mode == "Use HAG Field":
-        flds.insert(2, hag_field)
-
-    with arcpy.da.SearchCursor(lines, flds) as cur:
-        for row in cur:
-            if design_mode == "Use Field":
-                oidv, cid, crest_val, geom, L = row
-                if crest_val is None:
-                    arcpy.AddWarning(f"OID {oidv}: NULL design height; skipped.")
-                    continue
-                crest_const = float(crest_val)
-                mode = "CONST_ABS"
-            elif design_mode == "Use HAG Field":
-                oidv, cid, hag_val, geom, L = row
-                if hag_val is None:
-                    arcpy.AddWarning(f"OID {oidv}: NULL HAG; skipped.")
-                    continue
-                hag_local = float(hag_val)
-                mode = "HAG_FIELD"
-            else:
-                oidv, cid, geom, L = row
-                mode = "GRADIENT" if design_mode == "Use Start/End" else "HAG_VALUE"
-
-            arcpy.AddMessage(f"— Feature OID {oidv} (ID={cid})")
-
-            # Local mask polygon (in_memory)
-            ln_fc = _tmp_fc(f"ln_{oidv}")
-            arcpy.management.CopyFeatures([geom], ln_fc)
-            reach = (batter * 10.0) + (crest_w * 0.5) + max(taper, 0.0) + max(extra_buf, 0.0)
-            msk = _tmp_fc(f"mask_{oidv}")
-            arcpy.analysis.Buffer(ln_fc, msk, f"{reach} Meters", line_side="FULL", line_end_type="FLAT", dissolve_option="ALL", method="PLANAR")
-            env.mask = msk
-
-            # Crest polygon (for maintain-crest logic)
-            cell = float(arcpy.GetRasterProperties_management(dem, "CELLSIZEX").getOutput(0))
-            crest_buf = crest_w / 2.0 + (cell * 0.5 if keep_crest else 0.0)
-            crest_fc = _tmp_fc(f"crest_{oidv}")
-            arcpy.analysis.Buffer(ln_fc, crest_fc, f"{crest_buf} Meters", line_side="FULL", line_end_type="FLAT", dissolve_option="ALL", method="PLANAR")
-
-            dist = EucDistance(crest_fc)
-
-            # Crest elevation surface per mode
-            if mode == "CONST_ABS":
-                crest_z = Float(crest_const)
-            elif mode == "GRADIENT":
-                step = max(cell, 2 * cell)
-                pts = _tmp_fc(f"pts_{oidv}")
-                arcpy.management.GeneratePointsAlongLines(ln_fc, pts, "DISTANCE", Distance=f"{step} Meters", Include_End_Points="END_POINTS")
-                arcpy.management.AddField(pts, "Chain_m", "DOUBLE")
-                arcpy.management.AddField(pts, "Crest_m", "DOUBLE")
-                with arcpy.da.UpdateCursor(pts, ["SHAPE@", "Chain_m", "Crest_m"]) as u:
-                    for shp, _, _ in u:
-                        ch = geom.measureOnLine(shp.firstPoint)
-                        zc = start_h + (end_h - start_h) * (ch / max(L, 0.0001))
-                        u.updateRow([shp, ch, zc])
-                crest_z = NaturalNeighbor(pts, "Crest_m")
-                crest_z = Con(IsNull(crest_z), Float(start_h), crest_z)
-            else:
-                step = max(cell, 2 * cell)
-                pts0 = _tmp_fc(f"pts0_{oidv}")
-                arcpy.management.GeneratePointsAlongLines(ln_fc, pts0, "DISTANCE", Distance=f"{step} Meters", Include_End_Points="END_POINTS")
-                pts = _tmp_fc(f"ptsd_{oidv}")
-                ExtractValuesToPoints(pts0, dem, pts, "INTERPOLATE", "VALUE_ONLY")
-                if "Crest_m" not in [f.name for f in arcpy.ListFields(pts)]:
-                    arcpy.management.AddField(pts, "Crest_m", "DOUBLE")
-                hag = hag_local if mode == "HAG_FIELD" else float(hag_value)
-                arcpy.management.CalculateField(pts, "Crest_m", f"!RASTERVALU! + {hag}", "PYTHON3")
-                crest_z = NaturalNeighbor(pts, "Crest_m")
-                crest_z = Con(IsNull(crest_z), Raster(dem) + Float(hag), crest_z)
-
-            # Gentle crest smoothing to reduce jaggedness
-            crest_z = _smooth_raster(crest_z, SMOOTH_CREST_METERS, cell)
-
-            # Design surface from crest & batter (+ optional taper)
-            design = Float(crest_z) - (Float(dist) / batter)
-            if taper > 0:
-                ends = _tmp_fc(f"ends_{oidv}")
-                arcpy.management.FeatureVerticesToPoints(ln_fc, ends, "BOTH_ENDS")
-                de = EucDistance(ends)
-                t = Con(de >= taper, 1.0, de / taper)
-                design = Raster(dem) + (design - Raster(dem)) * t
-
-            if keep_crest:
-                inside = Con(IsNull(ExtractByMask(dem, crest_fc)), 0, 1)
-                bund = Con(inside == 1, crest_z, Con(design > Raster(dem), design))
-            else:
-                bund = Con(design > Raster(dem), design)
-
-            # Optional light smoothing on final design
-            bund = _smooth_raster(bund, SMOOTH_DESIGN_METERS, cell)
-
-            fill = SetNull(IsNull(bund), bund - Raster(dem))
-
-            # Footprint (single dissolved poly only) + per-feature volumes
-            A = V = S = 0.0
-            if want_footprint:
-                poly = _tmp_fc(f"poly_{oidv}")
-                try:
-                    arcpy.conversion.RasterToPolygon(Con(fill, 1), poly, "NO_SIMPLIFY")
-                    dis = _tmp_fc(f"dis_{oidv}")
-                    arcpy.management.Dissolve(poly, dis)
-                    # volume by zonal sum of fill depth * cell area
-                    zt = _tmp_fc(f"zt_{oidv}", memory_ok=False)
-                    arcpy.sa.ZonalStatisticsAsTable(dis, "OBJECTID", fill, zt, "DATA", "SUM")
-                    depth_sum = 0.0
-                    with arcpy.da.SearchCursor(zt, ["SUM"]) as c:
-                        for (s,) in c:
-                            if s is not None:
-                                depth_sum += float(s)
-                    cellx = float(arcpy.GetRasterProperties_management(dem, "CELLSIZEX").getOutput(0))
-                    celly = float(arcpy.GetRasterProperties_management(dem, "CELLSIZEY").getOutput(0))
-                    cell_area = abs(cellx * celly)
-                    V = depth_sum * cell_area
-                    with arcpy.da.SearchCursor(dis, ["SHAPE@AREA"]) as c:
-                        for (a,) in c:
-                            A += float(a)
-                    S = A * (strip if strip else 0.0)
-
-                    # tag + append dissolved polygon to footprint FC
-                    for fn, ft in [("CentrelineID", "TEXT"), ("Area_ha", "DOUBLE"), ("VertDatum", "TEXT")]:
-                        if fn not in [f.name for f in arcpy.ListFields(dis)]:
-                            if ft == "TEXT":
-                                arcpy.management.AddField(dis, fn, ft, field_length=256 if fn == "CentrelineID" else 32)
-                            else:
-                                arcpy.management.AddField(dis, fn, ft)
-                    with arcpy.da.UpdateCursor(dis, ["CentrelineID", "Area_ha", "VertDatum", "SHAPE@AREA"]) as u:
-                        for r in u:
-                            r[0] = str(cid)
-                            r[1] = r[3] / 10000.0
-                            r[2] = datum
-                            u.updateRow(r)
-                    arcpy.management.Append(dis, fp_fc, "NO_TEST")
-                except arcpy.ExecuteError:
-                    arcpy.AddWarning(f"OID {oidv}: footprint/volumes failed; continuing.")
-            else:
-                # If no footprint requested, we can still compute A/V via raster where needed later
-                pass
-
-            # Per-feature CSV row (even if A/V are 0, include the line)
-            per_rows.append([
-                int(oidv), str(cid), float(L), design_mode,
-                (float(hag_local) if mode == "HAG_FIELD" else (float(hag_value) if mode == "HAG_VALUE" else None)),
-                (float(crest_const) if mode == "CONST_ABS" else None),
-                (float(start_h) if design_mode == "Use Start/End" else None),
-                (float(end_h) if design_mode == "Use Start/End" else None),
-                float(crest_w), float(batter), float(taper),
-                ("True" if keep_crest else "False"), float(strip if strip else 0.0),
-                A, V, S, datum
-            ])
-
-            # Merge accumulators (mask OFF)
-            prev = env.mask
-            env.mask = None
-            try:
-                if want_merged_surf:
-                    merged_s = bund if merged_s is None else Con(IsNull(merged_s), bund, Con(IsNull(bund), merged_s, Con(bund > merged_s, bund, merged_s)))
-                if want_merged_surf or want_fill_ras:
-                    merged_f = fill if merged_f is None else Con(IsNull(merged_f), fill, Con(IsNull(fill), merged_f, Con(fill > merged_f, fill, merged_f)))
-            finally:
-                env.mask = prev
-
-            # Clean per-feature in-memory temp vectors
-            for t in [ln_fc, msk, crest_fc]:
-                try:
-                    if t and arcpy.Exists(t):
-                        arcpy.management.Delete(t)
-                except Exception:
-                    pass
-
-    # Make absolutely sure no stale mask remains before final combine
-    env.mask = None
-    try:
-        arcpy.ClearEnvironment("mask")
-    except Exception:
-        pass
-
-    # Finalize rasters (mask-free context)
-    if want_merged_surf and merged_s is not None:
-        with arcpy.EnvManager(mask=None, extent=dem.extent, snapRaster=dem, cellSize=dem):
-            ms = Raster(merged_s)
-            final = Con(IsNull(ms), Raster(dem), ms)
-            arcpy.AddMessage(f"Writing merged surface → {surf_path}")
-            final.save(surf_path)
-        try:
-            arcpy.management.CalculateStatistics(surf_path)
-            arcpy.management.BuildPyramids(surf_path)
-        except Exception:
-            pass
-
-    if (want_merged_surf or want_fill_ras) and merged_f is not None:
-        with arcpy.EnvManager(mask=None, extent=dem.extent, snapRaster=dem, cellSize=dem):
-            arcpy.AddMessage(f"Writing merged fill → {fill_path}")
-            merged_f.save(fill_path)
-        try:
-            arcpy.management.CalculateStatistics(fill_path)
-        except Exception:
-            pass
-
-    # Multipatch (full TINs + footprint boundaries; no ExtractTin)
-    if want_mpatch and arcpy.Exists(fp_fc) and arcpy.Exists(surf_path):
-        try:
-            arcpy.AddMessage("Building multipatch from design/DEM TINs…")
-            cell = float(arcpy.GetRasterProperties_management(dem, "CELLSIZEX").getOutput(0))
-            ztol = max(0.01, cell * 0.05)
-            dem_tin = _safe(env.scratchGDB, "tmp_dem_tin_v52e")
-            des_tin = _safe(env.scratchGDB, "tmp_des_tin_v52e")
-            for t in [dem_tin, des_tin]:
-                if arcpy.Exists(t):
-                    arcpy.management.Delete(t)
-            arcpy.ddd.RasterTin(dem_path, dem_tin, ztol, "", 1.0)
-            arcpy.ddd.RasterTin(surf_path, des_tin, ztol, "", 1.0)
-            tmp_mp = _safe(env.scratchGDB, "tmp_mp_v52e")
-            if arcpy.Exists(tmp_mp):
-                arcpy.management.Delete(tmp_mp)
-            arcpy.ddd.ExtrudeBetween(des_tin, dem_tin, fp_fc, tmp_mp)
-            if not arcpy.Exists(mp_fc):
-                arcpy.management.CreateFeatureclass(out_ws, os.path.basename(mp_fc), "MULTIPATCH", spatial_reference=arcpy.Describe(in_lines).spatialReference)
-            if "VertDatum" not in [f.name for f in arcpy.ListFields(tmp_mp)]:
-                arcpy.management.AddField(tmp_mp, "VertDatum", "TEXT", field_length=32)
-            arcpy.management.CalculateField(tmp_mp, "VertDatum", f"'{datum}'", "PYTHON3")
-            arcpy.management.Append(tmp_mp, mp_fc, "NO_TEST")
-            for t in [dem_tin, des_tin, tmp_mp]:
-                try:
-                    if arcpy.Exists(t):
-                        arcpy.management.Delete(t)
-                except Exception:
-                    pass
-        except Exception as ex:
-            arcpy.AddWarning(f"Multipatch creation failed: {ex}")
-
-    # -------- CSV: per-feature rows + merged totals --------
-    if want_csv:
-        try:
-            # Merged totals from merged_f or from summed per_rows
-            total_area_m2 = 0.0
-            total_fill_m3 = 0.0
-            total_strip_m3 = 0.0
-            if 'merged_f' in locals() and merged_f is not None:
-                fp_for_total = fp_fc
-                if not arcpy.Exists(fp_for_total):
-                    arcpy.AddMessage("Creating temporary footprint from merged fill raster for totals…")
-                    tmp_poly = _tmp_fc("total_poly", memory_ok=False)
-                    arcpy.conversion.RasterToPolygon(Con(merged_f, 1), tmp_poly, "NO_SIMPLIFY")
-                    fp_for_total = _safe(env.scratchGDB, "total_fp")
-                    arcpy.management.Dissolve(tmp_poly, fp_for_total)
-                fp_all = _safe(env.scratchGDB, "fp_all")
-                if arcpy.Exists(fp_all):
-                    arcpy.management.Delete(fp_all)
-                arcpy.management.Dissolve(fp_for_total, fp_all)
-                cellx = float(arcpy.GetRasterProperties_management(dem, "CELLSIZEX").getOutput(0))
-                celly = float(arcpy.GetRasterProperties_management(dem, "CELLSIZEY").getOutput(0))
-                cell_area = abs(cellx * celly)
-                zt = _safe(env.scratchGDB, "zt_total")
-                if arcpy.Exists(zt):
-                    arcpy.management.Delete(zt)
-                arcpy.sa.ZonalStatisticsAsTable(fp_all, "OBJECTID", merged_f, zt, "DATA", "SUM")
-                depth_sum = 0.0
-                with arcpy.da.SearchCursor(zt, ["SUM"]) as c:
-                    for (s,) in c:
-                        if s is not None:
-                            depth_sum += float(s)
-                total_fill_m3 = depth_sum * cell_area
-                with arcpy.da.SearchCursor(fp_all, ["SHAPE@AREA"]) as c:
-                    for (a,) in c:
-                        total_area_m2 += float(a)
-                total_strip_m3 = total_area_m2 * (strip if strip else 0.0)
-            else:
-                # Fall back to sum of per-feature rows
-                for r in per_rows:
-                    total_area_m2  += float(r[13])
-                    total_fill_m3  += float(r[14])
-                    total_strip_m3 += float(r[15])
-
-            # Write table in GDB
-            tname = arcpy.ValidateTableName(f"{base}_BundVolumes{suffix}", out_ws)
-            tpath = os.path.join(out_ws, tname)
-            if arcpy.Exists(tpath):
-                arcpy.management.Delete(tpath)
-            arcpy.management.CreateTable(out_ws, tname)
-            schema = [
-                ("SourceOID", "LONG", None),
-                ("CentrelineID", "TEXT", 64),
-                ("Length_m", "DOUBLE", None),
-                ("Mode", "TEXT", 16),
-                ("HAG_m", "DOUBLE", None),
-                ("CrestField_m", "DOUBLE", None),
-                ("StartH_m", "DOUBLE", None),
-                ("EndH_m", "DOUBLE", None),
-                ("CrestWidth_m", "DOUBLE", None),
-                ("Batter_HperV", "DOUBLE", None),
-                ("EndTaper_m", "DOUBLE", None),
-                ("MaintainCrest", "TEXT", 8),
-                ("StripDepth_m", "DOUBLE", None),
-                ("FillArea_m2", "DOUBLE", None),
-                ("FillVolume_m3", "DOUBLE", None),
-                ("StripVolume_m3", "DOUBLE", None),
-                ("VertDatum", "TEXT", 32)
-            ]
-            for fn, tp, ln in schema:
-                if tp == "TEXT":
-                    arcpy.management.AddField(tpath, fn, tp, field_length=(ln or 255))
-                else:
-                    arcpy.management.AddField(tpath, fn, tp)
-            with arcpy.da.InsertCursor(tpath, [s[0] for s in schema]) as ic:
-                for r in per_rows:
-                    ic.insertRow(r)
-                # totals row at the end (SourceOID = -1, CentrelineID = "__TOTAL__")
-                ic.insertRow([
-                    -1, "__TOTAL__", None, design_mode,
-                    (float(hag_value) if design_mode == "Use HAG Value" else None), None,
-                    (float(start_h) if design_mode == "Use Start/End" else None),
-                    (float(end_h) if design_mode == "Use Start/End" else None),
-                    float(crest_w), float(batter), float(taper),
-                    ("True" if keep_crest else "False"), float(strip if strip else 0.0),
-                    total_area_m2, total_fill_m3, total_strip_m3, datum
-                ])
-
-            # CSV alongside GDB
-            ws_dir = out_ws if os.path.isdir(out_ws) else os.path.dirname(out_ws)
-            csv = os.path.join(ws_dir, f"{base}_BundVolumes{suffix}.csv")
-            headers = [s[0] for s in schema]
-            with open(csv, "w", encoding="utf-8") as f:
-                f.write(",".join(headers) + "\n")
-                def _fmt(v):
-                    return "" if v is None else (str(v))
-                for r in per_rows:
-                    f.write(",".join(_fmt(v) for v in r) + "\n")
-                total_row = [
-                    -1, "__TOTAL__", "", design_mode,
-                    (float(hag_value) if design_mode == "Use HAG Value" else ""), "",
-                    (float(start_h) if design_mode == "Use Start/End" else ""),
-                    (float(end_h) if design_mode == "Use Start/End" else ""),
-                    float(crest_w), float(batter), float(taper),
-                    ("True" if keep_crest else "False"), float(strip if strip else 0.0),
-                    total_area_m2, total_fill_m3, total_strip_m3, datum
-                ]
-                f.write(",".join(_fmt(v) for v in total_row) + "\n")
-            arcpy.AddMessage(f"Volumes table + CSV written → {tpath} and {csv}")
-        except Exception as ex:
-            arcpy.AddWarning(f"CSV creation failed: {ex}")
-
-    # Hard clean in_memory at end
-    try:
-        arcpy.management.Delete("in_memory")
-    except Exception:
-        pass
-
-    arcpy.AddMessage("### BundDesigner v5.2e (engine) DONE ###")
-
-
-# ---------- entry point ----------
-
-if __name__ == "__main__":
-    try:
-        arcpy.AddMessage("### Detainment Bund 3d Design — BundDesigner v5.2e (script) ###")
-        g = [arcpy.GetParameterAsText(i) for i in range(25)]
-        try:
-            cnt = int(arcpy.management.GetCount(g[0]).getOutput(0))
-            arcpy.AddMessage(f"Input features count: {cnt}")
-        except Exception as e:
-            arcpy.AddWarning(f"Could not count input features: {e}")
-        vals = [
-            g[0], g[1], (g[2] or "Use Field"), (g[3] or None),
-            _f(g[4], None), _f(g[5], None),
-            (g[6] or None), _f(g[7], None),
-            g[8], _f(g[9], 2.0),
-            _as_bool(g[10]), _f(g[11], 5.0), _f(g[12], 0.0),
-            (g[13] or ""), _as_bool(g[14]), _f(g[15], 0.0),
-            g[16], _as_bool(g[17]), _as_bool(g[18]), _as_bool(g[19]),
-            _as_bool(g[20]), _as_bool(g[21]), _as_bool(g[22]),
-            _as_bool(g[23]), _f(g[24], 20.0),
-        ]
-        run_engine(vals)
-    except Exception as ex:
-        arcpy.AddError("### BundDesigner ERROR ###")
-        arcpy.AddError(str(ex))
-        arcpy.AddError(traceback.format_exc())
-        raise
+# BundDesigner_v5_2e.py
+# Script-tool version for EngineeringArcProTools.atbx (Detainment Bund 3d Design)
+# Requests addressed:
+#  • Per-feature CSV rows (one per centreline) + a merged TOTALS row at the bottom.
+#  • Result tables kept columnar (bund_results.py): journaled to .npy as features finish,
+#    bulk-exported to CSV / GDB (NumPyArrayToTable) / Parquet (RESULTS_EXPORT).
+#  • Persist dissolved centrelines as <base>_Centrelines_MergedByID when Merge by ID = True.
+#  • Merge by ID dissolves in memory; neighbouring bunds share one DEM window (bund_index.py).
+#  • Smoother crest/design surfaces: built-in gentle smoothing (crest ~2 m radius by default).
+#  • Keeps mask safety & clean in_memory temp handling.
+#  • Footprints traced from the fill mask (bund_footprint.py), simplified, bulk-inserted.
+#  • Optional cloud-optimised GeoTIFF output: merged rasters streamed tile by tile (bund_cog.py, RASTER_COG).
+#  • Long centrelines run in overlapping chainage chunks (CHUNK_CELLS) with bounded memory.
+#  • Optional long/cross-sections every SECTION_SPACING_M with an average-end-area volume check.
+#  • Optional stage–storage–area of the pond behind each bund (priority-flood on the merged surface).
+#  • Multipatch solids meshed per CentrelineID from the bund/DEM arrays (bund_mesh.py; no TINs).
+#  • Per-feature bund/fill built in NumPy on the DEM window around each centreline (bund_engine.py).
+#  • Optional process pool for the per-feature design (WORKERS); results merged in OID order.
+#  • Content-hashed per-feature cache: re-runs only recompute edited/new centrelines.
+#  • Preview mode (PREVIEW_FACTOR): sketch run on a cached DEM pyramid level with a volume error band.
+#  • Optional resident design server (bund_server.py, DESIGN_SERVER) for sub-second single-line checks.
+#  • Optional per-stage profiling (PROFILE): JSON-lines trace + summary CSV (bund_profile.py).
+# Usage:
+#  • Save to: O:\_arcpro maps and templates\_python scripts\BundDesign\BundDesigner_v5_2e.py
+#  • Point your Script Tool to this file. Param order 0–24 and the same ToolValidator as before.
+
+import hashlib, os, sys, shutil, time, traceback
+import numpy as np
+import arcpy
+from arcpy import env
+from arcpy.sa import *
+
+arcpy.env.overwriteOutput = True
+
+# sibling engine modules live next to this script
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bund_engine as be
+from bund_cache import FeatureCache, feature_key
+from bund_cog import CogWriter
+from bund_dem import DemPyramid, DemTileCache
+import bund_footprint as bf
+import bund_index as bix
+import bund_mesh as bm
+from bund_profile import Profiler
+import bund_results as br
+import bund_scenarios as bs
+import bund_sections as bsec
+import bund_server as bsrv
+import bund_storage as bst
+from bund_tiles import TileCompositor
+
+# ---- smoothing knobs (adjust here if you want stronger/weaker smoothing) ----
+SMOOTH_CREST_METERS  = 2.0   # mean filter radius around crest elevations; 0 = none
+SMOOTH_DESIGN_METERS = 0.0   # mean filter radius on the final design raster before merging; 0 = none
+SMOOTH_KERNEL = "disc"       # "disc" (FocalStatistics circle), "box" (square) or "gaussian" (sigma = radius / 2)
+
+# ---- merged-output tiling ----
+TILE_SIZE = 1024             # cells per side of the merged surface/fill tiles held in memory
+RASTER_COG = False           # True = merged surface/fill streamed into tiled, compressed cloud-optimised
+                             # GeoTIFFs (.tif beside the CSVs; overviews + statistics inside) instead of
+                             # being mosaicked into out_ws
+COG_BLOCK = 512              # COG block edge in cells; a power of two that divides TILE_SIZE
+
+# ---- DEM access ----
+DEM_TILE = 512               # cells per side of cached DEM tiles
+DEM_CACHE_MB = 512.0         # resident DEM tile budget; least-recently-used tiles spill to scratch
+
+# ---- incremental re-runs ----
+FEATURE_CACHE_MB = 0.0       # per-feature result cache budget (BundDesigner_cache/ next to the output
+                             # workspace, e.g. 2048); 0 = off
+FEATURE_CACHE_INVALIDATE = False   # True = clear the cache before this run
+_FINGERPRINT_BLOCK = 64      # cells per side of the 9 DEM blocks hashed into the DEM fingerprint
+
+# ---- footprints ----
+FOOTPRINT_SIMPLIFY_CELLS = 1.0   # outline simplification tolerance in cells; 0 = exact cell staircase
+
+# ---- sections ----
+SECTION_SPACING_M = 0.0      # cross-sections every N m along each centreline (+ long-section,
+                             # end-area volume check); 0 = off
+
+# ---- detention storage ----
+STORAGE_STEP_M = 0.0         # stage–storage table for the pond behind each bund every N m of
+                             # stage (needs the merged surface); 0 = off
+STORAGE_PAD_M = 250.0        # window around each bund's centrelines searched for its pond
+STORAGE_NOISE_M = 0.1        # dips / pits shallower than this are DEM noise, not ponds or spills
+STORAGE_POUR_POINTS = {}     # CentrelineID → (x, y) pour point; others pour beside the crest low point
+
+# ---- multipatch solids ----
+MESH_EXPORT = ""             # also write the solids as "obj", "glb" or "obj,glb" next to the volumes CSV
+
+# ---- result tables ----
+RESULTS_EXPORT = ""          # also write the volume / sweep / solver tables as "parquet" (needs
+                             # pyarrow) next to the CSV; the .npy journal is always written
+
+# ---- profiling ----
+PROFILE = False              # True = per-stage timings → <base>_BundProfile.jsonl + summary CSV
+
+# ---- long alignments ----
+CHUNK_CELLS = 16_000_000     # features whose window exceeds this many cells run in overlapping
+                             # chainage chunks of about this size; 0 = never chunk
+
+# ---- clustering ----
+CLUSTER_CELLS = 4_000_000    # features whose reach zones touch run as one job on a shared DEM window
+                             # of up to this many cells (bund_index.py); 0 = every feature on its own
+
+# ---- preview / refine ----
+PREVIEW_FACTOR = 0           # 2 / 4 / 8 = sketch run on the DEM averaged over f × f cells (pyramid
+                             # kept beside the feature cache), volumes ± error band; 0 = full resolution
+REFINE_IDS = ()              # only run these CentrelineIDs, e.g. a full-resolution refine after a
+                             # preview; () = all
+
+# ---- design server ----
+DESIGN_SERVER = ""           # "host:port" of a running bund_server.py: the tool sends the centrelines
+                             # there (volumes CSV + footprints only); "" = design in-process
+
+# ---- parallelism ----
+WORKERS = 0                  # worker processes for the per-feature design; 0/1 = serial
+
+# ---------- helpers ----------
+
+def _as_bool(s):
+    return str(s).strip().lower() in ("true","1","yes","y")
+
+
+def _safe(ws, name):
+    return os.path.join(ws, arcpy.ValidateTableName(name, ws) if ws.lower().endswith(".gdb") else name)
+
+
+def _tmp_fc(name_stub, memory_ok=True):
+    nm = f"tmp_{name_stub}"
+    if memory_ok:
+        return os.path.join("in_memory", nm)
+    return _safe(arcpy.env.scratchGDB, nm)
+
+
+def _f(v, dflt=None):
+    if v is None or v == "":
+        return dflt
+    try:
+        return float(v)
+    except Exception:
+        return dflt
+
+
+_NODATA = -9999.0
+
+
+def _dem_grid(dem):
+    ext = dem.extent
+    return be.Grid(ext.XMin, ext.YMax, dem.meanCellWidth, dem.meanCellHeight, dem.width, dem.height)
+
+
+def _read_window(ras, grid, win):
+    # DEM (or any snapped raster) window → float64 array with NaN for NoData
+    x0, y0, _, _ = grid.extent(win)
+    arr = arcpy.RasterToNumPyArray(ras, arcpy.Point(x0, y0), win.ncols, win.nrows, nodata_to_value=_NODATA)
+    arr = arr.astype("float64")
+    arr[arr == _NODATA] = np.nan
+    return arr
+
+
+def _window_raster(arr, grid, win):
+    x0, y0, _, _ = grid.extent(win)
+    out = np.where(np.isnan(arr), _NODATA, arr).astype("float32")
+    return arcpy.NumPyArrayToRaster(out, arcpy.Point(x0, y0), grid.cellx, grid.celly, _NODATA)
+
+
+def _geom_parts(geom):
+    return [np.array([(p.X, p.Y) for p in part if p is not None], dtype="float64") for part in geom]
+
+
+def _dem_fingerprint(dem_path, dem, grid, read):
+    # Catalog path + grid + the raster's statistics + a hash of a 3 × 3 lattice of sampled
+    # blocks (read through `read`, the DEM tile cache). Nothing here depends on the folder
+    # or GDB around the raster, so writing outputs next to it doesn't change the key.
+    e = dem.extent
+    stats = []
+    for prop in ("MINIMUM", "MAXIMUM", "MEAN", "STD"):
+        try:
+            stats.append(arcpy.GetRasterProperties_management(dem, prop).getOutput(0))
+        except Exception:
+            stats.append("")            # no statistics on the raster: the samples still count
+    h = hashlib.sha1()
+    n = _FINGERPRINT_BLOCK
+    for fr in (0.25, 0.5, 0.75):
+        for fc in (0.25, 0.5, 0.75):
+            r0 = max(0, min(int(grid.nrows * fr) - n // 2, grid.nrows - n))
+            c0 = max(0, min(int(grid.ncols * fc) - n // 2, grid.ncols - n))
+            blk = read(be.Window(r0, c0, min(n, grid.nrows), min(n, grid.ncols)))
+            h.update(np.nan_to_num(blk, nan=_NODATA).astype("<f8").tobytes())
+    return (f"{os.path.abspath(dem_path)}|{e.XMin},{e.YMin},{e.XMax},{e.YMax}|{dem.meanCellWidth},"
+            f"{dem.meanCellHeight}|{dem.width}x{dem.height}|{','.join(stats)}|{h.hexdigest()}")
+
+
+def _set_pool_executable():
+    # Inside ArcGIS Pro sys.executable is ArcGISPro.exe; workers must start the env's python
+    if not os.path.basename(sys.executable).lower().startswith("python"):
+        import multiprocessing
+        exe = os.path.join(sys.exec_prefix, "pythonw.exe" if os.name == "nt" else "python")
+        multiprocessing.set_executable(exe)
+
+
+def _write_footprints(fp_rows, fp_fc, sr, datum):
+    # All traced footprints into fp_fc with a single InsertCursor; rings are already in
+    # Esri order (outer clockwise, holes counter-clockwise)
+    with arcpy.da.InsertCursor(fp_fc, ["SHAPE@", "CentrelineID", "Area_ha", "VertDatum"]) as ic:
+        for rings, cid, area_ha in fp_rows:
+            arr = arcpy.Array([arcpy.Array([arcpy.Point(x, y) for x, y in r]) for r in rings])
+            ic.insertRow([arcpy.Polygon(arr, sr), cid, area_ha, datum])
+
+
+def _write_multipatch(meshes, mp_fc, sr, datum, obj_dir):
+    # One closed solid per (CentrelineID, Mesh) → OBJ in scratch → Import3DFiles → one bulk
+    # InsertCursor into mp_fc (created on first use, like before)
+    if not arcpy.Exists(mp_fc):
+        arcpy.management.CreateFeatureclass(os.path.dirname(mp_fc), os.path.basename(mp_fc), "MULTIPATCH", spatial_reference=sr)
+    names = [f.name for f in arcpy.ListFields(mp_fc)]
+    for fn, ft, ln in [("CentrelineID", "TEXT", 256), ("Volume_m3", "DOUBLE", None), ("VertDatum", "TEXT", 32)]:
+        if fn not in names:
+            if ft == "TEXT":
+                arcpy.management.AddField(mp_fc, fn, ft, field_length=ln)
+            else:
+                arcpy.management.AddField(mp_fc, fn, ft)
+    shutil.rmtree(obj_dir, ignore_errors=True)
+    os.makedirs(obj_dir, exist_ok=True)
+    rows = []
+    for i, (cid, m) in enumerate(meshes):
+        obj = os.path.join(obj_dir, f"solid_{i}.obj")
+        bm.write_obj(obj, [(cid, m)])
+        tmp = _tmp_fc(f"mp_{i}", memory_ok=False)
+        if arcpy.Exists(tmp):
+            arcpy.management.Delete(tmp)
+        arcpy.ddd.Import3DFiles(obj, tmp, "ONE_FILE_ONE_FEATURE", sr, "Z_IS_UP", "*.obj")
+        with arcpy.da.SearchCursor(tmp, ["SHAPE@"]) as cur:
+            for (shp,) in cur:
+                rows.append([shp, cid, bm.mesh_volume(m), datum])
+        arcpy.management.Delete(tmp)
+    with arcpy.da.InsertCursor(mp_fc, ["SHAPE@", "CentrelineID", "Volume_m3", "VertDatum"]) as ic:
+        for r in rows:
+            ic.insertRow(r)
+    shutil.rmtree(obj_dir, ignore_errors=True)
+    return len(rows)
+
+
+def _tile_sink(grid, tile_dir, keep):
+    # Finished composite tiles → small scratch TIFFs, mosaicked into the outputs at the end
+    written = {}
+    shutil.rmtree(tile_dir, ignore_errors=True)
+    os.makedirs(tile_dir, exist_ok=True)
+
+    def sink(layer, tw, arr):
+        if layer not in keep:
+            return
+        path = os.path.join(tile_dir, f"{layer}_{tw.row0}_{tw.col0}.tif")
+        _window_raster(arr, grid, tw).save(path)
+        written.setdefault(layer, []).append(path)
+    return sink, written
+
+
+def _cog_sink(grid, paths, sr):
+    # Finished composite tiles → one streaming COG writer per layer; blocks no bund touched
+    # stay sparse (the surface's are filled from the DEM on close)
+    code = sr.factoryCode or 0
+    writers = {}
+    for layer, path in paths.items():
+        if arcpy.Exists(path):
+            arcpy.management.Delete(path)
+        writers[layer] = CogWriter(path, grid, block=COG_BLOCK, nodata=_NODATA, epsg=code,
+                                   geographic=(sr.type == "Geographic"), wkt=None if code else sr.exportToString())
+
+    def sink(layer, tw, arr):
+        w = writers.get(layer)
+        if w is not None:
+            w.write(tw, arr)
+    return sink, writers
+
+
+def _mosaic(inputs, out_path, dem):
+    out_ws, name = os.path.split(out_path)
+    if arcpy.Exists(out_path):
+        arcpy.management.Delete(out_path)
+    with arcpy.EnvManager(mask=None, extent=dem.extent, snapRaster=dem, cellSize=dem):
+        arcpy.management.MosaicToNewRaster(";".join(inputs), out_ws, name, dem.spatialReference,
+                                           "32_BIT_FLOAT", dem.meanCellWidth, 1, "LAST", "FIRST")
+
+
+def _check_mode(in_lines, design_mode, height_field, start_h, end_h, hag_field, hag_value):
+    if design_mode == "Use Field":
+        f = [f for f in arcpy.ListFields(in_lines) if f.name == height_field]
+        if not f:
+            raise arcpy.ExecuteError(f"Design height field '{height_field}' not on {in_lines}.")
+        if f[0].type not in ("Double", "Single", "Integer", "SmallInteger"):
+            raise arcpy.ExecuteError(f"Design height field '{height_field}' must be numeric (found {f[0].type}).")
+    elif design_mode == "Use Start/End":
+        if start_h is None or end_h is None:
+            raise arcpy.ExecuteError("Start and End crest heights are required for 'Use Start/End' mode.")
+    elif design_mode == "Use HAG Field":
+        f = [f for f in arcpy.ListFields(in_lines) if f.name == hag_field]
+        if not f:
+            raise arcpy.ExecuteError(f"HAG field '{hag_field}' not on {in_lines}.")
+        if f[0].type not in ("Double", "Single", "Integer", "SmallInteger"):
+            raise arcpy.ExecuteError(f"HAG field '{hag_field}' must be numeric (found {f[0].type}).")
+    elif design_mode == "Use HAG Value":
+        if hag_value is None:
+            raise arcpy.ExecuteError("Height Above Ground Value is required for 'Use HAG Value' mode.")
+    else:
+        raise arcpy.ExecuteError(f"Unknown design_mode: {design_mode}")
+
+
+def _cursor_fields(lines, id_field, design_mode, height_field, hag_field):
+    oid = arcpy.Describe(lines).OIDFieldName
+    flds = [oid, id_field, "SHAPE@", "SHAPE@LENGTH"]
+    if design_mode == "Use Field":
+        flds.insert(2, height_field)
+    if design_mode == "Use HAG Field":
+        flds.insert(2, hag_field)
+    return flds
+
+
+def _parse_row(row, design_mode, warn=True):
+    # → (oid, id, geom, length, mode, crest-or-HAG value) or None when the row is skipped
+    if design_mode == "Use Field":
+        oidv, cid, crest_val, geom, L = row
+        if crest_val is None:
+            if warn:
+                arcpy.AddWarning(f"OID {oidv}: NULL design height; skipped.")
+            return None
+        return oidv, cid, geom, L, "CONST_ABS", float(crest_val)
+    if design_mode == "Use HAG Field":
+        oidv, cid, hag_val, geom, L = row
+        if hag_val is None:
+            if warn:
+                arcpy.AddWarning(f"OID {oidv}: NULL HAG; skipped.")
+            return None
+        return oidv, cid, geom, L, "HAG_FIELD", float(hag_val)
+    oidv, cid, geom, L = row
+    return oidv, cid, geom, L, ("GRADIENT" if design_mode == "Use Start/End" else "HAG_VALUE"), None
+
+
+def _carry_field(design_mode, height_field, hag_field):
+    # Per-feature value field Merge by ID keeps the MAX of
+    return height_field if design_mode == "Use Field" else (hag_field if design_mode == "Use HAG Field" else None)
+
+
+def _read_centrelines(in_lines, id_field, design_mode, height_field, hag_field, merge_by_id):
+    # Cursor rows (_cursor_fields layout) of every centreline in one pass. merge_by_id
+    # dissolves them in memory (bund_index.merge_by_id: Dissolve SINGLE_PART + MAX rules)
+    # into new single-part polylines numbered 1, 2, …
+    flds = _cursor_fields(in_lines, id_field, design_mode, height_field, hag_field)
+    with arcpy.da.SearchCursor(in_lines, flds) as cur:
+        rows = list(cur)
+    if not merge_by_id:
+        return rows
+    sr = arcpy.Describe(in_lines).spatialReference
+    carry = len(flds) == 5
+    feats = [{"cid": r[1], "parts": _geom_parts(r[-2]), "val": r[2] if carry else None}
+             for r in rows if r[-2] is not None]
+    rows = []
+    for f in bix.merge_by_id(feats, carry=("val",)):
+        geom = arcpy.Polyline(arcpy.Array([arcpy.Point(x, y) for x, y in f["parts"][0]]), sr)
+        rows.append((f["oid"], f["cid"]) + ((f["val"],) if carry else ()) + (geom, geom.length))
+    return rows
+
+
+_FIELD_TYPES = {"String": "TEXT", "Integer": "LONG", "SmallInteger": "SHORT", "Double": "DOUBLE",
+                "Single": "FLOAT", "Date": "DATE"}
+
+
+def _save_centrelines(rows, out_fc, in_lines, id_field, carry_field):
+    # Merged centreline rows → out_fc (ID + carried MAX value) in one InsertCursor
+    if arcpy.Exists(out_fc):
+        arcpy.management.Delete(out_fc)
+    sr = arcpy.Describe(in_lines).spatialReference
+    arcpy.management.CreateFeatureclass(os.path.dirname(out_fc), os.path.basename(out_fc), "POLYLINE",
+                                        spatial_reference=sr)
+    f = arcpy.ListFields(in_lines, id_field)[0]
+    arcpy.management.AddField(out_fc, id_field, _FIELD_TYPES.get(f.type, "TEXT"), field_length=f.length)
+    flds = ["SHAPE@", id_field]
+    if carry_field:
+        arcpy.management.AddField(out_fc, carry_field, "DOUBLE")
+        flds.append(carry_field)
+    with arcpy.da.InsertCursor(out_fc, flds) as ic:
+        for r in rows:
+            ic.insertRow([r[-2], r[1]] + ([r[2]] if carry_field else []))
+
+
+# BundVolumes table / CSV columns (one row per feature + the __TOTAL__ row)
+_VOLUMES_SCHEMA = [
+    ("SourceOID", "LONG", None),
+    ("CentrelineID", "TEXT", 64),
+    ("Length_m", "DOUBLE", None),
+    ("Mode", "TEXT", 16),
+    ("HAG_m", "DOUBLE", None),
+    ("CrestField_m", "DOUBLE", None),
+    ("StartH_m", "DOUBLE", None),
+    ("EndH_m", "DOUBLE", None),
+    ("CrestWidth_m", "DOUBLE", None),
+    ("Batter_HperV", "DOUBLE", None),
+    ("EndTaper_m", "DOUBLE", None),
+    ("MaintainCrest", "TEXT", 8),
+    ("StripDepth_m", "DOUBLE", None),
+    ("FillArea_m2", "DOUBLE", None),
+    ("FillVolume_m3", "DOUBLE", None),
+    ("StripVolume_m3", "DOUBLE", None),
+    ("VertDatum", "TEXT", 32),
+]
+
+# Sweep / solver tables (one row per feature per scenario / per feature + __TOTAL__)
+_SWEEP_SCHEMA = [
+    ("ScenarioID", "LONG", None),
+    ("SourceOID", "LONG", None),
+    ("CentrelineID", "TEXT", 64),
+    ("Mode", "TEXT", 16),
+    ("CrestField_m", "DOUBLE", None),
+    ("StartH_m", "DOUBLE", None),
+    ("EndH_m", "DOUBLE", None),
+    ("HAG_m", "DOUBLE", None),
+    ("CrestWidth_m", "DOUBLE", None),
+    ("Batter_HperV", "DOUBLE", None),
+    ("EndTaper_m", "DOUBLE", None),
+    ("FillArea_m2", "DOUBLE", None),
+    ("FillVolume_m3", "DOUBLE", None),
+    ("StripVolume_m3", "DOUBLE", None),
+]
+_SOLVE_SCHEMA = [
+    ("SourceOID", "LONG", None),
+    ("CentrelineID", "TEXT", 64),
+    ("Mode", "TEXT", 16),
+    ("LevelField", "TEXT", 16),
+    ("Level_m", "DOUBLE", None),
+    ("EndH_m", "DOUBLE", None),
+    ("Offset_m", "DOUBLE", None),
+    ("FillVolume_m3", "DOUBLE", None),
+    ("Target_m3", "DOUBLE", None),
+    ("Error_m3", "DOUBLE", None),
+    ("Tolerance_m3", "DOUBLE", None),
+    ("Iterations", "LONG", None),
+    ("Converged", "TEXT", 8),
+]
+
+
+def _volumes_row(params, oidv, cid, L, mode, val):
+    # SourceOID … StripDepth_m of a BundVolumes row (the design job appends FillArea_m2 …
+    # VertDatum); val is the feature's crest RL or HAG from _parse_row
+    design_mode, start_h, end_h, hag_value = params[2], params[4], params[5], params[7]
+    crest_w, keep_crest, batter, taper = params[9:13]
+    strip = params[15]
+    return [
+        int(oidv), str(cid), (float(L) if L is not None else None), design_mode,
+        (float(val) if mode == "HAG_FIELD" else (float(hag_value) if mode == "HAG_VALUE" else None)),
+        (float(val) if mode == "CONST_ABS" else None),
+        (float(start_h) if design_mode == "Use Start/End" else None),
+        (float(end_h) if design_mode == "Use Start/End" else None),
+        float(crest_w), float(batter), float(taper),
+        ("True" if keep_crest else "False"), float(strip if strip else 0.0),
+    ]
+
+
+def _volumes_total(params, area_m2, fill_m3, strip_m3):
+    # The __TOTAL__ row (SourceOID = -1): run-wide design values + merged totals
+    mode = "HAG_VALUE" if params[2] == "Use HAG Value" else None
+    return _volumes_row(params, -1, "__TOTAL__", None, mode, None) + [area_m2, fill_m3, strip_m3, params[13]]
+
+
+def _wanted(cid):
+    # REFINE_IDS filter on the centreline ID (every ID when empty)
+    return not REFINE_IDS or str(cid) in {str(i) for i in REFINE_IDS}
+
+
+# ---------- core engine ----------
+
+def run_engine(params):
+    (
+        in_lines, id_field, design_mode,
+        height_field, start_h, end_h,
+        hag_field, hag_value,
+        dem_path,
+        crest_w, keep_crest, batter, taper,
+        datum, name_suffix, strip,
+        out_ws,
+        want_merged_surf, want_perfeat_surf, want_fill_ras,
+        want_mpatch, want_footprint, want_csv,
+        merge_by_id, extra_buf
+    ) = params
+
+    arcpy.AddMessage("### BundDesigner v5.2e (engine) START ###")
+    prof = Profiler(PROFILE)
+    t_run, c_run = time.perf_counter(), time.process_time()
+
+    # Licenses
+    if arcpy.CheckExtension("Spatial") != "Available":
+        raise arcpy.ExecuteError("Spatial Analyst license not available.")
+    have_3d = (arcpy.CheckExtension("3D") == "Available")
+    if want_mpatch and not have_3d:
+        arcpy.AddWarning("3D Analyst not available — skipping multipatch output.")
+        want_mpatch = False
+
+    # Existence
+    if not arcpy.Exists(in_lines):
+        raise arcpy.ExecuteError(f"Missing centrelines: {in_lines}")
+    if not arcpy.Exists(dem_path):
+        raise arcpy.ExecuteError(f"Missing DEM: {dem_path}")
+    if not arcpy.Exists(out_ws):
+        raise arcpy.ExecuteError(f"Missing output workspace: {out_ws}")
+
+    # Mode checks
+    _check_mode(in_lines, design_mode, height_field, start_h, end_h, hag_field, hag_value)
+
+    # Env
+    arcpy.CheckOutExtension("Spatial")
+    dem = Raster(dem_path)
+    env.snapRaster = dem
+    env.cellSize = dem
+    env.extent = dem.extent
+    env.mask = None
+    grid = _dem_grid(dem)
+    cell = float(arcpy.GetRasterProperties_management(dem, "CELLSIZEX").getOutput(0))
+
+    # One DEM tile cache for every stage that samples the ground
+    dem_dir = os.path.join(arcpy.env.scratchFolder, "bund_dem")
+    shutil.rmtree(dem_dir, ignore_errors=True)
+    dem_cache = DemTileCache(grid, lambda w: _read_window(dem, grid, w), tile=DEM_TILE,
+                             budget_mb=DEM_CACHE_MB, spill_dir=dem_dir)
+
+    # Per-feature result cache for incremental re-runs
+    feat_cache = None
+    cache_root = os.path.dirname(out_ws) if out_ws.lower().endswith(".gdb") else out_ws
+    if FEATURE_CACHE_MB and FEATURE_CACHE_MB > 0:
+        try:
+            feat_cache = FeatureCache(os.path.join(cache_root, "BundDesigner_cache"), FEATURE_CACHE_MB)
+            if FEATURE_CACHE_INVALIDATE:
+                feat_cache.invalidate()
+                arcpy.AddMessage("Feature cache invalidated.")
+        except Exception as ex:
+            arcpy.AddWarning(f"Feature cache disabled: {ex}")
+            feat_cache = None
+    dem_fp = _dem_fingerprint(dem_path, dem, grid, dem_cache.read)
+    miss_keys = {}     # (OID, chunk) → cache key of pieces computed this run
+
+    # Preview: the whole pipeline runs on a coarse level of a DEM pyramid kept on disk per DEM
+    # fingerprint; two coarser passes give a full-resolution volume estimate ± band. Raster,
+    # multipatch, section and storage outputs are full-resolution products and are skipped.
+    level = 1
+    if PREVIEW_FACTOR and PREVIEW_FACTOR > 1:
+        level = int(PREVIEW_FACTOR)
+        pyr_dir = os.path.join(cache_root, "BundDesigner_pyramid", hashlib.sha1(dem_fp.encode("utf-8")).hexdigest()[:16])
+        if FEATURE_CACHE_INVALIDATE:
+            shutil.rmtree(os.path.dirname(pyr_dir), ignore_errors=True)
+        pyramid = DemPyramid(dem_cache, pyr_dir)
+        grid, dem_cache = pyramid.grid(level), pyramid.level(level)
+        cell = grid.cellx
+        want_merged_surf = want_fill_ras = want_mpatch = False
+        arcpy.AddMessage(f"PREVIEW at {level}× ({cell:g} m cells): volumes (+ estimate ± band) and footprints only.")
+
+    # Names
+    base = os.path.splitext(os.path.basename(in_lines))[0]
+    suffix = f"_{datum}" if (name_suffix and datum) else ""
+    tag = "Preview" if level > 1 else ""
+    if RASTER_COG:
+        surf_path = os.path.join(cache_root, f"{base}_BundSurface{suffix}.tif")
+        fill_path = os.path.join(cache_root, f"{base}_BundFill{suffix}.tif")
+    else:
+        surf_path = _safe(out_ws, f"{base}_BundSurface{suffix}")
+        fill_path = _safe(out_ws, f"{base}_BundFill{suffix}")
+    fp_fc = _safe(out_ws, f"{base}_BundFootprint{tag}{suffix}")
+    mp_fc = _safe(out_ws, f"{base}_BundMultipatch{suffix}")
+    merged_id_fc = _safe(out_ws, f"{base}_Centrelines_MergedByID")
+    vol_csv = _side_csv(in_lines, out_ws, datum, name_suffix, f"BundVolumes{tag}")
+    is_gdb = out_ws.lower().endswith(".gdb")
+    per_dir = out_ws if is_gdb else os.path.join(out_ws, "per_feature")
+    if prof.enabled:
+        prof_csv = _side_csv(in_lines, out_ws, datum, name_suffix, "BundProfile")
+        prof.trace_path = os.path.splitext(prof_csv)[0] + ".jsonl"
+
+    # Containers
+    if want_footprint:
+        if arcpy.Exists(fp_fc):
+            arcpy.management.Delete(fp_fc)
+        arcpy.management.CreateFeatureclass(out_ws, os.path.basename(fp_fc), "POLYGON", spatial_reference=arcpy.Describe(in_lines).spatialReference)
+        for fn, ft, ln in [("CentrelineID", "TEXT", 256), ("Area_ha", "DOUBLE", None), ("VertDatum", "TEXT", 32)]:
+            arcpy.management.AddField(fp_fc, fn, ft, field_length=ln)
+
+    # Centrelines, read once; Merge by ID dissolves them in memory — and persists a copy
+    if merge_by_id:
+        arcpy.AddMessage(f"Merging overlaps by ID '{id_field}'…")
+    with prof.stage("merge_by_id" if merge_by_id else "read_centrelines"):
+        rows = _read_centrelines(in_lines, id_field, design_mode, height_field, hag_field, merge_by_id)
+    if merge_by_id:
+        try:
+            # persist to output gdb with stable name
+            _save_centrelines(rows, merged_id_fc, in_lines, id_field,
+                              _carry_field(design_mode, height_field, hag_field))
+            arcpy.AddMessage(f"Saved merged centrelines → {merged_id_fc}")
+        except Exception as ex:
+            arcpy.AddWarning(f"Could not save Centrelines_MergedByID: {ex}")
+    feats = []         # (_parse_row tuple, parts) of every feature to design
+    for row in rows:
+        p = _parse_row(row, design_mode)
+        if p is not None and _wanted(p[1]):
+            feats.append((p, _geom_parts(p[2])))
+    del rows
+    # Per-feature volume rows, journaled next to the CSV as each feature finishes
+    vol_schema = list(_VOLUMES_SCHEMA)
+    if level > 1:
+        vol_schema += [("Cell_m", "DOUBLE", None), ("FillVolumeEst_m3", "DOUBLE", None),
+                       ("FillVolumeErr_m3", "DOUBLE", None)]
+    # IDs and the datum label must fit the table's text fields (never truncated); if not,
+    # the table is skipped like a failed table write and the rows are only kept in memory
+    probe = [[None, str(p[1])] + [None] * (len(_VOLUMES_SCHEMA) - 3) + [datum] for p, _ in feats]
+    if want_csv:
+        try:
+            br.records(vol_schema, probe)
+        except ValueError as ex:
+            arcpy.AddWarning(f"{ex} Volumes table / CSV skipped.")
+            want_csv = False
+    vols = _results_store(vol_schema, vol_csv) if want_csv else br.ResultStore(br.fit_text(vol_schema, probe))
+    id_index = {}      # CentrelineID → label in the fill composite (1-based, in OID order)
+    for p, _ in feats:
+        id_index.setdefault(str(p[1]), len(id_index) + 1)
+    designed = set()   # CentrelineIDs with at least one designed feature
+    solids = bm.SolidSet()
+    fp_rows = []       # (OID, rings, CentrelineID, Area_ha) per feature
+    feat_chunks = {}   # OID → (parts, chunk plan) while its pieces are in flight
+    feat_acc = {}      # OID → running row / footprint edges / section areas over its pieces
+    stor_lines = {}    # CentrelineID → (OID, centreline parts) of its features (storage seeds)
+
+    # Tiled max-composite of the merged products; a cheap first pass over the extents
+    # plans which tiles each feature touches so finished tiles can be written and dropped
+    layers = (["surface"] if want_merged_surf else []) + (["fill"] if (want_merged_surf or want_fill_ras or want_csv) else [])
+    tile_dir = os.path.join(arcpy.env.scratchFolder, "bund_tiles")
+    keep = [ly for ly in layers if ly == "surface" or want_merged_surf or want_fill_ras]
+    cogs = {}
+    if RASTER_COG:
+        if TILE_SIZE % COG_BLOCK:
+            raise arcpy.ExecuteError(f"COG_BLOCK ({COG_BLOCK}) must divide TILE_SIZE ({TILE_SIZE}).")
+        sink, cogs = _cog_sink(grid, {ly: surf_path if ly == "surface" else fill_path for ly in keep},
+                               dem.spatialReference)
+        tile_paths = {}
+    else:
+        sink, tile_paths = _tile_sink(grid, tile_dir, keep)
+    comp = TileCompositor(
+        grid, layers, tile=TILE_SIZE, on_tile=sink, label_layer="fill" if "fill" in layers else None,
+        backfill={"surface": dem_cache.read},
+    )
+    reach = be.feature_reach(crest_w, batter, taper, extra_buf)
+    with prof.stage("plan"):
+        for _, parts in feats:
+            for _, _, core in be.chunk_plan(grid, parts, reach, CHUNK_CELLS):
+                comp.plan(core)
+
+    # Spatial index over the centreline segments: features whose reach zones touch are batched
+    # onto one shared DEM window (one read, one job); lines long enough to chunk run alone
+    with prof.stage("cluster", vertices=sum(len(pt) for _, parts in feats for pt in parts)):
+        if CLUSTER_CELLS and CLUSTER_CELLS > 0:
+            groups = bix.batches([parts for _, parts in feats], reach, grid,
+                                 min(CLUSTER_CELLS, CHUNK_CELLS) if CHUNK_CELLS else CLUSTER_CELLS)
+        else:
+            groups = [[i] for i in range(len(feats))]
+    if len(groups) < len(feats):
+        arcpy.AddMessage(f"{len(feats)} feature(s) in {len(groups)} job(s) "
+                         f"({sum(len(g) > 1 for g in groups)} cluster(s) on shared DEM windows).")
+
+    # Per-feature jobs: the arcpy side (DEM window read, crest surface) runs here; the NumPy
+    # design/fill work runs in bund_engine.run_feature / run_cluster, optionally in a pool.
+    # g / dc / lvl: grid, DEM cache and pyramid level to run on (the preview error pass runs
+    # a second, coarser level quietly)
+    def _feature_jobs(feat, g, dc, lvl, margin, say, quiet):
+        # Cached results and DEM-less run_feature jobs (one per chunk) of one feature
+        cell = g.cellx
+        (oidv, cid, geom, L, mode, val), parts = feat
+        crest_const = val if mode == "CONST_ABS" else None
+        hag_local = val if mode == "HAG_FIELD" else None
+
+        chunks = [c for c in be.chunk_plan(g, parts, reach, CHUNK_CELLS) if c[2].nrows and c[2].ncols]
+        if not chunks:
+            if not quiet:
+                arcpy.AddWarning(f"OID {oidv}: centreline lies outside the DEM; skipped.")
+            return
+        nch = len(chunks)
+        if nch > 1:
+            say(f"— Feature OID {oidv} (ID={cid}) — {L / 1000.0:.1f} km, {nch} chunks")
+        if not quiet:
+            feat_chunks[int(oidv)] = (parts, chunks)
+
+        # Crest elevation per mode: constant, or a 1-D chainage profile over the whole line
+        # that the engine evaluates at each cell's nearest point on it (linear gradient, or
+        # DEM sampled every 2 cells + HAG), so chunks stay continuous
+        crest_z = None
+        for k, (ch0, ch1, core) in enumerate(chunks):
+            # Unchanged geometry + parameters + DEM → reuse the stored result
+            key = None
+            if feat_cache is not None:
+                kp = {
+                    "oid": int(oidv), "cid": str(cid), "L": float(L), "mode": design_mode,
+                    "crest": crest_const if mode == "CONST_ABS" else None,
+                    "hag": hag_local if mode == "HAG_FIELD" else (hag_value if mode == "HAG_VALUE" else None),
+                    "start_h": start_h, "end_h": end_h, "crest_w": crest_w, "batter": batter,
+                    "taper": taper, "keep_crest": bool(keep_crest), "extra_buf": extra_buf,
+                    "strip": strip, "datum": datum, "smooth": [SMOOTH_CREST_METERS, SMOOTH_DESIGN_METERS, SMOOTH_KERNEL],
+                }
+                if nch > 1:
+                    kp["chunk"] = [k, nch, CHUNK_CELLS]
+                if lvl > 1:
+                    kp["level"] = lvl
+                key = feature_key(geom.WKB, kp, dem_fp)
+                with prof.stage("cache_lookup", oidv):
+                    hit = feat_cache.get(key)
+                if hit is not None:
+                    if k == 0:
+                        say(f"— Feature OID {oidv} (ID={cid}) — unchanged, from cache")
+                    yield hit
+                    continue
+
+            if nch == 1:
+                say(f"— Feature OID {oidv} (ID={cid})")
+            if key is not None:
+                miss_keys[(int(oidv), k)] = key
+
+            # DEM window: the chunk core (the centreline's buffered envelope when unchunked),
+            # plus the smoothing margin for chunks; _jobs reads it
+            win = be.pad_window(g, core, margin) if nch > 1 else core
+
+            if crest_z is None:
+                with prof.stage("crest_profile", oidv, vertices=sum(len(pt) for pt in parts)):
+                    if mode == "CONST_ABS":
+                        crest_z = crest_const
+                    elif mode == "GRADIENT":
+                        crest_z = be.gradient_profile(parts, start_h, end_h)
+                    else:
+                        hag = hag_local if mode == "HAG_FIELD" else float(hag_value)
+                        crest_z = be.hag_profile(parts, max(cell, 2 * cell), dc.sample, hag)
+
+            # NumPy design/fill job for this feature (or chunk)
+            job = {
+                "oid": int(oidv), "cid": str(cid), "window": win, "parts": parts, "crest_z": crest_z,
+                "crest_w": crest_w, "batter": batter, "taper": taper, "keep_crest": keep_crest,
+                "reach": reach, "cell": cell, "cell_area": g.cell_area, "strip": strip,
+                "smooth_crest": SMOOTH_CREST_METERS, "smooth_design": SMOOTH_DESIGN_METERS,
+                "smooth_kernel": SMOOTH_KERNEL, "datum": datum,
+                "row": _volumes_row(params, oidv, cid, L, mode, val),
+            }
+            if nch > 1:
+                job.update(core=core, earlier=[c for _, _, c in chunks[:k]], piece=(k, nch))
+            yield job
+
+    def _jobs(g, dc, lvl, quiet=False):
+        say = (lambda m: None) if quiet else arcpy.AddMessage
+        margin = be.smooth_margin(SMOOTH_CREST_METERS, SMOOTH_DESIGN_METERS, g.cellx, SMOOTH_KERNEL)
+
+        def _read(job):
+            win = job["window"]
+            with prof.stage("dem_read", job["oid"], cells=win.nrows * win.ncols):
+                job["dem"] = dc.read(win)
+            job["xs"], job["ys"] = g.centres(win)
+            return job
+
+        # A batch's cache misses share one DEM read over the union of their windows
+        for grp in groups:
+            pend = []
+            for i in grp:
+                for job in _feature_jobs(feats[i], g, dc, lvl, margin, say, quiet):
+                    if isinstance(job, be.FeatureResult) or len(grp) == 1:
+                        yield job if isinstance(job, be.FeatureResult) else _read(job)
+                    else:
+                        pend.append(job)
+            if len(pend) == 1:
+                yield _read(pend[0])
+            elif pend:
+                win = be.union_window([j["window"] for j in pend])
+                say(f"  (OIDs {', '.join(str(j['oid']) for j in pend)} share one {win.nrows} × {win.ncols} DEM window)")
+                yield _read({"oid": pend[0]["oid"], "window": win, "members": pend})
+
+    # Long/cross-section tables stream to CSV feature by feature
+    sec_w, sec_chk = None, []
+    if SECTION_SPACING_M and SECTION_SPACING_M > 0 and level == 1:
+        fmt = {"SourceOID": "%d", "CentrelineID": "%s", "Station": "%d"}
+        sec_w = (
+            bsec.ColumnCsv(_side_csv(in_lines, out_ws, datum, name_suffix, "BundLongSection"),
+                           ["SourceOID", "CentrelineID", "Station", "Chainage", "X", "Y", "Ground", "Design",
+                            "Fill", "EndArea_m2"], fmt),
+            bsec.ColumnCsv(_side_csv(in_lines, out_ws, datum, name_suffix, "BundCrossSections"),
+                           ["SourceOID", "CentrelineID", "Station", "Chainage", "Offset", "X", "Y", "Ground",
+                            "Design", "Fill"], fmt),
+        )
+
+    def _cache_put(res):
+        k = res.piece[0] if res.piece else 0
+        if (res.oid, k) in miss_keys:
+            try:
+                feat_cache.put(miss_keys.pop((res.oid, k)), res)
+            except Exception as ex:
+                arcpy.AddWarning(f"OID {res.oid}: could not cache result: {ex}")
+
+    # Results arrive in job order: clusters (bix.batches, ordered by first member) finish
+    # together, so features can come out of OID order, in serial and pooled runs alike.
+    # Everything order-sensitive is put back in OID order: volume rows, footprints, the
+    # section check, storage ponds and solids are sorted before writing, composite labels
+    # are assigned in OID order up front and ties in the max-composite go to the lower
+    # label. Only the streamed long / cross-section CSVs keep arrival order (every row
+    # carries its SourceOID).
+    if WORKERS and WORKERS > 1:
+        _set_pool_executable()
+        arcpy.AddMessage(f"Running per-feature design on {WORKERS} worker processes…")
+    for res in be.map_features(_jobs(grid, dem_cache, level), WORKERS):
+        oidv, cid = res.oid, res.cid
+        k, nch = res.piece or (0, 1)
+        if res.timing is not None:
+            prof.add("design", oidv, res.timing[0], res.timing[1], cells=res.fill.size)
+        _cache_put(res)
+
+        # Pieces of a chunked feature arrive in order; per-feature products are finished on
+        # the last one. Each piece counts only the cells it owns (no earlier core covers them).
+        parts, chunks = feat_chunks[oidv]
+        own = be.owned_mask(res.window, [c for _, _, c in chunks[:k]]) if nch > 1 else None
+        if k == 0:
+            acc = feat_acc[oidv] = {"row": list(res.row), "edges": [], "cells": 0, "ch": [], "area": []}
+        else:
+            acc = feat_acc[oidv]
+            for i in (-4, -3, -2):
+                acc["row"][i] += res.row[i]
+
+        # Footprint edges from the window's fill mask; rings linked on the last piece and all
+        # polygons inserted in one go at the end
+        if want_footprint:
+            with prof.stage("footprint", oidv, cells=res.fill.size):
+                m = bf.footprint_mask(res.fill)
+                if own is not None:
+                    m &= own
+                acc["edges"].append(bf.boundary_edges(m, res.window.row0, res.window.col0))
+                acc["cells"] += int(m.sum())
+
+        # Sections on the piece's own windows (same chainage as the crest profile)
+        if sec_w is not None:
+            with prof.stage("sections", oidv) as st:
+                x0, _, _, y1 = grid.extent(res.window)
+                lg, cr = bsec.sections(parts, dem_cache.read(res.window), res.bund, x0, y1, cell,
+                                       SECTION_SPACING_M, reach,
+                                       chainage=(chunks[k][0], chunks[k][1], k == nch - 1) if nch > 1 else None)
+                sec_w[0].append(dict(lg, SourceOID=oidv, CentrelineID=str(cid)))
+                sec_w[1].append(dict(cr, SourceOID=oidv, CentrelineID=str(cid)))
+                st.cells = cr["X"].size
+            acc["ch"].append(lg["Chainage"])
+            acc["area"].append(lg["EndArea_m2"])
+
+        # Bund cells of this feature for the per-ID multipatch solid
+        if want_mpatch:
+            solids.add(str(cid), res.window, res.bund, res.fill)
+
+        # Merge into the tiled composite (finished tiles stream to scratch); overlapping chunk
+        # cores hold identical values, so the max-merge is unaffected
+        lab = id_index[str(cid)]
+        designed.add(str(cid))
+        with prof.stage("composite_merge", oidv, cells=res.fill.size):
+            comp.add(res.window, {"surface": res.bund, "fill": res.fill}, lab)
+
+        if k < nch - 1:
+            continue
+        del feat_acc[oidv], feat_chunks[oidv]
+
+        # Per-feature volume row (even if A/V are 0, include the line)
+        vols.append(acc["row"])
+        if STORAGE_STEP_M > 0:
+            stor_lines.setdefault(str(cid), []).append((oidv, parts))
+
+        if want_footprint:
+            with prof.stage("footprint_rings", oidv) as st:
+                edges = bf.merge_edges(acc["edges"])
+                rings = bf.map_rings(bf.link_rings(edges), grid.xmin, grid.ymax, cell, FOOTPRINT_SIMPLIFY_CELLS * cell)
+                st.vertices = sum(len(r) for r in rings)
+            if rings:
+                fp_rows.append((oidv, rings, str(cid), acc["cells"] * grid.cell_area / 10000.0))
+
+        if sec_w is not None:
+            aea, ras = bsec.end_area_volume(np.concatenate(acc["ch"]), np.concatenate(acc["area"])), float(acc["row"][-3])
+            sec_chk.append([oidv, str(cid), sum(c.size for c in acc["ch"]), round(aea, 3), round(ras, 3),
+                            (round(100.0 * (aea - ras) / ras, 2) if ras else None)])
+    vols.sort("SourceOID")     # clusters finish out of OID order
+    fp_rows = [r[1:] for r in sorted(fp_rows, key=lambda r: r[0])]
+    sec_chk.sort(key=lambda r: r[0])
+
+    # Preview estimate + error band: the same features two and four times coarser again.
+    # Fill volume varies close to linearly with cell size (toe and crest-keeping quantise
+    # by a cell), so V(f), V(2f) extrapolate to full resolution; the band is how far that
+    # lands from the V(2f), V(4f) extrapolation.
+    if level > 1 and vols.rows:
+        vol = {}
+        with prof.stage("preview_error_pass"):
+            for lv in (2 * level, 4 * level):
+                v = vol[lv] = {}
+                for res in be.map_features(_jobs(pyramid.grid(lv), pyramid.level(lv), lv, quiet=True), WORKERS):
+                    _cache_put(res)
+                    v[res.oid] = v.get(res.oid, 0.0) + res.row[-3]
+
+        def _extrap(f, v1, v2):
+            return v1 - (v2 - v1) * (f - 1) / f
+
+        a = vols.array()
+        v1 = a["FillVolume_m3"]
+        v2, v4 = ([vol[lv].get(o, v) for o, v in zip(a["SourceOID"].tolist(), v1.tolist())]
+                  for lv in (2 * level, 4 * level))
+        est = _extrap(level, v1, np.asarray(v2))
+        err = np.abs(est - _extrap(2 * level, np.asarray(v2), np.asarray(v4)))
+        a["Cell_m"], a["FillVolumeEst_m3"], a["FillVolumeErr_m3"] = cell, np.round(est, 3), np.round(err, 3)
+        arcpy.AddMessage(f"Preview fill volume at {cell:g} m cells: {vols.sum('FillVolume_m3'):.1f} m³; "
+                         f"full-resolution estimate {vols.sum('FillVolumeEst_m3'):.1f} ± "
+                         f"{vols.sum('FillVolumeErr_m3'):.1f} m³ over {vols.rows} feature(s).")
+
+    # Make absolutely sure no stale mask remains before final combine
+    env.mask = None
+    try:
+        arcpy.ClearEnvironment("mask")
+    except Exception:
+        pass
+
+    # Finalize rasters: flush remaining tiles, then mosaic. The surface mosaics the DEM
+    # first and the (already DEM-backfilled) bund tiles over it, so untouched areas are
+    # copied straight from the DEM.
+    with prof.stage("composite_flush"):
+        comp.close()
+    if sec_w is not None:
+        for w in sec_w:
+            w.close()
+        chk_csv = _side_csv(in_lines, out_ws, datum, name_suffix, "BundSectionCheck")
+        _write_csv(chk_csv, ["SourceOID", "CentrelineID", "Stations", "EndAreaVolume_m3", "FillVolume_m3", "Diff_pct"],
+                   sec_chk)
+        aea, ras = sum(r[3] for r in sec_chk), sum(r[4] for r in sec_chk)
+        arcpy.AddMessage(f"Sections: {sec_w[0].rows} stations, {sec_w[1].rows} section points → "
+                         f"{sec_w[0].path}, {sec_w[1].path}")
+        arcpy.AddMessage(f"End-area check: {aea:.1f} m³ vs raster {ras:.1f} m³"
+                         + (f" ({100.0 * (aea - ras) / ras:+.1f} %)" if ras else "") + f" → {chk_csv}")
+    if want_footprint and fp_rows:
+        with prof.stage("footprint_write", vertices=sum(len(r) for rings, _, _ in fp_rows for r in rings)):
+            _write_footprints(fp_rows, fp_fc, arcpy.Describe(in_lines).spatialReference, datum)
+        arcpy.AddMessage(f"Footprints: {len(fp_rows)} polygon(s) → {fp_fc}")
+    arcpy.AddMessage(f"Composite: {comp.written} tile(s) written, peak {comp.peak_tiles} resident.")
+    for ly, path in (("surface", surf_path), ("fill", fill_path)):
+        w = cogs.get(ly)
+        if w is None:
+            continue
+        if not w.blocks:
+            w.abort()
+            continue
+        arcpy.AddMessage(f"Writing merged {ly} → {path}")
+        with prof.stage(f"write_{ly}", cells=grid.nrows * grid.ncols):
+            if ly == "surface":
+                w.fill(dem_cache.read)
+            st = w.close()
+        nb = w.shape[0][0] * w.shape[0][1]
+        arcpy.AddMessage(f"  {w.blocks}/{nb} block(s) stored, {len(w.factors)} overview level(s), "
+                         f"{w.bytes / 1048576.0:.1f} MB; range {st[0]:.3f} – {st[1]:.3f}, mean {st[2]:.3f}")
+    if want_merged_surf and tile_paths.get("surface"):
+        arcpy.AddMessage(f"Writing merged surface → {surf_path}")
+        with prof.stage("write_surface", cells=grid.nrows * grid.ncols):
+            _mosaic([dem_path] + tile_paths["surface"], surf_path, dem)
+        with prof.stage("surface_stats_pyramids"):
+            try:
+                arcpy.management.CalculateStatistics(surf_path)
+                arcpy.management.BuildPyramids(surf_path)
+            except Exception:
+                pass
+
+    if (want_merged_surf or want_fill_ras) and tile_paths.get("fill"):
+        arcpy.AddMessage(f"Writing merged fill → {fill_path}")
+        with prof.stage("write_fill", cells=grid.nrows * grid.ncols):
+            _mosaic(tile_paths["fill"], fill_path, dem)
+        with prof.stage("fill_stats"):
+            try:
+                arcpy.management.CalculateStatistics(fill_path)
+            except Exception:
+                pass
+
+    # Detention storage: one priority-flood per CentrelineID on the merged surface window
+    # around its centrelines, poured at STORAGE_POUR_POINTS or either side of the crest low
+    # point (the side holding more water is upstream); all stages read off that one flood
+    if STORAGE_STEP_M > 0 and stor_lines and level == 1:
+        if not (want_merged_surf and arcpy.Exists(surf_path)):
+            arcpy.AddWarning("Detention storage needs Output Merged Design Surface — skipped.")
+        else:
+            try:
+                surf = Raster(surf_path)
+                id_V = comp.totals(grid.cell_area, len(id_index), strip)[0][1]
+                stor_csv = _side_csv(in_lines, out_ws, datum, name_suffix, "BundStorage")
+                curves = bsec.ColumnCsv(stor_csv, ["CentrelineID", "Stage", "Depth", "Area_m2", "Storage_m3"],
+                                        {"CentrelineID": "%s", "Area_m2": "%.1f", "Storage_m3": "%.1f"})
+                summary = []
+                for cid in sorted(stor_lines, key=id_index.get):
+                    lns = [pt for _, pt in sorted(stor_lines[cid], key=lambda t: t[0])]
+                    with prof.stage("storage", cid) as st:
+                        pts = np.vstack([np.asarray(pt, dtype="float64") for parts in lns for pt in parts])
+                        win = grid.window(pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max(),
+                                          pad=STORAGE_PAD_M + reach)
+                        z = _read_window(surf, grid, win)
+                        x0, _, _, y1 = grid.extent(win)
+                        if cid in STORAGE_POUR_POINTS:
+                            pours = [STORAGE_POUR_POINTS[cid]]
+                        else:
+                            lp = bst.crest_low_point(lns, z, x0, y1, cell, max(taper, 0.0) + reach)
+                            d = reach + cell
+                            pours = [] if lp is None else [(lp[0] + sd * d * lp[3], lp[1] - sd * d * lp[2]) for sd in (1.0, -1.0)]
+                        pond = bst.best_pond(z, bst.seed_cells(z, x0, y1, cell, pours), grid.cell_area, STORAGE_NOISE_M)
+                        st.cells = z.size
+                    if pond is None:
+                        arcpy.AddWarning(f"ID {cid}: no pour point on the surface; storage skipped.")
+                        continue
+                    if pond.cause != "pass":
+                        arcpy.AddWarning(f"ID {cid}: pond reaches the {'search window edge' if pond.cause == 'edge' else 'DEM NoData'} "
+                                         f"at {pond.spill:.2f} m — raise STORAGE_PAD_M for the full curve.")
+                    cv = bst.storage_curve(pond, STORAGE_STEP_M, grid.cell_area)
+                    curves.append(dict(cv, CentrelineID=cid))
+                    vmax, fill = float(cv["Storage_m3"][-1]), float(id_V[id_index[cid]])
+                    summary.append([
+                        cid, round(x0 + (pond.seed[1] + 0.5) * cell, 3), round(y1 - (pond.seed[0] + 0.5) * cell, 3),
+                        round(pond.pit, 3), round(pond.spill, 3), pond.cause, round(float(cv["Area_m2"][-1]), 1),
+                        round(vmax, 1), round(fill, 1), (round(vmax / fill, 3) if fill > 0 else None),
+                    ])
+                curves.close()
+                sum_csv = _side_csv(in_lines, out_ws, datum, name_suffix, "BundStorageSummary")
+                _write_csv(sum_csv, ["CentrelineID", "PitX", "PitY", "PitStage_m", "SpillStage_m", "SpillCause",
+                                     "SpillArea_m2", "MaxStorage_m3", "FillVolume_m3", "StoragePerFill"], summary)
+                arcpy.AddMessage(f"Detention storage: {len(summary)} pond(s), {curves.rows} stage rows → {stor_csv}, {sum_csv}")
+                for r in sorted(summary, key=lambda r: -(r[9] or 0.0)):
+                    arcpy.AddMessage(f"  ID {r[0]}: {r[7]:.1f} m³ to spill at {r[4]:.2f} m ({r[5]})"
+                                     + (f", {r[9]:.2f} m³ per m³ fill" if r[9] is not None else ""))
+            except Exception as ex:
+                arcpy.AddWarning(f"Detention storage failed: {ex}")
+
+    # Multipatch: one closed solid per CentrelineID meshed from the bund/DEM arrays over its
+    # footprint cells only, decimated to ztol (no full-DEM TINs)
+    if want_mpatch and solids.items:
+        try:
+            arcpy.AddMessage(f"Building {len(solids.items)} multipatch solid(s) from the bund/DEM arrays…")
+            ztol = max(0.01, cell * 0.05)
+            meshes = []
+            with prof.stage("mesh_build") as st:
+                for cid, (w, top) in sorted(solids.items.items(), key=lambda kv: id_index[kv[0]]):
+                    x0, _, _, y1 = grid.extent(w)
+                    m = bm.heightfield_solid(top, dem_cache.read(w), x0, y1, cell, ztol)
+                    st.cells += w.nrows * w.ncols
+                    st.vertices += len(m.vertices)
+                    if m.faces.size:
+                        meshes.append((cid, m))
+            with prof.stage("multipatch_write", vertices=sum(len(m.vertices) for _, m in meshes)):
+                n = _write_multipatch(meshes, mp_fc, arcpy.Describe(in_lines).spatialReference, datum,
+                                      os.path.join(arcpy.env.scratchFolder, "bund_mesh"))
+            arcpy.AddMessage(f"Multipatch: {n} solid(s), {sum(len(m.faces) for _, m in meshes)} triangles → {mp_fc}")
+
+            # Optional OBJ / glTF copies for visualisation (coordinates relative to the DEM origin)
+            origin = (float(np.floor(grid.xmin)), float(np.floor(grid.ymax - grid.nrows * grid.celly)), 0.0)
+            for ext in [e.strip().lower() for e in MESH_EXPORT.split(",") if e.strip()]:
+                out_mesh = os.path.splitext(_side_csv(in_lines, out_ws, datum, name_suffix, "BundSolids"))[0] + f".{ext}"
+                if ext == "obj":
+                    bm.write_obj(out_mesh, meshes, origin)
+                elif ext in ("glb", "gltf"):
+                    out_mesh = os.path.splitext(out_mesh)[0] + ".glb"
+                    bm.write_glb(out_mesh, meshes, origin)
+                else:
+                    arcpy.AddWarning(f"Unknown MESH_EXPORT format '{ext}' (use obj / glb).")
+                    continue
+                arcpy.AddMessage(f"Solids exported → {out_mesh}")
+        except Exception as ex:
+            arcpy.AddWarning(f"Multipatch creation failed: {ex}")
+
+    # -------- CSV: per-feature rows + merged totals --------
+    if want_csv:
+        try:
+            with prof.stage("volumes_table", vertices=vols.rows):
+                # Merged totals from the labelled fill composite (overlaps counted once)
+                (id_A, id_V, _), (total_area_m2, total_fill_m3, total_strip_m3) = comp.totals(
+                    grid.cell_area, len(id_index), strip)
+                for k, lab in sorted(id_index.items(), key=lambda kv: kv[1]):
+                    if k not in designed:
+                        continue
+                    arcpy.AddMessage(f"  ID {k}: fill area {id_A[lab]:.1f} m², fill volume {id_V[lab]:.1f} m³")
+                preview_tot = ([cell, round(vols.sum("FillVolumeEst_m3"), 3), round(vols.sum("FillVolumeErr_m3"), 3)]
+                               if level > 1 else [])
+                vols.append(_volumes_total(params, total_area_m2, total_fill_m3, total_strip_m3) + preview_tot)
+
+                # Table in the workspace in one go (field types from the store's dtype), then
+                # the CSV (+ RESULTS_EXPORT) from the same array
+                tname = arcpy.ValidateTableName(f"{base}_BundVolumes{tag}{suffix}", out_ws)
+                tpath = os.path.join(out_ws, tname)
+                if arcpy.Exists(tpath):
+                    arcpy.management.Delete(tpath)
+                arcpy.da.NumPyArrayToTable(vols.array(), tpath)
+                written = _export_results(vols, vol_csv)
+                arcpy.AddMessage(f"Volumes table + CSV written → {tpath} and {', '.join(written)}")
+        except Exception as ex:
+            arcpy.AddWarning(f"CSV creation failed: {ex}")
+    vols.close()
+
+    # Hard clean in_memory (and the scratch tiles) at end
+    try:
+        arcpy.management.Delete("in_memory")
+    except Exception:
+        pass
+    shutil.rmtree(tile_dir, ignore_errors=True)
+    shutil.rmtree(dem_dir, ignore_errors=True)
+    st = dem_cache.stats()
+    arcpy.AddMessage(f"DEM cache: {st['hits']} hits, {st['misses']} reads, {st['mmap_hits']} mmap reloads, {st['evictions']} evictions.")
+    if level > 1:
+        arcpy.AddMessage(f"DEM pyramid: {pyramid.built} tile(s) built, {pyramid.reused} reused → {pyr_dir}")
+    if feat_cache is not None:
+        n = feat_cache.evict()
+        arcpy.AddMessage(f"Feature cache: {feat_cache.hits} reused, {feat_cache.misses} recomputed, {n} evicted.")
+
+    if prof.enabled:
+        prof.add("run", None, time.perf_counter() - t_run, time.process_time() - c_run)
+        prof.close()
+        try:
+            prof.write_summary(prof_csv)
+            arcpy.AddMessage(f"Profile trace + summary written → {prof.trace_path} and {prof_csv}")
+            for a in sorted(prof.summary(), key=lambda a: -a["wall_s"])[:8]:
+                arcpy.AddMessage(f"  {a['stage']:<24} {a['wall_s']:9.2f} s  ({a['share_pct']:5.1f} %)  ×{a['count']}")
+        except Exception as ex:
+            arcpy.AddWarning(f"Profile summary failed: {ex}")
+
+    arcpy.AddMessage("### BundDesigner v5.2e (engine) DONE ###")
+
+
+# ---------- scenario sweep ----------
+
+def _side_csv(in_lines, out_ws, datum, name_suffix, kind):
+    # <base>_<kind>[_datum].csv next to the outputs, like the volumes CSV
+    base = os.path.splitext(os.path.basename(in_lines))[0]
+    suffix = f"_{datum}" if (name_suffix and datum) else ""
+    ws_dir = out_ws if os.path.isdir(out_ws) else os.path.dirname(out_ws)
+    return os.path.join(ws_dir, f"{base}_{kind}{suffix}.csv")
+
+
+def _results_store(schema, csv):
+    # ResultStore journaled next to `csv` (same name, .npy) as rows are appended
+    return br.ResultStore(schema, os.path.splitext(csv)[0] + ".npy")
+
+
+def _export_results(store, csv):
+    # Finished table → .npy journal + CSV (+ RESULTS_EXPORT formats) → paths written
+    store.close()
+    store.to_csv(csv)
+    out = [p for p in (store.path, csv) if p]
+    for ext in [e.strip().lower() for e in RESULTS_EXPORT.split(",") if e.strip()]:
+        if ext == "parquet":
+            path = os.path.splitext(csv)[0] + ".parquet"
+            try:
+                store.to_parquet(path)
+            except ImportError as ex:
+                arcpy.AddWarning(str(ex))
+                continue
+            out.append(path)
+        else:
+            arcpy.AddWarning(f"Unknown RESULTS_EXPORT format '{ext}' (use parquet).")
+    return out
+
+
+def _write_csv(path, cols, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(",".join(cols) + "\n")
+        for r in rows:
+            f.write(",".join("" if v is None else str(v) for v in r) + "\n")
+
+
+def _sweep_base(params, mode, val):
+    # Base design of one feature from the run_engine parameter list
+    start_h, end_h, hag_value = params[4], params[5], params[7]
+    crest_w, keep_crest, batter, taper = params[9:13]
+    strip, extra_buf = params[15], params[24]
+    return {
+        "mode": mode, "crest": val if mode == "CONST_ABS" else None,
+        "start_h": start_h, "end_h": end_h,
+        "hag": val if mode == "HAG_FIELD" else hag_value,
+        "crest_w": crest_w, "batter": batter, "taper": taper, "keep_crest": keep_crest,
+        "extra_buf": extra_buf, "strip": strip if strip else 0.0,
+        "smooth_crest": SMOOTH_CREST_METERS, "smooth_design": SMOOTH_DESIGN_METERS,
+        "smooth_kernel": SMOOTH_KERNEL,
+    }
+
+
+def _prepared_features(params, scenarios, dem_cache, grid, cell):
+    # Yields (oid, id, parts, base, PreparedFeature, ground profile) per centreline, each
+    # with one DEM window / distance pass sized for the widest scenario. Reads and filters
+    # the centrelines as run_engine does (merge_by_id, REFINE_IDS)
+    in_lines, id_field, design_mode, height_field = params[0], params[1], params[2], params[3]
+    hag_field, merge_by_id = params[6], params[23]
+    for row in _read_centrelines(in_lines, id_field, design_mode, height_field, hag_field, merge_by_id):
+        p = _parse_row(row, design_mode)
+        if p is None or not _wanted(p[1]):
+            continue
+        oidv, cid, geom, L, mode, val = p
+        base = _sweep_base(params, mode, val)
+        base["cell"] = cell
+        base["step"] = max(cell, 2 * cell)
+        reach = bs.scenario_reach(base, scenarios)
+        ext = geom.extent
+        win = grid.window(ext.XMin, ext.YMin, ext.XMax, ext.YMax, pad=reach + cell)
+        if win.nrows == 0 or win.ncols == 0:
+            arcpy.AddWarning(f"OID {oidv}: centreline lies outside the DEM; skipped.")
+            continue
+        xs, ys = grid.centres(win)
+        parts = _geom_parts(geom)
+        pf, ground = bs.prepare(dem_cache.read(win), xs, ys, parts, base, scenarios, dem_cache.sample)
+        yield int(oidv), str(cid), parts, base, pf, ground
+
+
+def run_sweep(params, values, out_csv=None):
+    # Volume-vs-parameter curves in one pass. params: the run_engine parameter list;
+    # values: {"batter": [2, 3, 4], "hag": [1.0, 1.5], ...} (keys in bund_scenarios.SWEEP_KEYS).
+    # Writes a tidy CSV (one row per feature per scenario) and returns the rows.
+    in_lines, design_mode = params[0], params[2]
+    dem_path, out_ws = params[8], params[16]
+    datum, name_suffix = params[13], params[14]
+    for pth, what in [(in_lines, "centrelines"), (dem_path, "DEM")]:
+        if not arcpy.Exists(pth):
+            raise arcpy.ExecuteError(f"Missing {what}: {pth}")
+    _check_mode(in_lines, design_mode, params[3], params[4], params[5], params[6], params[7])
+    try:
+        scenarios = bs.scenario_grid(values)
+    except ValueError as ex:
+        raise arcpy.ExecuteError(str(ex))
+    arcpy.AddMessage(f"### BundDesigner sweep: {len(scenarios)} scenario(s) ###")
+
+    dem = Raster(dem_path)
+    grid = _dem_grid(dem)
+    cell = float(arcpy.GetRasterProperties_management(dem, "CELLSIZEX").getOutput(0))
+    dem_cache = DemTileCache(grid, lambda w: _read_window(dem, grid, w), tile=DEM_TILE, budget_mb=DEM_CACHE_MB)
+
+    out_csv = out_csv or _side_csv(in_lines, out_ws, datum, name_suffix, "BundSweep")
+    table = _results_store(_SWEEP_SCHEMA, out_csv)
+    rows = []
+    for oidv, cid, parts, base, pf, ground in _prepared_features(params, scenarios, dem_cache, grid, cell):
+        feat_rows = []
+        for k, s in enumerate(scenarios):
+            _, (A, V, S) = bs.evaluate(pf, ground, base, s, grid.cell_area)
+            e = bs.effective(base, s)
+            hag = e["hag"] if base["mode"] in ("HAG_FIELD", "HAG_VALUE") else None
+            sh, eh = (e["start_h"], e["end_h"]) if base["mode"] == "GRADIENT" else (None, None)
+            feat_rows.append([k + 1, oidv, cid, design_mode, e["crest"], sh, eh, hag,
+                              float(e["crest_w"]), float(e["batter"]), float(e["taper"]), A, V, S])
+        table.extend(feat_rows)
+        rows += feat_rows
+        arcpy.AddMessage(f"— Feature OID {oidv} (ID={cid}): {len(scenarios)} scenario(s) evaluated")
+
+    arcpy.AddMessage(f"Sweep table written → {', '.join(_export_results(table, out_csv))}")
+    return [dict(zip(table.columns, r)) for r in rows]
+
+
+# ---------- target-volume solver ----------
+
+def run_solver(params, target_m3, per_feature=True, tol_m3=None, max_iter=60, out_csv=None):
+    # Crest level (Use Field RL / Start+End offset / HAG) giving a target FillVolume_m3, per
+    # feature or for the sum over all features (one common offset). Bracketing + bisection on
+    # the prepared distance fields: each iteration is one array evaluation per feature.
+    in_lines, design_mode = params[0], params[2]
+    dem_path, out_ws = params[8], params[16]
+    datum, name_suffix = params[13], params[14]
+    for pth, what in [(in_lines, "centrelines"), (dem_path, "DEM")]:
+        if not arcpy.Exists(pth):
+            raise arcpy.ExecuteError(f"Missing {what}: {pth}")
+    _check_mode(in_lines, design_mode, params[3], params[4], params[5], params[6], params[7])
+    target_m3 = float(target_m3)
+    tol = float(tol_m3) if tol_m3 else max(abs(target_m3) * 1e-3, 0.01)
+    arcpy.AddMessage(f"### BundDesigner solver: target {target_m3:.1f} m³ ({'per feature' if per_feature else 'total'}), tolerance {tol:.3f} m³ ###")
+
+    dem = Raster(dem_path)
+    grid = _dem_grid(dem)
+    cell = float(arcpy.GetRasterProperties_management(dem, "CELLSIZEX").getOutput(0))
+    dem_cache = DemTileCache(grid, lambda w: _read_window(dem, grid, w), tile=DEM_TILE, budget_mb=DEM_CACHE_MB)
+
+    level_cols = {"CONST_ABS": "CrestField_m", "GRADIENT": "StartH_m", "HAG_FIELD": "HAG_m", "HAG_VALUE": "HAG_m"}
+    out_csv = out_csv or _side_csv(in_lines, out_ws, datum, name_suffix, "BundSolve")
+    table = _results_store(_SOLVE_SCHEMA, out_csv)
+
+    def _row(oidv, cid, base, res, target):
+        lv = bs.effective(base, bs.level_scenario(base, res.dz))
+        mode = base["mode"]
+        level = lv["crest"] if mode == "CONST_ABS" else (lv["start_h"] if mode == "GRADIENT" else lv["hag"])
+        return [oidv, cid, design_mode, level_cols[mode], float(level),
+                (float(lv["end_h"]) if mode == "GRADIENT" else None), float(res.dz),
+                float(res.value), target, (float(res.error) if target is not None else None), tol, int(res.iterations),
+                ("True" if res.converged else "False")]
+
+    rows = []
+    if per_feature:
+        for oidv, cid, parts, base, pf, ground in _prepared_features(params, [{}], dem_cache, grid, cell):
+            res = bs.solve_level(bs.feature_volume_fn(pf, ground, base, grid.cell_area), target_m3, tol, max_iter=max_iter)
+            rows.append(_row(oidv, cid, base, res, target_m3))
+            table.append(rows[-1])
+            arcpy.AddMessage(f"— Feature OID {oidv} (ID={cid}): offset {res.dz:+.3f} m → {res.value:.1f} m³ "
+                             f"in {res.iterations} iteration(s){'' if res.converged else ' (NOT converged)'}")
+    else:
+        feats = list(_prepared_features(params, [{}], dem_cache, grid, cell))
+        fns = [bs.feature_volume_fn(pf, ground, base, grid.cell_area) for _, _, _, base, pf, ground in feats]
+        res = bs.solve_level(lambda dz: sum(fn(dz) for fn in fns), target_m3, tol, max_iter=max_iter)
+        for (oidv, cid, _, base, _, _), fn in zip(feats, fns):
+            v = fn(res.dz)
+            rows.append(_row(oidv, cid, base, res._replace(value=v), None))
+        rows.append([-1, "__TOTAL__", design_mode, None, None, None, float(res.dz), float(res.value), target_m3,
+                     float(res.error), tol, int(res.iterations), ("True" if res.converged else "False")])
+        table.extend(rows)
+        arcpy.AddMessage(f"Common offset {res.dz:+.3f} m → {res.value:.1f} m³ in {res.iterations} iteration(s)"
+                         f"{'' if res.converged else ' (NOT converged)'}")
+
+    arcpy.AddMessage(f"Solver table written → {', '.join(_export_results(table, out_csv))}")
+    return [dict(zip(table.columns, r)) for r in rows]
+
+
+# ---------- design server client ----------
+
+def run_engine_remote(params, address=None):
+    # run_engine with the design done by a resident bund_server.py: the centrelines go over
+    # as GeoJSON, the BundVolumes CSV (+ __TOTAL__) and footprints are written from the reply.
+    # No DEM open, extension checkout or scratch set-up here; rasters, multipatch, sections
+    # and storage need a full run_engine.
+    (
+        in_lines, id_field, design_mode,
+        height_field, start_h, end_h,
+        hag_field, hag_value,
+        dem_path,
+        crest_w, keep_crest, batter, taper,
+        datum, name_suffix, strip,
+        out_ws,
+        want_merged_surf, want_perfeat_surf, want_fill_ras,
+        want_mpatch, want_footprint, want_csv,
+        merge_by_id, extra_buf
+    ) = params
+    host, port = bsrv.parse_address(address or DESIGN_SERVER)
+    arcpy.AddMessage(f"### BundDesigner v5.2e (design server {host}:{port}) START ###")
+    _check_mode(in_lines, design_mode, height_field, start_h, end_h, hag_field, hag_value)
+    if want_merged_surf or want_perfeat_surf or want_fill_ras or want_mpatch:
+        arcpy.AddWarning("Design server runs write volumes and footprints only — raster / multipatch outputs skipped.")
+
+    feats, rows = [], {}
+    for row in _read_centrelines(in_lines, id_field, design_mode, height_field, hag_field, merge_by_id):
+        p = _parse_row(row, design_mode)
+        if p is None or not _wanted(p[1]):
+            continue
+        oidv, cid, geom, L, mode, val = p
+        props = {"oid": int(oidv), "CentrelineID": str(cid)}
+        if val is not None:
+            props["height" if mode == "CONST_ABS" else "hag"] = val
+        feats.append({"type": "Feature", "properties": props,
+                      "geometry": {"type": "MultiLineString", "coordinates": [pt.tolist() for pt in _geom_parts(geom)]}})
+        rows[int(oidv)] = _volumes_row(params, oidv, cid, L, mode, val)
+
+    t0 = time.perf_counter()
+    resp = bsrv.design({"type": "FeatureCollection", "features": feats}, {
+        "design_mode": design_mode, "start_h": start_h, "end_h": end_h, "hag_value": hag_value,
+        "crest_w": crest_w, "keep_crest": keep_crest, "batter": batter, "taper": taper,
+        "strip": strip if strip else 0.0, "extra_buf": extra_buf, "datum": datum,
+        "smooth_crest": SMOOTH_CREST_METERS, "smooth_design": SMOOTH_DESIGN_METERS,
+        "smooth_kernel": SMOOTH_KERNEL, "footprint_simplify_cells": FOOTPRINT_SIMPLIFY_CELLS,
+    }, host=host, port=port)
+    for w in resp["warnings"]:
+        arcpy.AddWarning(w)
+    arcpy.AddMessage(f"Designed {len(resp['features'])} feature(s) in {time.perf_counter() - t0:.2f} s "
+                     f"({sum(f['cached'] for f in resp['features'])} from the server cache).")
+
+    base = os.path.splitext(os.path.basename(in_lines))[0]
+    suffix = f"_{datum}" if (name_suffix and datum) else ""
+    if want_csv:
+        tot = resp["totals"]
+        vrows = [rows[f["oid"]] + [f["FillArea_m2"], f["FillVolume_m3"], f["StripVolume_m3"], datum]
+                 for f in resp["features"]]
+        vrows.append(_volumes_total(params, tot["FillArea_m2"], tot["FillVolume_m3"], tot["StripVolume_m3"]))
+        try:
+            br.records(_VOLUMES_SCHEMA, vrows)
+        except ValueError as ex:
+            arcpy.AddWarning(f"{ex} Volumes CSV skipped.")
+        else:
+            csv = _side_csv(in_lines, out_ws, datum, name_suffix, "BundVolumes")
+            vols = _results_store(_VOLUMES_SCHEMA, csv)
+            vols.extend(vrows)
+            written = _export_results(vols, csv)
+            arcpy.AddMessage(f"Volumes CSV written → {', '.join(written)} (fill {tot['FillVolume_m3']:.1f} m³)")
+
+    if want_footprint and resp["footprints"]["features"]:
+        fp_fc = _safe(out_ws, f"{base}_BundFootprint{suffix}")
+        sr = arcpy.Describe(in_lines).spatialReference
+        if arcpy.Exists(fp_fc):
+            arcpy.management.Delete(fp_fc)
+        arcpy.management.CreateFeatureclass(out_ws, os.path.basename(fp_fc), "POLYGON", spatial_reference=sr)
+        for fn, ft, ln in [("CentrelineID", "TEXT", 256), ("Area_ha", "DOUBLE", None), ("VertDatum", "TEXT", 32)]:
+            arcpy.management.AddField(fp_fc, fn, ft, field_length=ln)
+        fp_rows = []
+        for f in resp["footprints"]["features"]:
+            g = f["geometry"]
+            polys = [g["coordinates"]] if g["type"] == "Polygon" else g["coordinates"]
+            # GeoJSON winding (outer counter-clockwise) back to Esri order
+            fp_rows.append(([r[::-1] for poly in polys for r in poly], f["properties"]["CentrelineID"],
+                            f["properties"]["Area_ha"]))
+        _write_footprints(fp_rows, fp_fc, sr, datum)
+        arcpy.AddMessage(f"Footprints: {len(fp_rows)} polygon(s) → {fp_fc}")
+
+    arcpy.AddMessage("### BundDesigner v5.2e (design server) DONE ###")
+
+
+# ---------- entry point ----------
+
+if __name__ == "__main__":
+    try:
+        arcpy.AddMessage("### Detainment Bund 3d Design — BundDesigner v5.2e (script) ###")
+        g = [arcpy.GetParameterAsText(i) for i in range(25)]
+        try:
+            cnt = int(arcpy.management.GetCount(g[0]).getOutput(0))
+            arcpy.AddMessage(f"Input features count: {cnt}")
+        except Exception as e:
+            arcpy.AddWarning(f"Could not count input features: {e}")
+        vals = [
+            g[0], g[1], (g[2] or "Use Field"), (g[3] or None),
+            _f(g[4], None), _f(g[5], None),
+            (g[6] or None), _f(g[7], None),
+            g[8], _f(g[9], 2.0),
+            _as_bool(g[10]), _f(g[11], 5.0), _f(g[12], 0.0),
+            (g[13] or ""), _as_bool(g[14]), _f(g[15], 0.0),
+            g[16], _as_bool(g[17]), _as_bool(g[18]), _as_bool(g[19]),
+            _as_bool(g[20]), _as_bool(g[21]), _as_bool(g[22]),
+            _as_bool(g[23]), _f(g[24], 20.0),
+        ]
+        if DESIGN_SERVER:
+            run_engine_remote(vals)
+        else:
+            run_engine(vals)
+    except Exception as ex:
+        arcpy.AddError("### BundDesigner ERROR ###")
+        arcpy.AddError(str(ex))
+        arcpy.AddError(traceback.format_exc())
+        raise
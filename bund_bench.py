@@ -0,0 +1,520 @@
+# bund_bench.py
+# Reproducible benchmark suite for the design engine, headless (no arcpy, runs on Linux).
+# Synthetic terrains (planar / sloped / noisy / valley) are generated on demand per DEM
+# tile, so 20k × 20k grids cost only the tiles the centrelines touch. Centreline sets vary
+# count, length and overlap and cover all four design modes, taper, maintain-crest and
+# merge-by-ID. Each case runs a local stand-in of run_engine (DEM tile cache → crest
+# profile → run_feature → tiled composite → labelled totals) under bund_profile, and
+# records per-stage timings, peak memory and volumes; results are compared with stored
+# baselines to flag throughput and volume regressions.
+#
+# Usage:
+#   python bund_bench.py                     # quick suite vs bund_bench_baseline.json
+#   python bund_bench.py --suite full        # + large grids (5k–20k cells a side)
+#   python bund_bench.py --case valley_hag_field --repeat 5
+#   python bund_bench.py --update-baseline   # store this run as the baseline
+# Exit code 1 when a regression is flagged.
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import bund_engine as be
+import bund_index as bix
+from bund_cog import CogWriter
+from bund_dem import DemTileCache
+from bund_profile import Profiler, peak_rss_mb
+from bund_tiles import TileCompositor
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bund_bench_baseline.json")
+
+TIME_TOL = 0.25          # flag when a case is this much slower than its baseline …
+TIME_FLOOR_S = 0.05      # … and by more than this (timer noise on tiny cases)
+VOLUME_RTOL = 1e-4       # flag when merged fill volume drifts from the baseline
+ANALYTIC_TOL_PCT = 2.0   # flag when a case with a closed-form volume misses it by more
+
+
+# ---------- synthetic terrain ----------
+
+def _hash01(i, j, seed):
+    # Deterministic lattice noise in [0, 1) from integer coordinates
+    h = (i.astype("uint64") * np.uint64(374761393) + j.astype("uint64") * np.uint64(668265263)
+         + np.uint64(seed) * np.uint64(2246822519)) & np.uint64(0xFFFFFFFF)
+    h = ((h ^ (h >> np.uint64(13))) * np.uint64(1274126177)) & np.uint64(0xFFFFFFFF)
+    h ^= h >> np.uint64(16)
+    return h.astype("float64") / 4294967296.0
+
+
+def _value_noise(x, y, spacing, seed):
+    # Bilinear value noise on a `spacing` m lattice, in [-1, 1)
+    fx, fy = x / spacing, y / spacing
+    i0, j0 = np.floor(fx), np.floor(fy)
+    tx, ty = fx - i0, fy - j0
+    i0 = i0.astype("int64") + (1 << 20)
+    j0 = j0.astype("int64") + (1 << 20)
+    v00 = _hash01(i0, j0, seed)
+    v10 = _hash01(i0 + 1, j0, seed)
+    v01 = _hash01(i0, j0 + 1, seed)
+    v11 = _hash01(i0 + 1, j0 + 1, seed)
+    v = (v00 * (1 - tx) * (1 - ty) + v10 * tx * (1 - ty) + v01 * (1 - tx) * ty + v11 * tx * ty)
+    return 2.0 * v - 1.0
+
+
+class SyntheticDem(object):
+    # Procedural DEM on a bund_engine.Grid; read(win) is the DemTileCache reader.
+    # kind: "planar" (flat), "sloped" (tilted plane), "noisy" (slope + two octaves of value
+    # noise + cell jitter), "valley" (Gaussian valley across a downstream slope)
+    KINDS = ("planar", "sloped", "noisy", "valley")
+
+    def __init__(self, kind, grid, seed=0, z0=100.0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown terrain '{kind}' (allowed: {', '.join(self.KINDS)})")
+        self.kind = kind
+        self.grid = grid
+        self.seed = int(seed)
+        self.z0 = float(z0)
+        self.reads = 0
+
+    def z(self, x, y):
+        g = self.grid
+        x = np.asarray(x, dtype="float64") - g.xmin
+        y = np.asarray(y, dtype="float64") - (g.ymax - g.nrows * g.celly)
+        if self.kind == "planar":
+            return np.full(np.broadcast(x, y).shape, self.z0)
+        z = self.z0 + 0.004 * x + 0.002 * y
+        if self.kind == "noisy":
+            z = z + 1.5 * _value_noise(x, y, 40.0, self.seed) + 0.4 * _value_noise(x, y, 9.0, self.seed + 1)
+            z = z + 0.05 * (_hash01(np.floor(x / g.cellx).astype("int64") + (1 << 20),
+                                    np.floor(y / g.celly).astype("int64") + (1 << 20), self.seed + 2) - 0.5)
+        elif self.kind == "valley":
+            half = 0.15 * g.ncols * g.cellx
+            z = z + 6.0 * (1.0 - np.exp(-((x - 0.5 * g.ncols * g.cellx) / half) ** 2))
+        return z
+
+    def read(self, win):
+        self.reads += 1
+        xs, ys = self.grid.centres(win)
+        return self.z(xs[None, :], ys[:, None])
+
+
+# ---------- synthetic centrelines ----------
+
+def centrelines(grid, terrain, count, length, overlap=0.0, n_ids=None, vertices=6, seed=0, margin=None):
+    # Random gently-curving polylines inside the grid. With probability `overlap` a line is
+    # laid parallel to, and a few metres off, an earlier one (overlapping bunds, shared ID
+    # so merge-by-ID has work to do). Returns dicts: oid, cid, parts, crest, hag.
+    rng = np.random.default_rng(seed)
+    W = grid.ncols * grid.cellx
+    H = grid.nrows * grid.celly
+    x0, y0 = grid.xmin, grid.ymax - H
+    m = margin if margin is not None else min(0.1 * min(W, H), 60.0)
+    length = min(length, 0.8 * min(W, H))
+    n_ids = n_ids or count
+    out = []
+    for k in range(count):
+        if out and rng.random() < overlap:
+            ref = out[int(rng.integers(len(out)))]
+            pts = ref["parts"][0]
+            d = pts[-1] - pts[0]
+            if rng.random() < 0.5:
+                # continuation from the end of the earlier line (Dissolve joins the two)
+                pts = pts[-1] + (pts - pts[0]) * rng.uniform(0.3, 0.6)
+            else:
+                nrm = np.array([-d[1], d[0]]) / max(np.hypot(*d), 1e-9)
+                pts = pts + nrm * rng.uniform(2.0, 8.0) + d * rng.uniform(-0.2, 0.2)
+            cid = ref["cid"]
+        else:
+            ang = rng.uniform(0.0, 2 * math.pi)
+            turns = np.cumsum(rng.normal(0.0, 0.15, vertices - 1))
+            steps = np.stack([np.cos(ang + turns), np.sin(ang + turns)], 1) * (length / (vertices - 1))
+            pts = np.vstack([[0.0, 0.0], np.cumsum(steps, 0)])
+            lo, hi = pts.min(0), pts.max(0)
+            sx = rng.uniform(x0 + m - lo[0], max(x0 + m - lo[0], x0 + W - m - hi[0]))
+            sy = rng.uniform(y0 + m - lo[1], max(y0 + m - lo[1], y0 + H - m - hi[1]))
+            pts = pts + [sx, sy]
+            cid = f"B{k % n_ids:03d}"
+        pts[:, 0] = np.clip(pts[:, 0], x0 + 1.0, x0 + W - 1.0)
+        pts[:, 1] = np.clip(pts[:, 1], y0 + 1.0, y0 + H - 1.0)
+        ground = terrain.z(pts[:, 0], pts[:, 1])
+        out.append({"oid": k + 1, "cid": cid, "parts": [pts],
+                    "crest": round(float(ground.max()) + 1.5 + rng.uniform(0.0, 1.0), 3),
+                    "hag": round(float(rng.uniform(1.0, 2.5)), 3)})
+    return out
+
+
+def merge_by_id(feats):
+    # Stand-in for Dissolve(id, MAX stats, SINGLE_PART), as run_engine does it in memory
+    return bix.merge_by_id(feats, carry=("crest", "hag"))
+
+
+# ---------- run_engine stand-in ----------
+
+DESIGN = {
+    "design_mode": "Use Field", "start_h": None, "end_h": None, "hag_value": 1.5,
+    "crest_w": 3.0, "keep_crest": True, "batter": 3.0, "taper": 0.0, "strip": 0.15,
+    "extra_buf": 0.0, "merge_by_id": False, "smooth_crest": 2.0, "smooth_design": 0.0,
+    "smooth_kernel": "disc", "datum": "NZVD2016", "chunk_cells": 16_000_000,
+}
+
+_MODES = {"Use Field": "CONST_ABS", "Use Start/End": "GRADIENT",
+          "Use HAG Field": "HAG_FIELD", "Use HAG Value": "HAG_VALUE"}
+
+
+def run_headless(grid, terrain, feats, design, prof, workers=0, tile=1024, dem_tile=512, dem_mb=512.0,
+                 cog_dir=None, cluster_cells=4_000_000):
+    # Same per-feature flow and merge order as run_engine (clusters, chainage chunks over
+    # d["chunk_cells"]), minus arcpy I/O (tiles are composited and reduced; written only as
+    # COGs into cog_dir if given). → dict of totals and counters
+    d = dict(DESIGN, **design)
+    mode = _MODES[d["design_mode"]]
+    cell = grid.cellx
+    reach = be.feature_reach(d["crest_w"], d["batter"], d["taper"], d["extra_buf"])
+    if d["merge_by_id"]:
+        with prof.stage("merge_by_id", vertices=sum(len(p) for f in feats for p in f["parts"])):
+            feats = merge_by_id(feats)
+
+    dem_cache = DemTileCache(grid, terrain.read, tile=dem_tile, budget_mb=dem_mb)
+    cogs = {}
+    if cog_dir:
+        os.makedirs(cog_dir, exist_ok=True)
+        cogs = {ly: CogWriter(os.path.join(cog_dir, f"{ly}.tif"), grid, block=min(512, tile))
+                for ly in ("surface", "fill")}
+    comp = TileCompositor(grid, ("surface", "fill"), tile=tile, label_layer="fill",
+                          backfill={"surface": dem_cache.read},
+                          on_tile=(lambda ly, tw, arr: cogs[ly].write(tw, arr)) if cogs else None)
+    chunk_cells = d["chunk_cells"]
+    margin = be.smooth_margin(d["smooth_crest"], d["smooth_design"], cell, d["smooth_kernel"])
+    plans = {}
+    with prof.stage("plan"):
+        for f in feats:
+            plans[f["oid"]] = [c for c in be.chunk_plan(grid, f["parts"], reach, chunk_cells)
+                               if c[2].nrows and c[2].ncols]
+            for _, _, core in plans[f["oid"]]:
+                comp.plan(core)
+    with prof.stage("cluster"):
+        if cluster_cells:
+            groups = bix.batches([f["parts"] for f in feats], reach, grid,
+                                 min(cluster_cells, chunk_cells) if chunk_cells else cluster_cells)
+        else:
+            groups = [[i] for i in range(len(feats))]
+
+    def _read(job):
+        win = job["window"]
+        with prof.stage("dem_read", job["oid"], cells=win.nrows * win.ncols):
+            job["dem"] = dem_cache.read(win)
+        job["xs"], job["ys"] = grid.centres(win)
+        return job
+
+    def _jobs():
+        for grp in groups:
+            pend = [j for i in grp for j in _feature_jobs(feats[i])]
+            if len(grp) == 1:
+                yield from (_read(j) for j in pend)
+            elif len(pend) == 1:
+                yield _read(pend[0])
+            elif pend:
+                yield _read({"oid": pend[0]["oid"], "window": be.union_window([j["window"] for j in pend]),
+                             "members": pend})
+
+    def _feature_jobs(f):
+        # One run_feature job per chunk (chunk jobs compute on the core padded by the
+        # smoothing margin and count only the cells they own), as run_engine
+        oid, chunks, parts = f["oid"], plans[f["oid"]], f["parts"]
+        if not chunks:
+            return []
+        with prof.stage("crest_profile", oid, vertices=sum(len(p) for p in parts)):
+            if mode == "CONST_ABS":
+                crest_z = f["crest"]
+            elif mode == "GRADIENT":
+                crest_z = be.gradient_profile(parts, d["start_h"], d["end_h"])
+            else:
+                hag = f["hag"] if mode == "HAG_FIELD" else float(d["hag_value"])
+                crest_z = be.hag_profile(parts, max(cell, 2 * cell), dem_cache.sample, hag)
+        nch = len(chunks)
+        jobs = []
+        for k, (_, _, core) in enumerate(chunks):
+            job = {
+                "oid": oid, "cid": f["cid"], "window": be.pad_window(grid, core, margin) if nch > 1 else core,
+                "parts": parts, "crest_z": crest_z,
+                "crest_w": d["crest_w"], "batter": d["batter"], "taper": d["taper"], "keep_crest": d["keep_crest"],
+                "reach": reach, "cell": cell, "cell_area": grid.cell_area, "strip": d["strip"],
+                "smooth_crest": d["smooth_crest"], "smooth_design": d["smooth_design"],
+                "smooth_kernel": d["smooth_kernel"], "datum": d["datum"],
+                "row": [oid, f["cid"], be.line_length(parts), d["design_mode"]],
+            }
+            if nch > 1:
+                job.update(core=core, earlier=[c for _, _, c in chunks[:k]], piece=(k, nch))
+            jobs.append(job)
+        return jobs
+
+    ids = {}       # composite labels in feature order, as run_engine
+    for f in feats:
+        ids.setdefault(f["cid"], len(ids) + 1)
+    per_V = 0.0
+    window_cells = 0
+    nfeat = 0
+    for res in be.map_features(_jobs(), workers):
+        if res.timing is not None:
+            prof.add("design", res.oid, res.timing[0], res.timing[1], cells=res.fill.size)
+        lab = ids[res.cid]
+        with prof.stage("composite_merge", res.oid, cells=res.fill.size):
+            comp.add(res.window, {"surface": res.bund, "fill": res.fill}, lab)
+        per_V += res.row[-3]
+        window_cells += res.fill.size
+        if res.piece is None or res.piece[0] == res.piece[1] - 1:
+            nfeat += 1
+    with prof.stage("composite_flush"):
+        comp.close()
+    for ly, w in cogs.items():
+        with prof.stage(f"write_{ly}", cells=grid.nrows * grid.ncols):
+            if ly == "surface":
+                w.fill(terrain.read)
+            w.close()
+    with prof.stage("volumes_table", vertices=nfeat):
+        (_, id_V, _), (A, V, S) = comp.totals(grid.cell_area, len(ids), d["strip"])
+    return {
+        "features": nfeat, "ids": len(ids), "window_cells": window_cells,
+        "area_m2": A, "fill_m3": V, "strip_m3": S, "per_feature_fill_m3": per_V,
+        "id_fill_m3": [float(v) for v in id_V[1:]],
+        "tiles_written": comp.written, "peak_tiles": comp.peak_tiles,
+        "dem_reads": terrain.reads, "dem_cache": dem_cache.stats(),
+        "cog_mb": round(sum(os.path.getsize(w.path) for w in cogs.values()) / 1048576.0, 3),
+    }
+
+
+def analytic_volume(length, crest_h, crest_w, batter):
+    # Straight bund on flat ground, constant crest, no taper / maintain-crest / smoothing.
+    # The processing mask is a flat-ended buffer, so the bund stops square at both ends:
+    # a prism of crest (w × H) plus two batters (b·H² / 2 each) along the line.
+    H, w, b = float(crest_h), float(crest_w), float(batter)
+    return length * (w * H + b * H * H)
+
+
+# ---------- cases ----------
+
+def _case(name, terrain="sloped", cell=1.0, size=1500, count=12, length=400.0, overlap=0.2,
+          n_ids=None, seed=1, **design):
+    return {"name": name, "terrain": terrain, "cell": cell, "size": size, "count": count,
+            "length": length, "overlap": overlap, "n_ids": n_ids, "seed": seed, "design": design}
+
+
+def _analytic_case(name, cell, angle=0.0):
+    c = _case(name, terrain="planar", cell=cell, size=int(round(600 / cell)), count=1, length=300.0,
+              overlap=0.0, seed=7, smooth_crest=0.0, keep_crest=False, taper=0.0)
+    c["straight"] = {"crest_h": 2.0, "angle": angle}
+    return c
+
+
+def suite(name):
+    cases = [
+        _analytic_case("planar_const_analytic_1m", 1.0),
+        _analytic_case("planar_const_analytic_0p5m", 0.5),
+        _analytic_case("planar_const_analytic_oblique", 1.0, angle=33.0),
+        _case("sloped_const", "sloped"),
+        _case("sloped_gradient_taper", "sloped", design_mode="Use Start/End",
+              start_h=104.0, end_h=108.0, taper=15.0),
+        _case("noisy_hag_value_keepcrest", "noisy", design_mode="Use HAG Value", hag_value=1.8,
+              keep_crest=True),
+        _case("noisy_hag_value_nokeep", "noisy", design_mode="Use HAG Value", hag_value=1.8,
+              keep_crest=False),
+        _case("valley_hag_field", "valley", design_mode="Use HAG Field", taper=10.0),
+        _case("valley_hag_field_merge", "valley", count=24, overlap=0.5, n_ids=8,
+              design_mode="Use HAG Field", merge_by_id=True),
+        _case("noisy_dense_overlap_2m", "noisy", cell=2.0, size=1000, count=60, length=250.0,
+              overlap=0.6, n_ids=20, design_mode="Use HAG Value"),
+        _case("sloped_long_5m", "sloped", cell=5.0, size=800, count=6, length=3000.0, overlap=0.0,
+              design_mode="Use HAG Value"),
+        _case("sloped_long_5m_chunked", "sloped", cell=5.0, size=800, count=6, length=3000.0, overlap=0.0,
+              design_mode="Use HAG Value", chunk_cells=40_000),
+    ]
+    if name == "full":
+        cases += [
+            _case("noisy_5k_1m", "noisy", cell=1.0, size=5000, count=80, length=800.0, overlap=0.3,
+                  design_mode="Use HAG Field"),
+            _case("valley_10k_0p5m", "valley", cell=0.5, size=10000, count=60, length=600.0,
+                  overlap=0.3, n_ids=30, design_mode="Use HAG Value", merge_by_id=True),
+            _case("sloped_20k_1m", "sloped", cell=1.0, size=20000, count=200, length=1500.0,
+                  overlap=0.2, design_mode="Use Start/End", start_h=140.0, end_h=150.0, taper=20.0),
+            _case("noisy_20k_5m", "noisy", cell=5.0, size=20000, count=150, length=5000.0,
+                  overlap=0.2, design_mode="Use HAG Value"),
+        ]
+    return cases
+
+
+def _build(case):
+    cell = float(case["cell"])
+    n = int(case["size"])
+    grid = be.Grid(1000000.0, 5000000.0 + n * cell, cell, cell, n, n)
+    terrain = SyntheticDem(case["terrain"], grid, seed=case["seed"])
+    if "straight" in case:
+        W = n * cell
+        a = math.radians(case["straight"]["angle"])
+        half = 0.5 * case["length"] * np.array([math.cos(a), math.sin(a)])
+        mid = np.array([grid.xmin + 0.5 * W, grid.ymax - 0.5 * W])
+        pts = np.array([mid - half, mid + half])
+        feats = [{"oid": 1, "cid": "A", "parts": [pts],
+                  "crest": terrain.z0 + case["straight"]["crest_h"], "hag": case["straight"]["crest_h"]}]
+    else:
+        feats = centrelines(grid, terrain, case["count"], case["length"], case["overlap"],
+                            n_ids=case["n_ids"], seed=case["seed"])
+    return grid, terrain, feats
+
+
+def run_case(case, repeat=1, workers=0, trace_path=None, cog_dir=None):
+    # Best-of-`repeat` timings (per-stage from the fastest run); volumes from the last run
+    best = None
+    for k in range(max(int(repeat), 1)):
+        grid, terrain, feats = _build(case)
+        prof = Profiler(True, trace_path=trace_path if k == 0 else None, run_id=case["name"])
+        w0, c0 = time.perf_counter(), time.process_time()
+        out = run_headless(grid, terrain, feats, case["design"], prof, workers=workers,
+                           cog_dir=os.path.join(cog_dir, case["name"]) if cog_dir else None)
+        wall, cpu = time.perf_counter() - w0, time.process_time() - c0
+        prof.close()
+        if best is None or wall < best["wall_s"]:
+            best = {"wall_s": wall, "cpu_s": cpu,
+                    "stages": {a["stage"]: round(a["wall_s"], 4) for a in prof.summary()}}
+    res = {"name": case["name"], "case": case, "grid_cells": grid.nrows * grid.ncols,
+           "wall_s": round(best["wall_s"], 4), "cpu_s": round(best["cpu_s"], 4),
+           "mcells_per_s": round(out["window_cells"] / 1e6 / max(best["wall_s"], 1e-9), 3),
+           "peak_rss_mb": round(peak_rss_mb(), 1), "stages": best["stages"]}
+    res.update({k: v for k, v in out.items() if k not in ("dem_cache",)})
+    res["dem_cache_hits"] = out["dem_cache"]["hits"]
+    res["dem_cache_misses"] = out["dem_cache"]["misses"]
+    if "straight" in case:
+        d = dict(DESIGN, **case["design"])
+        ref = analytic_volume(case["length"], case["straight"]["crest_h"], d["crest_w"], d["batter"])
+        res["fill_ref_m3"] = round(ref, 3)
+        res["fill_err_pct"] = round(100.0 * (out["fill_m3"] - ref) / ref, 4)
+    return res
+
+
+def _run_isolated(case, repeat, workers, trace_dir, cog_dir=None):
+    # One child process per case, so peak RSS is that case's own
+    cmd = [sys.executable, os.path.abspath(__file__), "--child", json.dumps(case),
+           "--repeat", str(repeat), "--workers", str(workers)]
+    if trace_dir:
+        cmd += ["--trace-dir", trace_dir]
+    if cog_dir:
+        cmd += ["--cog-dir", cog_dir]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode != 0:
+        raise RuntimeError(f"case {case['name']} failed:\n{p.stderr}")
+    return json.loads(p.stdout.strip().splitlines()[-1])
+
+
+# ---------- baselines ----------
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "platform": platform.platform(), "machine": platform.machine(),
+            "cpus": os.cpu_count(), "date": time.strftime("%Y-%m-%d")}
+
+
+def compare(results, baseline, time_tol=TIME_TOL, volume_rtol=VOLUME_RTOL):
+    # → list of (case, kind, message); kind is SLOWER / VOLUME / ACCURACY / NEW
+    flags = []
+    base = (baseline or {}).get("cases", {})
+    for r in results:
+        n = r["name"]
+        if "fill_err_pct" in r and abs(r["fill_err_pct"]) > ANALYTIC_TOL_PCT:
+            flags.append((n, "ACCURACY", f"fill {r['fill_m3']:.1f} m³ vs closed form "
+                                         f"{r['fill_ref_m3']:.1f} m³ ({r['fill_err_pct']:+.2f} %)"))
+        b = base.get(n)
+        if b is None:
+            flags.append((n, "NEW", "no baseline"))
+            continue
+        dv = abs(r["fill_m3"] - b["fill_m3"])
+        if dv > volume_rtol * max(abs(b["fill_m3"]), 1.0):
+            flags.append((n, "VOLUME", f"fill {r['fill_m3']:.3f} m³ vs baseline {b['fill_m3']:.3f} m³"))
+        if r["wall_s"] > b["wall_s"] * (1.0 + time_tol) and r["wall_s"] - b["wall_s"] > TIME_FLOOR_S:
+            worst = max(r["stages"], key=lambda s: r["stages"][s] - b.get("stages", {}).get(s, 0.0))
+            flags.append((n, "SLOWER", f"{r['wall_s']:.3f} s vs baseline {b['wall_s']:.3f} s "
+                                       f"(+{100 * (r['wall_s'] / b['wall_s'] - 1):.0f} %, mostly '{worst}')"))
+    return flags
+
+
+def report(results, baseline, flags):
+    base = (baseline or {}).get("cases", {})
+    print(f"{'case':<30} {'feat':>5} {'Mcell':>7} {'wall s':>8} {'base s':>8} {'Mc/s':>7} "
+          f"{'RSS MB':>7} {'fill m³':>13}")
+    for r in results:
+        b = base.get(r["name"], {})
+        print(f"{r['name']:<30} {r['features']:>5} {r['window_cells'] / 1e6:>7.2f} {r['wall_s']:>8.3f} "
+              f"{b.get('wall_s', float('nan')):>8.3f} {r['mcells_per_s']:>7.2f} {r['peak_rss_mb']:>7.0f} "
+              f"{r['fill_m3']:>13.1f}" + (f"  ({r['fill_err_pct']:+.2f} % vs closed form)" if "fill_err_pct" in r else ""))
+    for n, kind, msg in flags:
+        print(f"  [{kind}] {n}: {msg}")
+    bad = [f for f in flags if f[1] in ("SLOWER", "VOLUME", "ACCURACY")]
+    print(f"{len(results)} case(s), {len(bad)} regression(s).")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Headless BundDesigner engine benchmarks.")
+    ap.add_argument("--suite", choices=("quick", "full"), default="quick")
+    ap.add_argument("--case", action="append", help="run only these case names")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--workers", type=int, default=0)
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--time-tol", type=float, default=TIME_TOL)
+    ap.add_argument("--out", help="write the full results as JSON here")
+    ap.add_argument("--trace-dir", help="per-case JSON-lines stage traces")
+    ap.add_argument("--cog-dir", help="also write the merged surface / fill as COGs here (per case)")
+    ap.add_argument("--in-process", action="store_true", help="don't isolate cases in child processes")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    a = ap.parse_args(argv)
+
+    if a.child:
+        case = json.loads(a.child)
+        trace = os.path.join(a.trace_dir, f"{case['name']}.jsonl") if a.trace_dir else None
+        print(json.dumps(run_case(case, a.repeat, a.workers, trace, a.cog_dir)))
+        return 0
+
+    cases = suite(a.suite)
+    if a.case:
+        cases = [c for c in cases if c["name"] in a.case]
+        if not cases:
+            ap.error("no such case(s); names: " + ", ".join(c["name"] for c in suite("full")))
+    if a.trace_dir:
+        os.makedirs(a.trace_dir, exist_ok=True)
+    results = []
+    for c in cases:
+        if a.in_process:
+            trace = os.path.join(a.trace_dir, f"{c['name']}.jsonl") if a.trace_dir else None
+            results.append(run_case(c, a.repeat, a.workers, trace, a.cog_dir))
+        else:
+            results.append(_run_isolated(c, a.repeat, a.workers, a.trace_dir, a.cog_dir))
+
+    baseline = None
+    if os.path.exists(a.baseline):
+        with open(a.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    flags = compare(results, baseline, time_tol=a.time_tol)
+    report(results, baseline, flags)
+
+    if a.out:
+        with open(a.out, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results, "flags": flags}, f, indent=1)
+    if a.update_baseline:
+        keep = dict((baseline or {}).get("cases", {}))
+        keep.update({r["name"]: {k: r[k] for k in ("wall_s", "cpu_s", "mcells_per_s", "peak_rss_mb", "stages",
+                                                   "features", "area_m2", "fill_m3", "strip_m3")}
+                     for r in results})
+        with open(a.baseline, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "cases": keep}, f, indent=1, sort_keys=True)
+        print(f"Baseline updated → {a.baseline}")
+        return 0
+    return 1 if any(f[1] in ("SLOWER", "VOLUME", "ACCURACY") for f in flags) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# bund_cache.py
+# Persistent, content-hashed cache of per-feature results for incremental re-runs.
+# Key = geometry WKB + the effective design parameters + a DEM fingerprint, so an edited
+# centreline (or changed crest/batter/taper/HAG/smoothing, or a new DEM) misses and is
+# recomputed while untouched features come straight back from disk.
+# No arcpy in here.
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from bund_engine import FeatureResult, Window
+
+CACHE_VERSION = 2   # bump when the engine changes what a feature produces
+
+
+def feature_key(wkb, params, dem_fingerprint):
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION}|".encode("utf-8"))
+    h.update(bytes(wkb or b""))
+    h.update(json.dumps(params, sort_keys=True, default=str).encode("utf-8"))
+    h.update(str(dem_fingerprint).encode("utf-8"))
+    return h.hexdigest()
+
+
+class FeatureCache(object):
+    # One .npz per feature (or chunk) key holding the window, bund/fill arrays and the per_rows
+    # record.
+    # Least-recently-used entries (by file mtime, refreshed on hit) are evicted above max_mb.
+    def __init__(self, folder, max_mb=2048.0):
+        self.folder = folder
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.npz")
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                meta = json.loads(str(z["meta"]))
+                piece = meta.get("piece")
+                res = FeatureResult(meta["oid"], meta["cid"], Window(*meta["window"]),
+                                    z["bund"], z["fill"], meta["row"], None, tuple(piece) if piece else None)
+        except Exception:
+            # unreadable / partial entry: treat as a miss and let it be rewritten
+            self.misses += 1
+            return None
+        os.utime(path, None)
+        self.hits += 1
+        return res
+
+    def put(self, key, res):
+        meta = {"oid": res.oid, "cid": res.cid, "window": list(res.window), "row": res.row,
+                "piece": list(res.piece) if res.piece else None}
+        path = self._path(key)
+        tmp = path + ".tmp.npz"
+        np.savez(tmp, bund=res.bund, fill=res.fill, meta=np.array(json.dumps(meta)))
+        os.replace(tmp, path)
+
+    def entries(self):
+        out = []
+        for nm in os.listdir(self.folder):
+            if nm.endswith(".npz") and not nm.endswith(".tmp.npz"):
+                p = os.path.join(self.folder, nm)
+                st = os.stat(p)
+                out.append((st.st_mtime, st.st_size, p))
+        return out
+
+    def evict(self):
+        ents = sorted(self.entries())
+        total = sum(sz for _, sz, _ in ents)
+        removed = 0
+        for _, sz, p in ents:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(p)
+                total -= sz
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def invalidate(self):
+        for _, _, p in self.entries():
+            try:
+                os.remove(p)
+            except OSError:
+                pass
@@ -0,0 +1,341 @@
+# bund_cog.py
+# Cloud-optimised GeoTIFF writer for the merged surface / fill products, fed straight from
+# the tile compositor's sink, so there are no scratch tiles, mosaic, CalculateStatistics or
+# BuildPyramids passes.
+#  • Blocks arrive in any order. Each is DEFLATE-compressed (floating-point predictor) and
+#    spooled as it comes. Blocks never written stay sparse (offset 0), which GDAL / ArcGIS
+#    read as NoData.
+#  • Overviews (2×, 4×, … until one block holds the raster) are NoData-aware means built
+#    from block sums / counts of the same data; an overview block is spooled as soon as
+#    all its source blocks are in.
+#  • Min / max / mean / std-dev are accumulated on the way and stored as GDAL metadata.
+#  • close() lays the file out as GDAL's COG driver does: header and every IFD first, then
+#    the blocks, smallest overview first and row-major within a level. BigTIFF only when
+#    the file would pass 4 GiB.
+# No arcpy in here.
+
+import math
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from bund_engine import Window
+
+# TIFF field types: name → (code, struct format, bytes)
+_TYPES = {"ASCII": (2, "s", 1), "SHORT": (3, "H", 2), "LONG": (4, "I", 4), "DOUBLE": (12, "d", 8),
+          "LONG8": (16, "Q", 8)}
+
+_GHOST = ("LAYOUT=IFDS_BEFORE_DATA\n"
+          "BLOCK_ORDER=ROW_MAJOR\n"
+          "KNOWN_INCOMPATIBLE_EDITION=NO\n ")
+
+
+def predict(a):
+    # TIFF floating-point predictor (3): each row's float32 bytes regrouped most-significant
+    # byte first, then byte-wise horizontal differences (wrapping)
+    h, w = a.shape
+    b = a.astype(">f4").view(np.uint8).reshape(h, w, 4).transpose(0, 2, 1).reshape(h, 4 * w)
+    d = b.copy()
+    d[:, 1:] -= b[:, :-1]
+    return d
+
+
+def unpredict(d, w):
+    # Inverse of predict → float32 (h, w)
+    h = d.shape[0]
+    b = np.cumsum(d, axis=1, dtype=np.uint8)
+    return b.reshape(h, 4, w).transpose(0, 2, 1).copy().view(">f4").reshape(h, w).astype("float32")
+
+
+def _halve(s, n):
+    # 2 × 2 block sums of value sums / counts (odd edges padded with empty cells)
+    R, C = -(-s.shape[0] // 2), -(-s.shape[1] // 2)
+    if s.shape != (2 * R, 2 * C):
+        s = np.pad(s, ((0, 2 * R - s.shape[0]), (0, 2 * C - s.shape[1])))
+        n = np.pad(n, ((0, 2 * R - n.shape[0]), (0, 2 * C - n.shape[1])))
+    return s.reshape(R, 2, C, 2).sum(axis=(1, 3)), n.reshape(R, 2, C, 2).sum(axis=(1, 3))
+
+
+def overview_factors(nrows, ncols, block):
+    # 2, 4, 8 … until the coarsest level fits in one block (as gdaladdo / the COG driver)
+    out, f = [], 2
+    while max(-(-nrows // (f // 2)), -(-ncols // (f // 2))) > block:
+        out.append(f)
+        f *= 2
+    return out
+
+
+class CogWriter(object):
+    # path      : output .tif (written to path + ".tmp" and swapped in on close)
+    # grid      : bund_engine.Grid of the DEM
+    # block     : block edge in cells (a power of two ≥ 16); written windows must be aligned
+    #             to it, e.g. TileCompositor tiles of a multiple of it
+    # nodata    : float32 NoData value (NaN cells are written as this)
+    # epsg      : EPSG code of the coordinate system (0 = none; pass wkt for an .aux.xml)
+    # geographic: True for a geographic (lat / long) coordinate system
+    # level     : zlib compression level
+    def __init__(self, path, grid, block=512, nodata=-9999.0, epsg=0, geographic=False, wkt=None,
+                 level=6, overviews=True):
+        if block < 16 or block & (block - 1):
+            raise ValueError(f"COG block must be a power of two of at least 16 (got {block})")
+        self.path = path
+        self.grid = grid
+        self.block = int(block)
+        self.nodata = float(nodata)
+        self.epsg = int(epsg or 0)
+        self.geographic = bool(geographic)
+        self.wkt = wkt
+        self.level = int(level)
+        self.factors = overview_factors(grid.nrows, grid.ncols, self.block) if overviews else []
+        # blocks per level (level 0 = full resolution)
+        self.shape = [(-(-grid.nrows // self.block), -(-grid.ncols // self.block))]
+        for f in self.factors:
+            self.shape.append((-(-(-(-grid.nrows // f)) // self.block), -(-(-(-grid.ncols // f)) // self.block)))
+        self._spool_path = path + ".spool"
+        self._spool = open(self._spool_path, "wb")
+        self._index = {}       # (level, bi, bj) -> (spool offset, bytes)
+        self._seen = set()     # full-resolution blocks written (sparse or not)
+        self._parts = {}       # (level, bi, bj) -> [(row, col, sums, counts)] still accumulating
+        self._got = {}         # (level, bi, bj) -> source blocks received
+        self._where = {}       # (level, bi, bj) -> file offset, set on close
+        self._n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._min = np.inf
+        self._max = -np.inf
+        self.blocks = 0        # full-resolution blocks stored (non-sparse)
+        self.bytes = 0
+
+    # ----- input -----
+
+    def write(self, win, arr):
+        # Window array (NaN = NoData) on block boundaries; blocks are spooled one by one
+        B = self.block
+        if win.row0 % B or win.col0 % B:
+            raise ValueError(f"window {tuple(win)} is not aligned to {B}-cell COG blocks")
+        for r in range(0, win.nrows, B):
+            for c in range(0, win.ncols, B):
+                key = ((win.row0 + r) // B, (win.col0 + c) // B)
+                if key not in self._seen:
+                    self._block(key, np.asarray(arr[r:r + B, c:c + B], dtype="float64"))
+
+    def fill(self, reader):
+        # Every full-resolution block not written yet from reader(Window) (e.g. the DEM
+        # under the merged surface), row-major so overview blocks complete as it goes
+        B = self.block
+        nbr, nbc = self.shape[0]
+        for bi in range(nbr):
+            for bj in range(nbc):
+                if (bi, bj) not in self._seen:
+                    r0, c0 = bi * B, bj * B
+                    win = Window(r0, c0, min(B, self.grid.nrows - r0), min(B, self.grid.ncols - c0))
+                    self._block((bi, bj), np.asarray(reader(win), dtype="float64"))
+
+    def _block(self, key, a):
+        self._seen.add(key)
+        ok = ~np.isnan(a)
+        n = int(ok.sum())
+        if n:
+            v = a[ok]
+            m = float(v.mean())
+            d = m - self._mean
+            tot = self._n + n
+            self._m2 += float(((v - m) ** 2).sum()) + d * d * self._n * n / tot
+            self._mean += d * n / tot
+            self._n = tot
+            self._min = min(self._min, float(v.min()))
+            self._max = max(self._max, float(v.max()))
+            self._store(0, key, a)
+        # overview contributions, halving this block's sums / counts level by level
+        s, cnt = np.where(ok, a, 0.0), ok.astype("int64")
+        B = self.block
+        for k, f in enumerate(self.factors, 1):
+            if s.size > 1:
+                s, cnt = _halve(s, cnt)
+            R, C = key[0] * B // f, key[1] * B // f
+            okey = (k, R // B, C // B)
+            if n:
+                self._parts.setdefault(okey, []).append((R % B, C % B, s, cnt))
+            self._got[okey] = self._got.get(okey, 0) + 1
+            if self._got[okey] == self._expected(k, okey[1], okey[2]):
+                self._finish(okey)
+
+    def _expected(self, k, oi, oj):
+        # full-resolution blocks under overview block (oi, oj) of level k
+        f = self.factors[k - 1]
+        nbr, nbc = self.shape[0]
+        return (min((oi + 1) * f, nbr) - oi * f) * (min((oj + 1) * f, nbc) - oj * f)
+
+    def _finish(self, okey):
+        self._got.pop(okey, None)
+        parts = self._parts.pop(okey, None)
+        if not parts:
+            return
+        B = self.block
+        s, cnt = np.zeros((B, B)), np.zeros((B, B), dtype="int64")
+        for r, c, ps, pc in parts:
+            h, w = min(ps.shape[0], B - r), min(ps.shape[1], B - c)
+            s[r:r + h, c:c + w] += ps[:h, :w]
+            cnt[r:r + h, c:c + w] += pc[:h, :w]
+        out = np.full((B, B), np.nan)
+        np.divide(s, cnt, out=out, where=cnt > 0)
+        self._store(okey[0], okey[1:], out)
+
+    def _store(self, k, key, a):
+        B = self.block
+        t = np.full((B, B), self.nodata, dtype="float32")
+        t[:a.shape[0], :a.shape[1]] = np.where(np.isnan(a), self.nodata, a)
+        data = zlib.compress(predict(t).tobytes(), self.level)
+        self._index[(k,) + tuple(key)] = (self._spool.tell(), len(data))
+        self._spool.write(data)
+        self.bytes += len(data)
+        self.blocks += k == 0
+
+    # ----- output -----
+
+    def stats(self):
+        # (min, max, mean, std-dev, valid %) of the full-resolution cells written
+        if not self._n:
+            return None
+        tot = self.grid.nrows * self.grid.ncols
+        return (self._min, self._max, self._mean, math.sqrt(self._m2 / self._n), 100.0 * self._n / tot)
+
+    def _metadata(self):
+        st = self.stats()
+        if st is None:
+            return None
+        names = ("MINIMUM", "MAXIMUM", "MEAN", "STDDEV", "VALID_PERCENT")
+        items = "".join(f'  <Item name="STATISTICS_{n}" sample="0">{v:.17g}</Item>\n' for n, v in zip(names, st))
+        return f"<GDALMetadata>\n{items}</GDALMetadata>\n"
+
+    def _tags(self, k, offsets, counts, big):
+        # Sorted tag list of level k's IFD
+        g, B = self.grid, self.block
+        f = self.factors[k - 1] if k else 1
+        off_t = "LONG8" if big else "LONG"
+        tags = [(254, "LONG", [1 if k else 0]),
+                (256, "LONG", [-(-g.ncols // f)]),
+                (257, "LONG", [-(-g.nrows // f)]),
+                (258, "SHORT", [32]),
+                (259, "SHORT", [8]),          # Adobe DEFLATE
+                (262, "SHORT", [1]),          # BlackIsZero
+                (277, "SHORT", [1]),
+                (284, "SHORT", [1]),
+                (317, "SHORT", [3]),          # floating-point predictor
+                (322, "SHORT", [B]),
+                (323, "SHORT", [B]),
+                (324, off_t, offsets),
+                (325, off_t, counts),
+                (339, "SHORT", [3])]          # IEEE float
+        if k == 0:
+            keys = [(1024, 0, 1, 2 if self.geographic else 1), (1025, 0, 1, 1)]   # model, PixelIsArea
+            if self.epsg:
+                keys.append((2048 if self.geographic else 3072, 0, 1, self.epsg))
+            tags += [(33550, "DOUBLE", [g.cellx, g.celly, 0.0]),
+                     (33922, "DOUBLE", [0.0, 0.0, 0.0, g.xmin, g.ymax, 0.0]),
+                     (34735, "SHORT", [1, 1, 0, len(keys)] + [v for kk in keys for v in kk])]
+            md = self._metadata()
+            if md:
+                tags.append((42112, "ASCII", md))
+        tags.append((42113, "ASCII", f"{self.nodata:g}"))
+        return tags
+
+    def _layout(self, big, first):
+        # → IFD bytes (all levels, starting at `first`) and data start, given block offsets
+        #   from self._where (level, bi, bj) -> file offset
+        blobs, at = [], first
+        nlev = len(self.shape)
+        for k in range(nlev):
+            nbr, nbc = self.shape[k]
+            offs, cnts = [], []
+            for bi in range(nbr):
+                for bj in range(nbc):
+                    e = self._index.get((k, bi, bj))
+                    offs.append(self._where.get((k, bi, bj), 0) if e else 0)
+                    cnts.append(e[1] if e else 0)
+            body, nxt_pos = _ifd(self._tags(k, offs, cnts, big), at, big)
+            end = at + len(body)
+            end += end % 2
+            if k < nlev - 1:
+                body = body[:nxt_pos] + struct.pack("<Q" if big else "<I", end) + body[nxt_pos + (8 if big else 4):]
+            blobs.append(body + b"\0" * (end - at - len(body)))
+            at = end
+        return b"".join(blobs), at
+
+    def close(self):
+        # Spool remaining overview blocks, lay the COG out and swap it in → stats() tuple
+        for okey in sorted(self._parts):
+            self._finish(okey)
+        self._spool.close()
+        order = [(k, bi, bj) for k in range(len(self.shape) - 1, -1, -1)
+                 for bi in range(self.shape[k][0]) for bj in range(self.shape[k][1])
+                 if (k, bi, bj) in self._index]
+        ghost = f"GDAL_STRUCTURAL_METADATA_SIZE={len(_GHOST):06d} bytes\n{_GHOST}".encode("ascii")
+        big = False
+        for big in (False, True):
+            head = 16 if big else 8
+            first = head + len(ghost)
+            first += first % 2
+            self._where = {}
+            ifds, data0 = self._layout(big, first)     # sizes only: offsets don't change lengths
+            at = data0
+            for key in order:
+                self._where[key] = at
+                at += self._index[key][1]
+            if big or at < 2 ** 32:
+                break
+        ifds, _ = self._layout(big, first)
+        hdr = (b"II+\0" + struct.pack("<HHQ", 8, 0, first)) if big else (b"II*\0" + struct.pack("<I", first))
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as out, open(self._spool_path, "rb") as sp:
+            out.write(hdr + ghost + b"\0" * (first - len(hdr) - len(ghost)))
+            out.write(ifds)
+            for key in order:
+                off, n = self._index[key]
+                sp.seek(off)
+                out.write(sp.read(n))
+        os.remove(self._spool_path)
+        os.replace(tmp, self.path)
+        if not self.epsg and self.wkt:
+            with open(self.path + ".aux.xml", "w", encoding="utf-8") as fh:
+                wkt = self.wkt.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+                fh.write(f"<PAMDataset>\n  <SRS>{wkt}</SRS>\n</PAMDataset>\n")
+        return self.stats()
+
+    def abort(self):
+        # Drop the spool without writing (e.g. the run failed)
+        if not self._spool.closed:
+            self._spool.close()
+        for p in (self._spool_path, self.path + ".tmp"):
+            if os.path.exists(p):
+                os.remove(p)
+
+
+def _ifd(tags, at, big):
+    # One IFD at file offset `at` with its out-of-line values after it → (bytes, position
+    # of the next-IFD pointer within them, left 0)
+    n = len(tags)
+    ent, inline = (20, 8) if big else (12, 4)
+    nxt_pos = (8 if big else 2) + n * ent
+    extra_at = at + nxt_pos + (8 if big else 4)
+    entries, extra = [], b""
+    for tag, typ, vals in tags:
+        code, fmt, size = _TYPES[typ]
+        if typ == "ASCII":
+            data = vals.encode("ascii") + b"\0"
+            count = len(data)
+        else:
+            count = len(vals)
+            data = struct.pack(f"<{count}{fmt}", *vals)
+        if len(data) <= inline:
+            val = data.ljust(inline, b"\0")
+        else:
+            if (extra_at + len(extra)) % 2:
+                extra += b"\0"
+            val = struct.pack("<Q" if big else "<I", extra_at + len(extra))
+            extra += data
+        entries.append(struct.pack("<HHQ" if big else "<HHI", tag, code, count) + val)
+    body = struct.pack("<Q" if big else "<H", n) + b"".join(entries) + b"\0" * (8 if big else 4) + extra
+    return body, nxt_pos
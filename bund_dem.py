@@ -0,0 +1,192 @@
+# bund_dem.py
+# Shared DEM access layer: fixed-size tiles served from an LRU block cache with a byte
+# budget. Evicted tiles can spill to .npy files that are re-opened memory-mapped, so
+# ground that neighbouring centrelines share is read from the source raster only once.
+# DemPyramid serves 2×, 4×, 8× … block-mean levels of the same DEM for preview runs.
+# No arcpy in here: the source is any reader(window) -> float array (NaN = NoData).
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from bund_engine import Grid, Window
+
+
+class DemTileCache(object):
+    # grid      : bund_engine.Grid of the DEM
+    # reader    : fn(Window) -> float64 array for that window (the expensive source read)
+    # tile      : tile edge in cells
+    # budget_mb : resident byte budget for in-memory tiles (LRU eviction above it)
+    # spill_dir : optional folder; evicted tiles are kept there and reloaded with mmap
+    def __init__(self, grid, reader, tile=512, budget_mb=512.0, spill_dir=None):
+        self.grid = grid
+        self.reader = reader
+        self.tile = int(tile)
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.spill_dir = spill_dir
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._lru = OrderedDict()   # (ti, tj) -> array
+        self._spilled = {}          # (ti, tj) -> .npy path
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.mmap_hits = 0
+        self.evictions = 0
+
+    def _tile_window(self, key):
+        ti, tj = key
+        r0, c0 = ti * self.tile, tj * self.tile
+        return Window(r0, c0, min(self.tile, self.grid.nrows - r0), min(self.tile, self.grid.ncols - c0))
+
+    def _get(self, key):
+        arr = self._lru.get(key)
+        if arr is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return arr
+        path = self._spilled.get(key)
+        if path is not None:
+            arr = np.load(path, mmap_mode="r")
+            self.mmap_hits += 1
+        else:
+            arr = np.asarray(self.reader(self._tile_window(key)), dtype="float64")
+            self.misses += 1
+        self._put(key, arr)
+        return arr
+
+    def _put(self, key, arr):
+        self._lru[key] = arr
+        self.nbytes += arr.nbytes
+        while self.nbytes > self.budget and len(self._lru) > 1:
+            k, old = self._lru.popitem(last=False)
+            self.nbytes -= old.nbytes
+            self.evictions += 1
+            if self.spill_dir and k not in self._spilled:
+                path = os.path.join(self.spill_dir, f"dem_{k[0]}_{k[1]}.npy")
+                np.save(path, np.asarray(old))
+                self._spilled[k] = path
+
+    def read(self, win):
+        # Assemble an arbitrary window from cached tiles; cells outside the DEM are NaN
+        out = np.full((win.nrows, win.ncols), np.nan)
+        if win.nrows <= 0 or win.ncols <= 0:
+            return out
+        t = self.tile
+        for ti in range(win.row0 // t, (win.row0 + win.nrows - 1) // t + 1):
+            for tj in range(win.col0 // t, (win.col0 + win.ncols - 1) // t + 1):
+                tw = self._tile_window((ti, tj))
+                r0, r1 = max(win.row0, tw.row0), min(win.row0 + win.nrows, tw.row0 + tw.nrows)
+                c0, c1 = max(win.col0, tw.col0), min(win.col0 + win.ncols, tw.col0 + tw.ncols)
+                if r0 >= r1 or c0 >= c1:
+                    continue
+                arr = self._get((ti, tj))
+                out[r0 - win.row0:r1 - win.row0, c0 - win.col0:c1 - win.col0] = \
+                    arr[r0 - tw.row0:r1 - tw.row0, c0 - tw.col0:c1 - tw.col0]
+        return out
+
+    def sample(self, x, y):
+        # Bilinear ground level at map points (ExtractValuesToPoints "INTERPOLATE"); falls back
+        # to the containing cell where a neighbour is NoData, NaN off the DEM.
+        g = self.grid
+        x = np.asarray(x, dtype="float64")
+        y = np.asarray(y, dtype="float64")
+        if x.size == 0:
+            return np.zeros(0)
+        fc = (x - g.xmin) / g.cellx - 0.5
+        fr = (g.ymax - y) / g.celly - 0.5
+        c0 = np.floor(fc).astype("int64")
+        r0 = np.floor(fr).astype("int64")
+        win = Window(int(r0.min()), int(c0.min()), int(r0.max() - r0.min()) + 2, int(c0.max() - c0.min()) + 2)
+        clipped = Window(max(win.row0, 0), max(win.col0, 0),
+                         min(win.row0 + win.nrows, g.nrows) - max(win.row0, 0),
+                         min(win.col0 + win.ncols, g.ncols) - max(win.col0, 0))
+        z = np.full((win.nrows, win.ncols), np.nan)
+        if clipped.nrows > 0 and clipped.ncols > 0:
+            z[clipped.row0 - win.row0:clipped.row0 - win.row0 + clipped.nrows,
+              clipped.col0 - win.col0:clipped.col0 - win.col0 + clipped.ncols] = self.read(clipped)
+        i = r0 - win.row0
+        j = c0 - win.col0
+        tr = fr - r0
+        tc = fc - c0
+        z00, z01, z10, z11 = z[i, j], z[i, j + 1], z[i + 1, j], z[i + 1, j + 1]
+        v = (z00 * (1 - tr) * (1 - tc) + z01 * (1 - tr) * tc + z10 * tr * (1 - tc) + z11 * tr * tc)
+        near = z[i + (tr >= 0.5), j + (tc >= 0.5)]
+        return np.where(np.isnan(v), near, v)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "mmap_hits": self.mmap_hits,
+                "evictions": self.evictions, "resident_mb": self.nbytes / (1024.0 * 1024.0)}
+
+
+# ---------- resolution pyramid ----------
+
+def coarse_grid(grid, factor):
+    # Same origin, cells `factor` times larger; a partial last row/column of blocks is kept
+    return Grid(grid.xmin, grid.ymax, grid.cellx * factor, grid.celly * factor,
+                -(-grid.ncols // factor), -(-grid.nrows // factor))
+
+
+def block_mean(arr, f):
+    # Mean of each f × f block ignoring NoData; NaN only where the whole block is NoData
+    nr, nc = arr.shape
+    R, C = -(-nr // f), -(-nc // f)
+    pad = np.full((R * f, C * f), np.nan)
+    pad[:nr, :nc] = arr
+    b = pad.reshape(R, f, C, f)
+    ok = ~np.isnan(b)
+    cnt = ok.sum(axis=(1, 3))
+    tot = np.where(ok, b, 0.0).sum(axis=(1, 3))
+    out = np.full((R, C), np.nan)
+    np.divide(tot, cnt, out=out, where=cnt > 0)
+    return out
+
+
+class DemPyramid(object):
+    # base      : DemTileCache of the full-resolution DEM (level 1)
+    # store_dir : optional folder; built tiles are saved there as .npy and reused by later
+    #             runs (key it by the DEM fingerprint so an edited DEM starts afresh)
+    # budget_mb : resident byte budget of each coarse level's own tile cache
+    # Level f (a power of two) is built lazily, tile by tile, as 2 × 2 block means of level
+    # f / 2 (a mean of means only in partial blocks at the DEM edge), so an 8× sketch run
+    # reads the base DEM once and later runs not at all.
+    def __init__(self, base, store_dir=None, budget_mb=128.0):
+        self.base = base
+        self.store_dir = store_dir
+        self.budget_mb = budget_mb
+        self._levels = {1: base}
+        self.built = 0
+        self.reused = 0
+
+    def grid(self, f):
+        return self.level(f).grid
+
+    def level(self, f):
+        f = int(f)
+        if f < 1 or f & (f - 1):
+            raise ValueError(f"pyramid level must be a power of two (got {f})")
+        dc = self._levels.get(f)
+        if dc is None:
+            finer = self.level(f // 2)
+            folder = os.path.join(self.store_dir, f"L{f}") if self.store_dir else None
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+
+            def reader(win, finer=finer, folder=folder):
+                path = os.path.join(folder, f"{win.row0}_{win.col0}_{win.nrows}_{win.ncols}.npy") if folder else None
+                if path and os.path.exists(path):
+                    self.reused += 1
+                    return np.load(path)
+                src = finer.read(Window(win.row0 * 2, win.col0 * 2, win.nrows * 2, win.ncols * 2))
+                arr = block_mean(src, 2)[:win.nrows, :win.ncols]
+                self.built += 1
+                if path:
+                    tmp = path + ".tmp.npy"
+                    np.save(tmp, arr)
+                    os.replace(tmp, path)
+                return arr
+
+            dc = self._levels[f] = DemTileCache(coarse_grid(self.base.grid, f), reader, tile=self.base.tile,
+                                                budget_mb=self.budget_mb)
+        return dc
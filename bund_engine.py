@@ -0,0 +1,575 @@
+# bund_engine.py
+# Headless NumPy design-surface engine used by BundDesigner_v5_2e.run_engine.
+# No arcpy in here: everything works on a DEM window (2-D float array, NaN = NoData)
+# plus the 1-D cell-centre coordinates of that window, so it can be exercised on
+# synthetic grids without ArcGIS.
+#  • Crest/mask distances are computed analytically from the centreline vertices
+#    (flat-ended buffer = union of segment rectangles + round joins), replacing
+#    Buffer + EucDistance + ExtractByMask.
+#  • Chainage-dependent crest RLs come from a 1-D profile evaluated at each cell's nearest
+#    point on the line (replacing GeneratePointsAlongLines + NaturalNeighbor).
+#  • Design/taper/maintain-crest/bund/fill follow the raster-algebra chain 1:1.
+#  • Long alignments run in overlapping chainage chunks (chunk_plan) so memory per job is
+#    bounded by the chunk, not by the line's bounding box.
+#  • Neighbouring features can run as one cluster job on a shared DEM window (run_cluster).
+
+import math
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+# ---------- grid / window geometry ----------
+
+Window = namedtuple("Window", "row0 col0 nrows ncols")
+
+FeatureSurface = namedtuple("FeatureSurface", "mask dist taper inside design bund fill")
+
+
+class Grid(object):
+    # Raster geometry of the DEM: top-left origin, cell sizes and shape.
+    def __init__(self, xmin, ymax, cellx, celly, ncols, nrows):
+        self.xmin = float(xmin)
+        self.ymax = float(ymax)
+        self.cellx = float(cellx)
+        self.celly = float(celly)
+        self.ncols = int(ncols)
+        self.nrows = int(nrows)
+
+    @property
+    def cell_area(self):
+        return abs(self.cellx * self.celly)
+
+    def window(self, xmin, ymin, xmax, ymax, pad=0.0):
+        c0 = int(math.floor((xmin - pad - self.xmin) / self.cellx))
+        c1 = int(math.ceil((xmax + pad - self.xmin) / self.cellx))
+        r0 = int(math.floor((self.ymax - (ymax + pad)) / self.celly))
+        r1 = int(math.ceil((self.ymax - (ymin - pad)) / self.celly))
+        c0, c1 = max(c0, 0), min(c1, self.ncols)
+        r0, r1 = max(r0, 0), min(r1, self.nrows)
+        return Window(r0, c0, max(r1 - r0, 0), max(c1 - c0, 0))
+
+    def extent(self, win):
+        # (xmin, ymin, xmax, ymax) of a window in map units
+        x0 = self.xmin + win.col0 * self.cellx
+        y1 = self.ymax - win.row0 * self.celly
+        return (x0, y1 - win.nrows * self.celly, x0 + win.ncols * self.cellx, y1)
+
+    def centres(self, win):
+        xs = self.xmin + (win.col0 + np.arange(win.ncols) + 0.5) * self.cellx
+        ys = self.ymax - (win.row0 + np.arange(win.nrows) + 0.5) * self.celly
+        return xs, ys
+
+
+def feature_reach(crest_w, batter, taper, extra_buf):
+    # Same processing-mask radius run_engine has always used
+    return (batter * 10.0) + (crest_w * 0.5) + max(taper, 0.0) + max(extra_buf, 0.0)
+
+
+def _span(coords, lo, hi):
+    # index range [i0, i1) of a monotonic coordinate vector falling inside [lo, hi]
+    if coords[0] <= coords[-1]:
+        return int(np.searchsorted(coords, lo, "left")), int(np.searchsorted(coords, hi, "right"))
+    neg = -coords
+    return int(np.searchsorted(neg, -hi, "left")), int(np.searchsorted(neg, -lo, "right"))
+
+
+# ---------- distance fields ----------
+
+def buffer_distances(xs, ys, parts, widths, chainage=False):
+    # Distance from every cell centre to the flat-ended buffer of the polyline for each
+    # half-width in `widths` (0 inside the buffer). Cells further than max(widths) from
+    # every segment stay +inf, which is all the callers need.
+    # chainage=True also returns the chainage of the nearest point on the line (measured
+    # along the parts in order, as measureOnLine), NaN where no segment is within reach.
+    reach = max(widths)
+    out = [np.full((len(ys), len(xs)), np.inf) for _ in widths]
+    if chainage:
+        near = np.full((len(ys), len(xs)), np.inf)
+        chain = np.full((len(ys), len(xs)), np.nan)
+    cum = 0.0
+    for pts in parts:
+        pts = np.asarray(pts, dtype="float64")
+        for k in range(len(pts) - 1):
+            (ax, ay), (bx, by) = pts[k], pts[k + 1]
+            L = math.hypot(bx - ax, by - ay)
+            if L <= 0.0:
+                continue
+            c0, c1 = _span(xs, min(ax, bx) - reach, max(ax, bx) + reach)
+            r0, r1 = _span(ys, min(ay, by) - reach, max(ay, by) + reach)
+            if c0 < c1 and r0 < r1:
+                tx, ty = (bx - ax) / L, (by - ay) / L
+                px = xs[None, c0:c1] - ax
+                py = ys[r0:r1, None] - ay
+                u = px * tx + py * ty
+                v = np.abs(py * tx - px * ty)
+                du = np.maximum(np.maximum(-u, u - L), 0.0)
+                for w, o in zip(widths, out):
+                    d = np.hypot(du, np.maximum(v - w, 0.0))
+                    np.minimum(o[r0:r1, c0:c1], d, out=o[r0:r1, c0:c1])
+                if chainage:
+                    d0 = np.hypot(du, v)
+                    better = d0 < near[r0:r1, c0:c1]
+                    near[r0:r1, c0:c1][better] = d0[better]
+                    chain[r0:r1, c0:c1][better] = (cum + np.clip(u, 0.0, L))[better]
+            cum += L
+        # round joins at interior vertices
+        for (vx, vy) in pts[1:-1]:
+            c0, c1 = _span(xs, vx - reach, vx + reach)
+            r0, r1 = _span(ys, vy - reach, vy + reach)
+            if c0 >= c1 or r0 >= r1:
+                continue
+            dv = np.hypot(xs[None, c0:c1] - vx, ys[r0:r1, None] - vy)
+            for w, o in zip(widths, out):
+                np.minimum(o[r0:r1, c0:c1], np.maximum(dv - w, 0.0), out=o[r0:r1, c0:c1])
+    if chainage:
+        return out, chain
+    return out
+
+
+def line_length(parts):
+    return float(sum(np.hypot(*np.diff(np.asarray(p, dtype="float64"), axis=0).T).sum() for p in parts if len(p) > 1))
+
+
+def stations(parts, step):
+    # Points every `step` along the line plus the end point (GeneratePointsAlongLines
+    # DISTANCE + END_POINTS): returns chainage, x, y arrays
+    total = line_length(parts)
+    ch = np.arange(0.0, total, max(step, 1e-9)) if total > 0 else np.zeros(1)
+    ch = np.append(ch, total) if total > 0 else ch
+    ats, vx, vy = [], [], []
+    cum = 0.0
+    for pts in parts:
+        pts = np.asarray(pts, dtype="float64")
+        at = cum + np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(pts, axis=0).T))])
+        ats.append(at)
+        vx.append(pts[:, 0])
+        vy.append(pts[:, 1])
+        cum = at[-1]
+    at = np.concatenate(ats)
+    return ch, np.interp(ch, at, np.concatenate(vx)), np.interp(ch, at, np.concatenate(vy))
+
+
+# Crest RL as a 1-D function of chainage; cells take the value at the chainage of their
+# nearest point on the line. hag_fallback (HAG modes) fills gaps with DEM + HAG, as the old
+# Con(IsNull(NaturalNeighbor(...)), dem + hag, ...) did.
+CrestProfile = namedtuple("CrestProfile", "chainage z hag_fallback")
+
+
+def gradient_profile(parts, start_h, end_h):
+    return CrestProfile(np.array([0.0, line_length(parts)]), np.array([float(start_h), float(end_h)]), None)
+
+
+def hag_profile(parts, step, sampler, hag):
+    # sampler(x, y) -> ground level at points (e.g. bund_dem.DemTileCache.sample)
+    ch, px, py = stations(parts, step)
+    z = np.asarray(sampler(px, py), dtype="float64") + float(hag)
+    ok = ~np.isnan(z)
+    return CrestProfile(ch[ok], z[ok], float(hag))
+
+
+def profile_surface(profile, chain, dem):
+    if profile.chainage.size:
+        cz = np.interp(np.nan_to_num(chain), profile.chainage, profile.z)
+        cz[np.isnan(chain)] = np.nan
+    else:
+        cz = np.full(chain.shape, np.nan)
+    if profile.hag_fallback is not None:
+        cz = np.where(np.isnan(cz), dem + profile.hag_fallback, cz)
+    return cz
+
+
+def end_distance(xs, ys, parts):
+    # Distance to the first and last vertex of the feature (FeatureVerticesToPoints BOTH_ENDS)
+    p0 = parts[0][0]
+    p1 = parts[-1][-1]
+    d0 = np.hypot(xs[None, :] - p0[0], ys[:, None] - p0[1])
+    d1 = np.hypot(xs[None, :] - p1[0], ys[:, None] - p1[1])
+    return np.minimum(d0, d1)
+
+
+# ---------- smoothing ----------
+
+_DISC_BANDS = 15     # row bands of the disc kernel: exact up to 7 cells radius, then approximated
+_DIRECT_R = 3        # disc radii summed directly as shifted windows (cheaper than the tables up to here)
+
+SMOOTH_KERNELS = ("disc", "box", "gaussian")
+
+
+def _sat(a, pad):
+    # Summed-area table of `a` zero-padded by `pad` cells, with a zero first row / column:
+    # S[i, j] = padded[:i, :j].sum(). The padding stands in for clipping at the edges.
+    s = np.zeros((a.shape[0] + 2 * pad + 1, a.shape[1] + 2 * pad + 1))
+    s[pad + 1:pad + 1 + a.shape[0], pad + 1:pad + 1 + a.shape[1]] = a
+    np.cumsum(s, axis=0, out=s)
+    np.cumsum(s, axis=1, out=s)
+    return s
+
+
+def _box(S, pad, r0, r1, c0, c1):
+    # Σ over rows i+r0 … i+r1 and columns j+c0 … j+c1 (clipped to the array) for every cell
+    # (i, j), from its summed-area table (|r0|, |r1|, |c0|, |c1| <= pad): four shifted slices
+    # whatever the box size
+    nr, nc = S.shape[0] - 2 * pad - 1, S.shape[1] - 2 * pad - 1
+    a, b = slice(pad + r0, pad + r0 + nr), slice(pad + r1 + 1, pad + r1 + 1 + nr)
+    c, d = slice(pad + c0, pad + c0 + nc), slice(pad + c1 + 1, pad + c1 + 1 + nc)
+    out = S[b, d] - S[a, d]
+    out -= S[b, c]
+    out += S[a, c]
+    return out
+
+
+def _disc_direct(acc, cnt, r):
+    # Disc sums as shifted windows of the zero-padded arrays, one per cell of the kernel
+    nr, nc = acc.shape
+    pad_v = np.zeros((nr + 2 * r, nc + 2 * r))
+    pad_n = np.zeros((nr + 2 * r, nc + 2 * r))
+    pad_v[r:r + nr, r:r + nc] = acc
+    pad_n[r:r + nr, r:r + nc] = cnt
+    acc = np.zeros((nr, nc))
+    cnt = np.zeros((nr, nc))
+    for dy in range(-r, r + 1):
+        for dx in range(-r, r + 1):
+            if dx * dx + dy * dy > r * r:
+                continue
+            acc += pad_v[r + dy:r + dy + nr, r + dx:r + dx + nc]
+            cnt += pad_n[r + dy:r + dy + nr, r + dx:r + dx + nc]
+    return acc, cnt
+
+
+def _disc_bands(r):
+    # Disc of radius r cells (cells with dx² + dy² <= r²) as boxes (dy0, dy1, half-width):
+    # one per row while that fits in _DISC_BANDS, else mirrored groups of rows, each as wide
+    # as its rows' mean half-width
+    w = [math.isqrt(r * r - dy * dy) for dy in range(r + 1)]
+    m = (_DISC_BANDS - 1) // 2
+    groups = [[dy] for dy in range(1, r + 1)] if r <= m else \
+        [list(g) for g in np.array_split(np.arange(1, r + 1), m)]
+    bands = [(0, 0, w[0])]
+    for g in groups:
+        hw = int(round(sum(w[dy] for dy in g) / len(g)))
+        bands += [(g[0], g[-1], hw), (-g[-1], -g[0], hw)]
+    return bands
+
+
+def _gauss_boxes(sigma, n=3):
+    # Radii of n successive box filters approximating a Gaussian of sigma cells
+    # (W. M. Wells / P. Kovesi box-size rule)
+    wl = int(math.floor(math.sqrt(12.0 * sigma * sigma / n + 1.0)))
+    wl -= 1 if wl % 2 == 0 else 0
+    wu = wl + 2
+    m = int(round((12.0 * sigma * sigma - n * wl * wl - 4 * n * wl - 3 * n) / (-4.0 * wl - 4.0)))
+    return [((wl if k < m else wu) - 1) // 2 for k in range(n)]
+
+
+def kernel_radius(radius_cells, kernel="disc"):
+    # Cells a smoothed value can reach: r, or the summed box radii of the Gaussian
+    r = int(radius_cells)
+    if r <= 0:
+        return 0
+    return sum(_gauss_boxes(r / 2.0)) if kernel == "gaussian" else r
+
+
+def focal_mean(arr, radius_cells, kernel="disc"):
+    # FocalStatistics(..., "MEAN", "DATA"): mean of the non-NaN cells in the neighbourhood,
+    # NaN only where it is all NoData. Small discs are summed directly; otherwise summed-area
+    # tables make the cost O(cells) per box, independent of the radius.
+    #   disc     : NbrCircle(r, "CELL") — cells whose centre lies within r cells (exact to
+    #              r = 7, then a _DISC_BANDS-box staircase of the circle)
+    #   box      : NbrRectangle(2r + 1, 2r + 1, "CELL")
+    #   gaussian : Gaussian weights with sigma = r / 2 (three box passes)
+    r = int(radius_cells)
+    if r <= 0:
+        return arr
+    if kernel not in SMOOTH_KERNELS:
+        raise ValueError(f"unknown smoothing kernel '{kernel}' (use one of {', '.join(SMOOTH_KERNELS)})")
+    valid = ~np.isnan(arr)
+    if not valid.any():
+        return arr
+    ref = float(arr[valid].mean())          # summed about the mean to keep the tables small
+    acc = np.where(valid, arr - ref, 0.0)
+    cnt = valid.astype("float64")
+    if kernel == "disc" and r <= _DIRECT_R:
+        acc, cnt = _disc_direct(acc, cnt, r)
+    elif kernel == "gaussian":
+        for rb in _gauss_boxes(r / 2.0):
+            if rb > 0:
+                acc = _box(_sat(acc, rb), rb, -rb, rb, -rb, rb)
+                cnt = _box(_sat(cnt, rb), rb, -rb, rb, -rb, rb)
+    else:
+        bands = [(-r, r, r)] if kernel == "box" else _disc_bands(r)
+        SV, SN = _sat(acc, r), _sat(cnt, r)
+        acc = np.zeros(arr.shape)
+        cnt = np.zeros(arr.shape)
+        for r0, r1, hw in bands:
+            acc += _box(SV, r, r0, r1, -hw, hw)
+            cnt += _box(SN, r, r0, r1, -hw, hw)
+    out = np.full(arr.shape, np.nan)
+    np.divide(acc, cnt, out=out, where=cnt > 0.5)     # counts are whole numbers: exact in the tables
+    return out + ref
+
+
+def smooth_cells(meters, cell):
+    return max(1, int(round(meters / max(cell, 0.0001)))) if meters and meters > 0 else 0
+
+
+def smooth(arr, meters, cell, kernel="disc"):
+    if meters and meters > 0:
+        return focal_mean(arr, smooth_cells(meters, cell), kernel)
+    return arr
+
+
+# ---------- design surface ----------
+
+def crest_buffer(crest_w, keep_crest, cell):
+    return crest_w / 2.0 + (cell * 0.5 if keep_crest else 0.0)
+
+
+class PreparedFeature(object):
+    # Distance fields (per crest half-width / reach), chainage and end distances of one
+    # feature on its DEM window, computed once and reused for any number of crest / batter /
+    # taper evaluations (run_engine, scenario sweeps, the target-volume solver).
+    def __init__(self, dem, xs, ys, parts, crest_bufs, reaches, chainage=False):
+        self.dem = dem
+        self.xs, self.ys, self.parts = xs, ys, parts
+        widths = sorted(set(crest_bufs) | set(reaches))
+        res = buffer_distances(xs, ys, parts, widths, chainage=chainage)
+        d, self.chain = res if chainage else (res, None)
+        self.dist = dict(zip(widths, d))
+        self._de = None
+
+    def end_distance(self):
+        if self._de is None:
+            self._de = end_distance(self.xs, self.ys, self.parts)
+        return self._de
+
+    def crest_field(self, crest_z):
+        if isinstance(crest_z, CrestProfile):
+            if self.chain is None:
+                raise ValueError("PreparedFeature built without chainage; cannot evaluate a CrestProfile.")
+            return profile_surface(crest_z, self.chain, self.dem)
+        return crest_z
+
+    def surface(self, crest_z, crest_buf, reach, batter, taper, keep_crest, cell,
+                smooth_crest=0.0, smooth_design=0.0, smooth_kernel="disc"):
+        dem = self.dem
+        mask = self.dist[reach] <= 0.0
+        dist = self.dist[crest_buf]
+
+        cz = np.where(mask, np.broadcast_to(np.asarray(self.crest_field(crest_z), dtype="float64"), dem.shape), np.nan)
+        cz = smooth(cz, smooth_crest, cell, smooth_kernel)
+
+        with np.errstate(invalid="ignore"):
+            design = cz - dist / batter
+            t = None
+            if taper > 0:
+                de = self.end_distance()
+                t = np.where(de >= taper, 1.0, de / taper)
+                design = dem + (design - dem) * t
+
+            above = design > dem
+            inside = mask & (dist <= 0.0) & ~np.isnan(dem) if keep_crest else np.zeros(dem.shape, bool)
+            bund = np.where(inside, cz, np.where(above, design, np.nan))
+            bund[~mask] = np.nan
+
+            if smooth_design and smooth_design > 0:
+                bund = smooth(bund, smooth_design, cell, smooth_kernel)
+                bund[~mask] = np.nan
+
+            fill = bund - dem
+        dist = np.where(mask, dist, np.nan)
+        design[~mask] = np.nan
+        return FeatureSurface(mask, dist, t, inside, design, bund, fill)
+
+
+def design_surface(dem, xs, ys, parts, crest_z, crest_w, batter, taper, keep_crest, reach, cell,
+                   smooth_crest=0.0, smooth_design=0.0, smooth_kernel="disc"):
+    # dem     : DEM window (NaN = NoData), shape (len(ys), len(xs))
+    # parts   : list of (n, 2) vertex arrays of the centreline
+    # crest_z : scalar crest RL, an array over the window, or a CrestProfile evaluated on the
+    #           chainage of each cell (before smoothing)
+    crest_buf = crest_buffer(crest_w, keep_crest, cell)
+    pf = PreparedFeature(dem, xs, ys, parts, [crest_buf], [reach], chainage=isinstance(crest_z, CrestProfile))
+    return pf.surface(crest_z, crest_buf, reach, batter, taper, keep_crest, cell,
+                      smooth_crest=smooth_crest, smooth_design=smooth_design, smooth_kernel=smooth_kernel)
+
+
+# ---------- fill accounting ----------
+
+def fill_stats(fill, cell_area, strip=0.0):
+    # Footprint = cells with a non-zero fill value (what Con(fill, 1) polygonised), so
+    # A = cells × cell area, V = Σ depth × cell area, S = A × strip depth
+    d = fill[~np.isnan(fill)]
+    d = d[d != 0.0]
+    A = float(d.size) * cell_area
+    V = float(d.sum()) * cell_area
+    return A, V, A * (strip if strip else 0.0)
+
+
+def merge_max(dst, dst_lab, src, label):
+    # In-place max-composite of a window (Con(IsNull..) / Con(src > dst) semantics: NaN
+    # loses, ties keep the existing value). With labels, a tie goes to the lower label, so
+    # the winner doesn't depend on the order windows arrive in.
+    take = ~np.isnan(src) & (np.isnan(dst) | (src > dst))
+    if dst_lab is not None:
+        take |= (src == dst) & (dst_lab > label)
+    dst[take] = src[take]
+    if dst_lab is not None:
+        dst_lab[take] = label
+    return take
+
+
+# ---------- long-alignment chunking ----------
+
+def pad_window(grid, win, ncells):
+    # win grown by ncells on every side, clipped to the grid
+    r0, c0 = max(win.row0 - ncells, 0), max(win.col0 - ncells, 0)
+    r1 = min(win.row0 + win.nrows + ncells, grid.nrows)
+    c1 = min(win.col0 + win.ncols + ncells, grid.ncols)
+    return Window(r0, c0, max(r1 - r0, 0), max(c1 - c0, 0))
+
+
+def smooth_margin(smooth_crest, smooth_design, cell, kernel="disc"):
+    # Cells a chunk must compute beyond its core so the focal means see full neighbourhoods
+    return kernel_radius(smooth_cells(smooth_crest, cell), kernel) + \
+        kernel_radius(smooth_cells(smooth_design, cell), kernel) + 1
+
+
+def chunk_plan(grid, parts, reach, max_cells):
+    # → [(chainage from, chainage to, core Window)]. A feature whose padded bounding window
+    # fits max_cells is one chunk; longer lines are cut into equal chainage segments, each
+    # core being its sub-line's box padded by reach (so neighbouring cores overlap by reach).
+    # Distances, chainage and end tapers are still taken from the whole line, so every core
+    # cell gets the same value it would get unchunked.
+    pad = reach + grid.cellx
+    pts = np.vstack([np.asarray(p, dtype="float64") for p in parts])
+    total = line_length(parts)
+    win = grid.window(pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max(), pad=pad)
+    if not max_cells or win.nrows * win.ncols <= max_cells or total <= 0:
+        return [(0.0, total, win)]
+    step = max(math.sqrt(max_cells) * grid.cellx - 2.0 * pad, pad)
+    n = int(math.ceil(total / step))
+    at = []
+    cum = 0.0
+    for p in parts:
+        p = np.asarray(p, dtype="float64")
+        a = cum + np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(p, axis=0).T))])
+        at.append(a)
+        cum = a[-1]
+    at = np.concatenate(at)
+    out = []
+    for k in range(n):
+        a, b = total * k / n, total * (k + 1) / n
+        inside = (at > a) & (at < b)
+        xs = np.concatenate([[np.interp(a, at, pts[:, 0]), np.interp(b, at, pts[:, 0])], pts[inside, 0]])
+        ys = np.concatenate([[np.interp(a, at, pts[:, 1]), np.interp(b, at, pts[:, 1])], pts[inside, 1]])
+        out.append((a, b, grid.window(xs.min(), ys.min(), xs.max(), ys.max(), pad=pad)))
+    return out
+
+
+def owned_mask(core, earlier):
+    # Cells of `core` not already covered by an earlier chunk's core: the chunks' owned cells
+    # partition the feature, so per-chunk areas/volumes add up to the feature totals
+    own = np.ones((core.nrows, core.ncols), bool)
+    for w in earlier:
+        r0, r1 = max(w.row0, core.row0), min(w.row0 + w.nrows, core.row0 + core.nrows)
+        c0, c1 = max(w.col0, core.col0), min(w.col0 + w.ncols, core.col0 + core.ncols)
+        if r0 < r1 and c0 < c1:
+            own[r0 - core.row0:r1 - core.row0, c0 - core.col0:c1 - core.col0] = False
+    return own
+
+
+# ---------- per-feature job (runs in-process or in a worker) ----------
+
+# piece: (k, n) for chunk k of an n-chunk feature; window is then the chunk's core
+FeatureResult = namedtuple("FeatureResult", "oid cid window bund fill row timing piece", defaults=(None, None))
+
+
+def run_feature(job):
+    # job: dict built by run_engine with the DEM window, crest surface and design knobs.
+    # Returns the feature's window arrays plus its per_rows record (A, V, S, datum appended)
+    # and (wall s, cpu s) of the work, measured where it ran. Chunk jobs ("core", "earlier",
+    # "piece") compute on their padded window, return the core, and count only the cells
+    # they own in the row.
+    w0, c0 = time.perf_counter(), time.process_time()
+    surf = design_surface(
+        job["dem"], job["xs"], job["ys"], job["parts"], job["crest_z"],
+        job["crest_w"], job["batter"], job["taper"], job["keep_crest"], job["reach"], job["cell"],
+        smooth_crest=job.get("smooth_crest", 0.0), smooth_design=job.get("smooth_design", 0.0),
+        smooth_kernel=job.get("smooth_kernel", "disc"),
+    )
+    win, bund, fill = job["window"], surf.bund, surf.fill
+    counted = fill
+    core = job.get("core")
+    if core is not None:
+        sl = (slice(core.row0 - win.row0, core.row0 - win.row0 + core.nrows),
+              slice(core.col0 - win.col0, core.col0 - win.col0 + core.ncols))
+        win, bund, fill = core, bund[sl], fill[sl]
+        counted = np.where(owned_mask(core, job.get("earlier", ())), fill, np.nan)
+    A, V, S = fill_stats(counted, job["cell_area"], job.get("strip", 0.0))
+    row = list(job["row"]) + [A, V, S, job.get("datum", "")]
+    timing = (time.perf_counter() - w0, time.process_time() - c0)
+    return FeatureResult(job["oid"], job["cid"], win, bund, fill, row, timing, job.get("piece"))
+
+
+def union_window(wins):
+    # Smallest window covering all of wins
+    r0, c0 = min(w.row0 for w in wins), min(w.col0 for w in wins)
+    r1 = max(w.row0 + w.nrows for w in wins)
+    c1 = max(w.col0 + w.ncols for w in wins)
+    return Window(r0, c0, r1 - r0, c1 - c0)
+
+
+def run_cluster(job):
+    # Neighbouring features on one shared DEM window (bund_index.batches): each member job
+    # (a run_feature job without dem / xs / ys) runs on its own view of the shared arrays.
+    # Only the window read is shared: distance fields are measured to each member's own
+    # centreline, so every member still runs its own buffer_distances pass.
+    # → list of FeatureResult in member order
+    win, dem, xs, ys = job["window"], job["dem"], job["xs"], job["ys"]
+    out = []
+    for m in job["members"]:
+        w = m["window"]
+        r, c = w.row0 - win.row0, w.col0 - win.col0
+        out.append(run_feature(dict(m, dem=dem[r:r + w.nrows, c:c + w.ncols], xs=xs[c:c + w.ncols],
+                                    ys=ys[r:r + w.nrows])))
+    return out
+
+
+def run_job(job):
+    return run_cluster(job) if "members" in job else run_feature(job)
+
+
+def map_features(jobs, workers=0, inflight=None):
+    # map_ordered over feature and cluster jobs, yielding one FeatureResult at a time
+    for res in map_ordered(run_job, jobs, workers, inflight):
+        if isinstance(res, list):
+            yield from res
+        else:
+            yield res
+
+
+def map_ordered(fn, jobs, workers=0, inflight=None):
+    # Lazily map fn over jobs and yield results in submission order. workers <= 1 runs inline;
+    # otherwise a process pool with at most `inflight` jobs queued, so memory stays bounded
+    # and the merge order (and therefore the output) is identical to the serial run.
+    # Jobs that are already a FeatureResult (e.g. from the re-run cache) pass straight through.
+    if not workers or workers <= 1:
+        for j in jobs:
+            yield j if isinstance(j, FeatureResult) else fn(j)
+        return
+    from concurrent.futures import Future, ProcessPoolExecutor
+    inflight = max(int(inflight or 2 * workers), 1)
+    with ProcessPoolExecutor(max_workers=int(workers)) as ex:
+        q = deque()
+        for j in jobs:
+            if isinstance(j, FeatureResult):
+                f = Future()
+                f.set_result(j)
+                q.append(f)
+            else:
+                q.append(ex.submit(fn, j))
+            if len(q) >= inflight:
+                yield q.popleft().result()
+        while q:
+            yield q.popleft().result()
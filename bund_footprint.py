@@ -0,0 +1,209 @@
+# bund_footprint.py
+# Footprint polygons traced straight from a feature's windowed fill mask, replacing
+# RasterToPolygon + Dissolve per feature.
+#  • Cell edges between footprint and non-footprint cells are linked into closed rings with
+#    the footprint on their right: outer rings come out clockwise and holes
+#    counter-clockwise in map view (the Esri ring convention), so one arcpy.Polygon takes
+#    them all.
+#  • Collinear corner runs are dropped; an optional Douglas–Peucker tolerance takes the
+#    cell staircase out of the outline.
+#  • Chunked features: the pieces' boundary edges are merged (shared edges cancel) before
+#    linking, so a feature split along its chainage still gets one outline.
+# No arcpy in here.
+
+import numpy as np
+
+# Unit edges per missing neighbour: (neighbour dr, dc) and the A → B corner offsets
+# (rA, cA, rB, cB) walked with the cell on the right
+_EDGES = (((-1, 0), (0, 0, 0, 1)),    # north: west → east
+          ((0, 1), (0, 1, 1, 1)),     # east: north → south
+          ((1, 0), (1, 1, 1, 0)),     # south: east → west
+          ((0, -1), (1, 0, 0, 0)))    # west: south → north
+
+
+def footprint_mask(fill):
+    # Cells Con(fill, 1) kept: non-NoData and non-zero fill
+    return ~np.isnan(fill) & (fill != 0.0)
+
+
+def boundary_edges(mask, row0=0, col0=0):
+    # Unit boundary edges of a cell mask, footprint on the right, in corner coordinates
+    # offset by (row0, col0) → (n, 6) int array: rA, cA, rB, cB, dr, dc
+    nr, nc = mask.shape
+    pm = np.zeros((nr + 2, nc + 2), bool)
+    pm[1:-1, 1:-1] = mask
+    out = []
+    for (nr_, nc_), (oar, oac, obr, obc) in _EDGES:
+        r, c = np.nonzero(mask & ~pm[1 + nr_:1 + nr_ + nr, 1 + nc_:1 + nc_ + nc])
+        r, c = r + row0, c + col0
+        out.append(np.column_stack([r + oar, c + oac, r + obr, c + obc,
+                                    np.full(r.size, obr - oar), np.full(r.size, obc - oac)]))
+    return np.vstack(out).astype("int64")
+
+
+def merge_edges(edge_sets):
+    # Boundary of the union of disjoint masks (e.g. the chunks of one feature): edges the
+    # pieces share appear once in each direction and cancel
+    e = np.vstack([x for x in edge_sets if len(x)]) if edge_sets else np.zeros((0, 6), "int64")
+    if len(edge_sets) <= 1 or len(e) == 0:
+        return e
+    fwd = np.ascontiguousarray(e[:, :4])
+    rev = np.ascontiguousarray(e[:, [2, 3, 0, 1]])
+    both = np.vstack([fwd, rev])
+    _, inv, cnt = np.unique(both, axis=0, return_inverse=True, return_counts=True)
+    inv = inv.ravel()
+    return e[cnt[inv[:len(e)]] == 1]
+
+
+def link_rings(edges):
+    # Link boundary edges into closed rings → list of (n, 2) int arrays of (row, col)
+    # corner coordinates (first == last), corners only (no collinear points)
+    if len(edges) == 0:
+        return []
+    ar, ac, br, bc, dr, dc = edges.T
+    n = ar.size
+
+    # Successor of each edge: the edge starting at its end corner. Where two footprint
+    # cells touch only diagonally two edges leave that corner; take the right turn, which
+    # keeps the cells in separate rings (4-connected, as RasterToPolygon does).
+    w = int(max(ac.max(), bc.max())) + 2
+    start = (ar - ar.min() + 1) * w + ac
+    end = (br - ar.min() + 1) * w + bc
+    order = np.argsort(start, kind="stable")
+    s_sorted = start[order]
+    lo = np.searchsorted(s_sorted, end, "left")
+    hi = np.searchsorted(s_sorted, end, "right")
+    nxt = order[lo]
+    two = np.flatnonzero(hi - lo > 1)
+    if two.size:
+        alt = order[lo[two] + 1]
+        # right turn of direction (dr, dc) in row/col space is (dc, -dr)
+        right = (dr[alt] == dc[two]) & (dc[alt] == -dr[two])
+        nxt[two] = np.where(right, alt, nxt[two])
+
+    seen = np.zeros(n, bool)
+    nxt = nxt.tolist()
+    rings = []
+    for e0 in range(n):
+        if seen[e0]:
+            continue
+        idx = []
+        e = e0
+        while not seen[e]:
+            seen[e] = True
+            idx.append(e)
+            e = nxt[e]
+        idx = np.asarray(idx)
+        # keep corners where the direction changes
+        turn = (dr[idx] != dr[np.roll(idx, 1)]) | (dc[idx] != dc[np.roll(idx, 1)])
+        k = idx[turn]
+        pts = np.column_stack([ar[k], ac[k]])
+        rings.append(np.vstack([pts, pts[:1]]))
+    return rings
+
+
+def trace_rings(mask):
+    # Rings of one mask in its own (row, col) corner coordinates
+    return link_rings(boundary_edges(mask))
+
+
+def _dp(pts, tol):
+    # Douglas–Peucker on an open polyline (iterative) → keep mask
+    keep = np.zeros(len(pts), bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        a, b = pts[i], pts[j]
+        seg = b - a
+        L = np.hypot(*seg)
+        rel = pts[i + 1:j] - a
+        if L > 0:
+            d = np.abs(rel[:, 0] * seg[1] - rel[:, 1] * seg[0]) / L
+        else:
+            d = np.hypot(rel[:, 0], rel[:, 1])
+        k = int(np.argmax(d))
+        if d[k] > tol:
+            m = i + 1 + k
+            keep[m] = True
+            stack += [(i, m), (m, j)]
+    return keep
+
+
+def ring_area(ring):
+    # Shoelace area (positive = counter-clockwise in the coordinate frame given)
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.dot(x[:-1], y[1:]) - np.dot(x[1:], y[:-1]))
+
+
+def simplify_ring(ring, tol):
+    # Douglas–Peucker on a closed ring, anchored at its first vertex and the vertex furthest
+    # from it; the original is kept if the result collapses or flips orientation
+    if tol <= 0 or len(ring) <= 4:
+        return ring
+    pts = ring[:-1]
+    far = int(np.argmax(np.hypot(*(pts - pts[0]).T)))
+    a = _dp(np.vstack([pts[:far + 1]]), tol)
+    b = _dp(np.vstack([pts[far:], pts[:1]]), tol)
+    out = np.vstack([pts[:far + 1][a], pts[far:][b[:-1]][1:], pts[:1]])
+    if len(out) < 4 or ring_area(out) * ring_area(ring) <= 0:
+        return ring
+    return out
+
+
+def _orient(ax, ay, bx, by, cx, cy):
+    return (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+
+
+def rings_cross(a, b, block=512):
+    # True if a segment of ring a properly crosses one of ring b (rings that only touch at a
+    # vertex, as at a pinch corner, don't count). Checked in blocks of a's segments.
+    if (a[:, 0].max() < b[:, 0].min() or b[:, 0].max() < a[:, 0].min()
+            or a[:, 1].max() < b[:, 1].min() or b[:, 1].max() < a[:, 1].min()):
+        return False
+    rx, ry, sx, sy = b[:-1, 0], b[:-1, 1], b[1:, 0], b[1:, 1]
+    for i in range(0, len(a) - 1, block):
+        p, q = a[i:i + block + 1][:-1], a[i + 1:i + block + 1]
+        px, py, qx, qy = p[:, :1], p[:, 1:], q[:, :1], q[:, 1:]
+        d1 = _orient(px, py, qx, qy, rx, ry)
+        d2 = _orient(px, py, qx, qy, sx, sy)
+        d3 = _orient(rx, ry, sx, sy, px, py)
+        d4 = _orient(rx, ry, sx, sy, qx, qy)
+        if ((d1 * d2 < 0) & (d3 * d4 < 0)).any():
+            return True
+    return False
+
+
+def map_rings(rings, xmin, ymax, cell, tol=0.0):
+    # (row, col) corner rings → map-coordinate rings (xmin / ymax = west / north edge of the
+    # corner frame), simplified to tol map units. Rings are simplified one by one, so a
+    # simplified ring that crosses another (a hole pushed over its outer ring) is put back
+    # to its exact outline until none cross.
+    exact = [np.column_stack([xmin + rc[:, 1] * cell, ymax - rc[:, 0] * cell]) for rc in rings]
+    out = [simplify_ring(r, tol) for r in exact]
+    if tol <= 0:
+        return out
+    simplified = {i for i, (r, e) in enumerate(zip(out, exact)) if r is not e}
+    while simplified:
+        bad = set()
+        for i in simplified:
+            for j in range(len(out)):
+                if j != i and rings_cross(out[i], out[j]):
+                    bad |= {i, j} & simplified
+        if not bad:
+            break
+        for i in bad:
+            out[i] = exact[i]
+        simplified -= bad
+    return out
+
+
+def footprint_rings(fill, x0, y0, cell, tol=0.0):
+    # Map-coordinate rings of one feature's footprint on its window
+    # x0, y0 : map x of the window's west edge and y of its north edge
+    # tol    : simplification tolerance in map units (0 = exact cell outline)
+    # → (rings, area_m2); the area is that of the exact outline (cells × cell area)
+    mask = footprint_mask(fill)
+    return map_rings(trace_rings(mask), x0, y0, cell, tol), float(mask.sum()) * cell * cell
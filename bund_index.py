@@ -0,0 +1,190 @@
+# bund_index.py
+# Spatial index over centreline segments, for overlap-aware batching and merge-by-ID.
+#  • STRtree: Sort-Tile-Recursive packed R-tree over segment envelopes, queried in
+#    vectorised batches (every query box descends the tree level by level together).
+#  • clusters(): features whose reach zones can touch (padded segment envelopes intersect)
+#    are joined into connected groups; batches() cuts those groups to a window-cell budget,
+#    so neighbouring bunds share one DEM window and one design job.
+#  • merge_by_id(): Dissolve(id, MAX stats, SINGLE_PART) in memory — lines of an ID that
+#    meet end to end are chained, disjoint ones stay separate features.
+# No arcpy in here.
+
+import math
+
+import numpy as np
+
+
+def segment_boxes(lines, pad=0.0):
+    # Envelopes of every segment of every line (a list of parts per line), grown by pad
+    # → (boxes (n, 4) xmin, ymin, xmax, ymax; owner (n,) line index)
+    boxes, owner = [], []
+    for i, parts in enumerate(lines):
+        for p in parts:
+            p = np.asarray(p, dtype="float64")
+            if len(p) == 1:
+                p = np.vstack([p, p])
+            a, b = p[:-1], p[1:]
+            boxes.append(np.column_stack([np.minimum(a[:, 0], b[:, 0]) - pad, np.minimum(a[:, 1], b[:, 1]) - pad,
+                                          np.maximum(a[:, 0], b[:, 0]) + pad, np.maximum(a[:, 1], b[:, 1]) + pad]))
+            owner.append(np.full(len(a), i))
+    if not boxes:
+        return np.zeros((0, 4)), np.zeros(0, dtype="int64")
+    return np.vstack(boxes), np.concatenate(owner).astype("int64")
+
+
+class STRtree(object):
+    # boxes: (n, 4) xmin, ymin, xmax, ymax. Leaves are packed `node` to a node after sorting
+    # into vertical slices by x and each slice by y; upper levels pack consecutive nodes.
+    def __init__(self, boxes, node=16):
+        boxes = np.asarray(boxes, dtype="float64").reshape(-1, 4)
+        self.node = int(node)
+        n = len(boxes)
+        if n:
+            cx = 0.5 * (boxes[:, 0] + boxes[:, 2])
+            cy = 0.5 * (boxes[:, 1] + boxes[:, 3])
+            per = self.node * int(math.ceil(math.sqrt(math.ceil(n / self.node))))
+            by_x = np.argsort(cx, kind="stable")
+            slab = np.empty(n, dtype="int64")
+            slab[by_x] = np.arange(n) // per
+            self.order = np.lexsort((cy, slab))
+        else:
+            self.order = np.zeros(0, dtype="int64")
+        self.levels = [boxes[self.order]]    # leaf boxes in tree order, then parents up to the root
+        while len(self.levels[-1]) > self.node:
+            b = self.levels[-1]
+            at = np.arange(0, len(b), self.node)
+            self.levels.append(np.column_stack([np.minimum.reduceat(b[:, 0], at), np.minimum.reduceat(b[:, 1], at),
+                                                np.maximum.reduceat(b[:, 2], at), np.maximum.reduceat(b[:, 3], at)]))
+
+    def query_pairs(self, qboxes):
+        # Every (query, box) pair whose envelopes intersect (touching counts)
+        # → (query indices, box indices), sorted by query
+        q = np.asarray(qboxes, dtype="float64").reshape(-1, 4)
+        top = self.levels[-1]
+        if not len(q) or not len(top):
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="int64")
+        qi = np.repeat(np.arange(len(q)), len(top))
+        ni = np.tile(np.arange(len(top)), len(q))
+        for lvl in range(len(self.levels) - 1, -1, -1):
+            b, qb = self.levels[lvl][ni], q[qi]
+            hit = (b[:, 0] <= qb[:, 2]) & (b[:, 2] >= qb[:, 0]) & (b[:, 1] <= qb[:, 3]) & (b[:, 3] >= qb[:, 1])
+            qi, ni = qi[hit], ni[hit]
+            if lvl:
+                # expand each surviving node into its children on the level below
+                size = len(self.levels[lvl - 1])
+                cnt = np.minimum((ni + 1) * self.node, size) - ni * self.node
+                start = np.repeat(ni * self.node - np.concatenate([[0], np.cumsum(cnt)[:-1]]), cnt)
+                qi = np.repeat(qi, cnt)
+                ni = start + np.arange(cnt.sum())
+        return qi, self.order[ni]
+
+    def query(self, box):
+        return np.sort(self.query_pairs([box])[1])
+
+
+def clusters(lines, reach):
+    # Connected groups of lines whose reach zones may overlap: a segment's zone lies in its
+    # envelope grown by reach, so two lines interact if grown envelopes intersect.
+    # → list of member index lists (ascending), ordered by first member
+    boxes, owner = segment_boxes(lines, reach)
+    parent = list(range(len(lines)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if len(boxes):
+        qi, bi = STRtree(boxes).query_pairs(boxes)
+        a, b = owner[qi], owner[bi]
+        keep = a < b
+        for i, j in np.unique(np.column_stack([a[keep], b[keep]]), axis=0):
+            ri, rj = find(int(i)), find(int(j))
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+    groups = {}
+    for i in range(len(lines)):
+        groups.setdefault(find(i), []).append(i)
+    return sorted(groups.values(), key=lambda g: g[0])
+
+
+def batches(lines, reach, grid, max_cells):
+    # clusters() cut so the union of a batch's windows (each line's envelope padded by
+    # reach + 1 cell, as chunk_plan) stays within max_cells; lines over the budget on their
+    # own run alone. → list of member index lists, ordered by first member
+    pad = reach + grid.cellx
+    wins = []
+    for parts in lines:
+        pts = np.vstack([np.asarray(p, dtype="float64") for p in parts])
+        wins.append(grid.window(pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max(), pad=pad))
+    out = []
+    for grp in clusters(lines, reach):
+        cur, box = [], None
+        for i in grp:
+            w = wins[i]
+            if not max_cells or w.nrows * w.ncols > max_cells:
+                out.append([i])
+                continue
+            u = (w.row0, w.col0, w.row0 + w.nrows, w.col0 + w.ncols)
+            if box is not None:
+                u = (min(u[0], box[0]), min(u[1], box[1]), max(u[2], box[2]), max(u[3], box[3]))
+                if (u[2] - u[0]) * (u[3] - u[1]) > max_cells:
+                    out.append(cur)
+                    cur, u = [], (w.row0, w.col0, w.row0 + w.nrows, w.col0 + w.ncols)
+            cur.append(i)
+            box = u
+        if cur:
+            out.append(cur)
+    return sorted(out, key=lambda g: g[0])
+
+
+# ---------- merge by ID ----------
+
+def chain_parts(parts, tol=1e-6):
+    # Join parts end-to-end where their end points meet; parts that don't touch stay apart
+    # (Dissolve SINGLE_PART on lines)
+    parts = [np.asarray(p, dtype="float64") for p in parts]
+    out = []
+    while parts:
+        cur = parts.pop(0)
+        grown = True
+        while grown:
+            grown = False
+            for i, p in enumerate(parts):
+                if np.hypot(*(p[0] - cur[-1])) <= tol:
+                    cur = np.vstack([cur, p[1:]])
+                elif np.hypot(*(p[-1] - cur[-1])) <= tol:
+                    cur = np.vstack([cur, p[::-1][1:]])
+                elif np.hypot(*(p[-1] - cur[0])) <= tol:
+                    cur = np.vstack([p, cur[1:]])
+                elif np.hypot(*(p[0] - cur[0])) <= tol:
+                    cur = np.vstack([p[::-1], cur[1:]])
+                else:
+                    continue
+                parts.pop(i)
+                grown = True
+                break
+        out.append(cur)
+    return out
+
+
+def merge_by_id(feats, carry=(), tol=1e-6):
+    # feats: dicts with "cid" and "parts" (+ the `carry` attributes). Per ID (first-seen
+    # order) touching lines are joined, disjoint ones stay separate features, and every
+    # output carries the MAX of each carry attribute over the ID (None ignored, as Dissolve's
+    # MAX statistic). Outputs are numbered "oid" 1, 2, … like a fresh feature class.
+    by = {}
+    for f in feats:
+        g = by.get(f["cid"])
+        if g is None:
+            g = by[f["cid"]] = dict(f, parts=[])
+        g["parts"].extend(f["parts"])
+        for k in carry:
+            vals = [v for v in (g.get(k), f.get(k)) if v is not None]
+            g[k] = max(vals) if vals else None
+    out = []
+    for g in by.values():
+        for pts in chain_parts(g["parts"], tol):
+            out.append(dict(g, parts=[pts], oid=len(out) + 1))
+    return out
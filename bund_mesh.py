@@ -0,0 +1,287 @@
+# bund_mesh.py
+# Closed bund solids straight from the in-memory bund / DEM arrays, replacing RasterTin on
+# the whole DEM + merged surface and ExtrudeBetween. Only cells inside the footprint are
+# meshed, so cost follows the bund area, not the DEM area.
+#  • Top (bund) and bottom (DEM) are heightfields on the cell corners of the footprint;
+#    vertical walls close the solid along every footprint boundary edge.
+#  • Error-bounded decimation: aligned square blocks whose corner heights stay within ztol
+#    of their bilinear patch (top and bottom) collapse to one fan; neighbours share every
+#    vertex along common edges, so the solid stays watertight.
+#  • Corners where two footprint cells touch only diagonally get one vertex per cell (as
+#    bund_footprint splits them when tracing), so every edge joins exactly two faces.
+#  • Writers for OBJ (also what Import3DFiles reads) and binary glTF (.glb).
+# No arcpy in here.
+
+import json
+import struct
+from collections import namedtuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from bund_engine import Window, merge_max
+
+# vertices: (n, 3) map x, y, z; faces: (m, 3) vertex indices, counter-clockwise seen from outside
+Mesh = namedtuple("Mesh", "vertices faces")
+
+
+# ---------- per-ID accumulation ----------
+
+def footprint_window(win, fill):
+    # Tight sub-window of `win` around the cells with fill > 0 (None when empty)
+    ok = ~np.isnan(fill) & (fill > 0.0)
+    if not ok.any():
+        return None, None
+    rows = np.flatnonzero(ok.any(1))
+    cols = np.flatnonzero(ok.any(0))
+    r0, r1, c0, c1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    return Window(win.row0 + r0, win.col0 + c0, r1 - r0, c1 - c0), (slice(r0, r1), slice(c0, c1))
+
+
+class SolidSet(object):
+    # Max-composite of the bund arrays per CentrelineID, cropped to the footprint of each
+    # feature as it arrives, so only bund-sized arrays are held until the solids are built.
+    def __init__(self):
+        self.items = {}   # cid -> [Window, bund array]
+
+    def add(self, cid, win, bund, fill):
+        sub, sl = footprint_window(win, fill)
+        if sub is None:
+            return
+        src = np.where(fill[sl] > 0.0, bund[sl], np.nan)
+        cur = self.items.get(cid)
+        if cur is None:
+            self.items[cid] = [sub, src.copy()]
+            return
+        w0, arr0 = cur
+        r0, c0 = min(w0.row0, sub.row0), min(w0.col0, sub.col0)
+        r1 = max(w0.row0 + w0.nrows, sub.row0 + sub.nrows)
+        c1 = max(w0.col0 + w0.ncols, sub.col0 + sub.ncols)
+        u = Window(r0, c0, r1 - r0, c1 - c0)
+        if u != w0:
+            arr = np.full((u.nrows, u.ncols), np.nan)
+            arr[w0.row0 - r0:w0.row0 - r0 + w0.nrows, w0.col0 - c0:w0.col0 - c0 + w0.ncols] = arr0
+            cur[:] = [u, arr]
+        w, arr = cur
+        merge_max(arr[sub.row0 - w.row0:sub.row0 - w.row0 + sub.nrows,
+                      sub.col0 - w.col0:sub.col0 - w.col0 + sub.ncols], None, src, 0)
+
+
+# ---------- heightfield solid ----------
+
+def _corner_heights(arr, mask):
+    # Mean of the (up to 4) footprint cells around each cell corner → (nr + 1, nc + 1)
+    nr, nc = arr.shape
+    s = np.zeros((nr + 2, nc + 2))
+    n = np.zeros((nr + 2, nc + 2))
+    s[1:-1, 1:-1] = np.where(mask, arr, 0.0)
+    n[1:-1, 1:-1] = mask
+    S = s[:-1, :-1] + s[1:, :-1] + s[:-1, 1:] + s[1:, 1:]
+    N = n[:-1, :-1] + n[1:, :-1] + n[:-1, 1:] + n[1:, 1:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(N > 0, S / N, np.nan)
+
+
+def _bilinear_error(Z, s, R, C):
+    # Max |corner height − bilinear patch of the block's 4 corners| per aligned s × s block
+    blk = sliding_window_view(Z, (s + 1, s + 1))[::s, ::s][:R, :C]
+    t = np.linspace(0.0, 1.0, s + 1)
+    v, u = t[:, None], t[None, :]
+    z00, z01 = blk[..., :1, :1], blk[..., :1, -1:]
+    z10, z11 = blk[..., -1:, :1], blk[..., -1:, -1:]
+    fit = z00 * (1 - v) * (1 - u) + z01 * (1 - v) * u + z10 * v * (1 - u) + z11 * v * u
+    return np.abs(blk - fit).max(axis=(-2, -1))
+
+
+def _leaves(mask, Zt, Zb, ztol, max_level):
+    # Quadtree leaves over the footprint: {level: (rows, cols) of leaf block indices}
+    ok = [mask]
+    if ztol and ztol > 0:
+        for k in range(1, max_level + 1):
+            s = 1 << k
+            R, C = mask.shape[0] // s, mask.shape[1] // s
+            if R == 0 or C == 0:
+                break
+            p = ok[-1]
+            kids = p[0:2 * R:2, 0:2 * C:2] & p[1:2 * R:2, 0:2 * C:2] & p[0:2 * R:2, 1:2 * C:2] & p[1:2 * R:2, 1:2 * C:2]
+            if not kids.any():
+                break
+            with np.errstate(invalid="ignore"):
+                fine = (_bilinear_error(Zt, s, R, C) <= ztol) & (_bilinear_error(Zb, s, R, C) <= ztol)
+            ok.append(kids & fine)
+    out = {}
+    for k, o in enumerate(ok):
+        leaf = o.copy()
+        if k + 1 < len(ok):
+            up = ok[k + 1]
+            R, C = up.shape
+            leaf[:2 * R, :2 * C] &= ~np.repeat(np.repeat(up, 2, 0), 2, 1)
+        out[k] = np.nonzero(leaf)
+    return out
+
+
+def _perimeter(s):
+    # Corner offsets (dr, dc) around an s × s block, counter-clockwise in map view
+    # (down the west side, east along the south, up the east side, west along the north)
+    i = np.arange(s)
+    dr = np.concatenate([i, np.full(s, s), s - i, np.zeros(s, int)])
+    dc = np.concatenate([np.zeros(s, int), i, np.full(s, s), s - i])
+    return dr, dc
+
+
+def heightfield_solid(top, bottom, x0, y0, cell, ztol=0.0, max_level=6):
+    # top / bottom : bund and DEM arrays on the same window (NaN = none); the solid covers
+    #                cells where top > bottom
+    # x0, y0       : map x of the window's west edge and y of its north edge
+    # ztol         : vertical tolerance of the decimation (0 = every cell)
+    with np.errstate(invalid="ignore"):
+        mask = ~np.isnan(top) & ~np.isnan(bottom) & (top > bottom)
+    if not mask.any():
+        return Mesh(np.zeros((0, 3)), np.zeros((0, 3), dtype="int64"))
+    nr, nc = mask.shape
+    Zt = _corner_heights(top, mask)
+    Zb = _corner_heights(bottom, mask)
+    leaves = _leaves(mask, Zt, Zb, ztol, max_level)
+
+    # Boundary edges of the footprint, oriented with the solid on their right:
+    # A → B corner pairs (rA, cA, rB, cB)
+    pm = np.zeros((nr + 2, nc + 2), bool)
+    pm[1:-1, 1:-1] = mask
+    edges = []
+    for (dr, dc), (ar, ac, br, bc) in (((-1, 0), (0, 0, 0, 1)), ((1, 0), (1, 1, 1, 0)),
+                                        ((0, -1), (1, 0, 0, 0)), ((0, 1), (0, 1, 1, 1))):
+        r, c = np.nonzero(mask & ~pm[1 + dr:1 + dr + nr, 1 + dc:1 + dc + nc])
+        edges.append((r + ar, c + ac, r + br, c + bc, ar == 0, br == 0))
+    er = np.concatenate([np.concatenate([e[0], e[2]]) for e in edges])
+    ec = np.concatenate([np.concatenate([e[1], e[3]]) for e in edges])
+
+    # Pinch corners: only two diagonal cells meet there. The cell below the corner gets its
+    # own vertex (alt), the cell above keeps the shared one.
+    nw, ne, sw, se = pm[:-1, :-1], pm[:-1, 1:], pm[1:, :-1], pm[1:, 1:]
+    pinch = (nw & se & ~ne & ~sw) | (ne & sw & ~nw & ~se)
+
+    # Corners in use: leaf corners + boundary edge ends
+    used = np.zeros((nr + 1, nc + 1), bool)
+    used[er, ec] = True
+    for k, (I, J) in leaves.items():
+        s = 1 << k
+        for dr in (0, s):
+            for dc in (0, s):
+                used[I * s + dr, J * s + dc] = True
+    vid = np.full((nr + 1, nc + 1), -1, dtype="int64")
+    alt = np.full((nr + 1, nc + 1), -1, dtype="int64")
+    ur, uc = np.nonzero(used)
+    vid[ur, uc] = np.arange(ur.size)
+    pr, pc = np.nonzero(pinch)
+    alt[pr, pc] = ur.size + np.arange(pr.size)
+    ur, uc = np.concatenate([ur, pr]), np.concatenate([uc, pc])
+    nv = ur.size
+    xs = x0 + uc * cell
+    ys = y0 - ur * cell
+    verts = [np.column_stack([xs, ys, Zt[ur, uc]]), np.column_stack([xs, ys, Zb[ur, uc]])]
+    nxt_id = 2 * nv
+    tris = []
+
+    def corner(r, c, below):
+        # Vertex of corner (r, c) as seen from the cell below it (below=True) or above it
+        return np.where(below & pinch[r, c], alt[r, c], vid[r, c])
+
+    # Top faces wind counter-clockwise from above; the bottom copy (DEM heights, offset by
+    # nv) is wound the other way
+    for k, (I, J) in leaves.items():
+        if I.size == 0:
+            continue
+        s = 1 << k
+        r, c = I * s, J * s
+        if s == 1:
+            a, b = corner(r, c, True), corner(r, c + 1, True)
+            cc, d = corner(r + 1, c + 1, False), corner(r + 1, c, False)
+            top_f = np.concatenate([np.column_stack([a, d, cc]), np.column_stack([a, cc, b])])
+            bot_f = top_f + nv
+        else:
+            # fan from the block centre over every used corner on the block perimeter
+            dr, dc = _perimeter(s)
+            br, bc = r[:, None] + dr[None, :], c[:, None] + dc[None, :]
+            li, pos = np.nonzero(used[br, bc])
+            ids = corner(br[li, pos], bc[li, pos], br[li, pos] == r[li])
+            start = np.flatnonzero(np.r_[True, li[1:] != li[:-1]])
+            nxt = np.arange(li.size) + 1
+            nxt[np.r_[start[1:], li.size] - 1] = start
+            cr, cc = r + s // 2, c + s // 2
+            cen_t = nxt_id + np.arange(I.size)
+            cen_b = cen_t + I.size
+            nxt_id += 2 * I.size
+            cx, cy = x0 + cc * cell, y0 - cr * cell
+            verts += [np.column_stack([cx, cy, Zt[cr, cc]]), np.column_stack([cx, cy, Zb[cr, cc]])]
+            top_f = np.column_stack([cen_t[li], ids, ids[nxt]])
+            bot_f = np.column_stack([cen_b[li], ids + nv, ids[nxt] + nv])
+        tris += [top_f, bot_f[:, ::-1]]
+
+    # Walls: top A, top B, bottom B / top A, bottom B, bottom A
+    for (ar, ac, br, bc, a_below, b_below) in edges:
+        tA, tB = corner(ar, ac, a_below), corner(br, bc, b_below)
+        tris.append(np.column_stack([tA, tB, tB + nv]))
+        tris.append(np.column_stack([tA, tB + nv, tA + nv]))
+
+    V = np.vstack(verts)
+    F = np.vstack(tris).astype("int64")
+    return Mesh(V, F)
+
+
+def mesh_volume(mesh):
+    # Signed volume of a closed, outward-wound mesh (divergence theorem)
+    if mesh.faces.size == 0:
+        return 0.0
+    v = mesh.vertices - mesh.vertices.min(0)
+    a, b, c = v[mesh.faces[:, 0]], v[mesh.faces[:, 1]], v[mesh.faces[:, 2]]
+    return float(np.einsum("ij,ij->i", a, np.cross(b, c)).sum() / 6.0)
+
+
+# ---------- writers ----------
+
+def write_obj(path, meshes, origin=(0.0, 0.0, 0.0)):
+    # meshes: [(name, Mesh)]; one object per mesh, coordinates minus `origin` (Z up)
+    ox, oy, oz = origin
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# BundDesigner solids\n")
+        if any(origin):
+            f.write(f"# origin {ox:.3f} {oy:.3f} {oz:.3f}\n")
+        off = 1
+        for name, m in meshes:
+            f.write(f"o {name}\n")
+            v = m.vertices - [ox, oy, oz]
+            f.write("".join(f"v {x:.3f} {y:.3f} {z:.3f}\n" for x, y, z in v))
+            f.write("".join(f"f {a} {b} {c}\n" for a, b, c in (m.faces + off)))
+            off += len(v)
+
+
+def write_glb(path, meshes, origin=(0.0, 0.0, 0.0)):
+    # Binary glTF 2.0: one node + mesh per solid. glTF is Y-up, so map (x, y, z) →
+    # (x − ox, z − oz, −(y − oy)); the origin is kept in the scene extras.
+    ox, oy, oz = origin
+    blob = bytearray()
+    views, accs, gmeshes, nodes = [], [], [], []
+    for name, m in meshes:
+        if m.faces.size == 0:
+            continue
+        p = np.column_stack([m.vertices[:, 0] - ox, m.vertices[:, 2] - oz, -(m.vertices[:, 1] - oy)]).astype("<f4")
+        idx = m.faces.astype("<u4").ravel()
+        for data, target in ((p.tobytes(), 34962), (idx.tobytes(), 34963)):
+            views.append({"buffer": 0, "byteOffset": len(blob), "byteLength": len(data), "target": target})
+            blob += data + b"\x00" * (-len(data) % 4)
+        accs.append({"bufferView": len(views) - 2, "componentType": 5126, "count": len(p), "type": "VEC3",
+                     "min": p.min(0).tolist(), "max": p.max(0).tolist()})
+        accs.append({"bufferView": len(views) - 1, "componentType": 5125, "count": int(idx.size), "type": "SCALAR"})
+        gmeshes.append({"name": name, "primitives": [{"attributes": {"POSITION": len(accs) - 2},
+                                                      "indices": len(accs) - 1, "mode": 4}]})
+        nodes.append({"name": name, "mesh": len(gmeshes) - 1})
+    doc = {"asset": {"version": "2.0", "generator": "BundDesigner"},
+           "scene": 0, "scenes": [{"nodes": list(range(len(nodes))), "extras": {"origin": [ox, oy, oz]}}],
+           "nodes": nodes, "meshes": gmeshes, "accessors": accs, "bufferViews": views,
+           "buffers": [{"byteLength": len(blob)}]}
+    js = json.dumps(doc, separators=(",", ":")).encode("utf-8")
+    js += b" " * (-len(js) % 4)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<III", 0x46546C67, 2, 12 + 8 + len(js) + 8 + len(blob)))
+        f.write(struct.pack("<II", len(js), 0x4E4F534A) + js)
+        f.write(struct.pack("<II", len(blob), 0x004E4942) + bytes(blob))
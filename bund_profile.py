@@ -0,0 +1,174 @@
+# bund_profile.py
+# Per-stage instrumentation for run_engine: wall time, CPU time, memory and work size
+# (cells / vertices) per stage and feature, written as a JSON-lines trace plus a summary
+# table. When disabled, stage() hands back one shared no-op context, so the hooks can
+# stay in the hot path.
+#  • Memory per stage: resident set at exit (rss_mb), its change over the stage
+#    (rss_delta_mb) and how far the stage pushed the process high-water mark up
+#    (peak_rise_mb). process_peak_mb is the process-lifetime peak when the record was made,
+#    not the stage's own. Stages measured elsewhere (add() from a worker) have no deltas.
+# No arcpy in here.
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+
+def _win_memory():
+    # PROCESS_MEMORY_COUNTERS of this process (Windows), or None
+    import ctypes
+    from ctypes import wintypes
+
+    class PMC(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+    pmc = PMC()
+    pmc.cb = ctypes.sizeof(PMC)
+    h = ctypes.windll.kernel32.GetCurrentProcess()
+    return pmc if ctypes.windll.psapi.GetProcessMemoryInfo(h, ctypes.byref(pmc), pmc.cb) else None
+
+
+def rss_mb():
+    # Current resident set size of this process in MB (None if the platform won't say:
+    # /proc/self/statm on Linux, the working set on Windows)
+    try:
+        if sys.platform == "win32":
+            pmc = _win_memory()
+            return pmc.WorkingSetSize / (1024.0 * 1024.0) if pmc else None
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0)
+    except Exception:
+        return None
+
+
+def peak_rss_mb():
+    # Peak resident set size of this process in MB (0.0 if the platform won't say)
+    try:
+        if sys.platform == "win32":
+            pmc = _win_memory()
+            return pmc.PeakWorkingSetSize / (1024.0 * 1024.0) if pmc else 0.0
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, KB elsewhere
+        return rss / (1024.0 * 1024.0) if sys.platform == "darwin" else rss / 1024.0
+    except Exception:
+        return 0.0
+
+
+def _mb(v, v0=0.0):
+    # Rounded MB figure (or difference), None when either side wasn't measured
+    return None if v is None or v0 is None else round(v - v0, 1)
+
+
+class _Stage(object):
+    # Mutable handle yielded by Profiler.stage so callers can report work done inside
+    __slots__ = ("cells", "vertices")
+
+    def __init__(self, cells=0, vertices=0):
+        self.cells = cells
+        self.vertices = vertices
+
+
+class _NullContext(object):
+    # Stateless no-op `with` target, so one instance serves every disabled stage
+    __slots__ = ()
+
+    def __enter__(self):
+        return _NULL_STAGE
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _Stage()
+_NULL_CTX = _NullContext()
+
+
+class Profiler(object):
+    # trace_path : JSON-lines file, one record per stage execution (opened lazily)
+    def __init__(self, enabled=False, trace_path=None, run_id=None):
+        self.enabled = bool(enabled)
+        self.trace_path = trace_path
+        self.run_id = run_id or time.strftime("%Y%m%dT%H%M%S")
+        self.records = []
+        self._fh = None
+
+    def stage(self, name, oid=None, cells=0, vertices=0):
+        if not self.enabled:
+            return _NULL_CTX
+        return self._stage(name, oid, cells, vertices)
+
+    @contextmanager
+    def _stage(self, name, oid, cells, vertices):
+        st = _Stage(cells, vertices)
+        m0, p0 = rss_mb(), peak_rss_mb()
+        w0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield st
+        finally:
+            self.add(name, oid, time.perf_counter() - w0, time.process_time() - c0, st.cells, st.vertices,
+                     mem=(m0, p0))
+
+    def add(self, name, oid, wall_s, cpu_s, cells=0, vertices=0, mem=None):
+        # Record a stage measured elsewhere (e.g. inside a worker process). mem: (RSS, peak
+        # RSS) in MB at stage entry, for the deltas; None = not measured here
+        if not self.enabled:
+            return
+        m1, p1 = rss_mb(), peak_rss_mb()
+        m0, p0 = mem if mem is not None else (None, None)
+        rec = {"run": self.run_id, "stage": name, "oid": oid, "wall_s": round(wall_s, 6),
+               "cpu_s": round(cpu_s, 6), "rss_mb": _mb(m1), "rss_delta_mb": _mb(m1, m0),
+               "peak_rise_mb": _mb(p1, p0), "process_peak_mb": _mb(p1),
+               "cells": int(cells), "vertices": int(vertices)}
+        self.records.append(rec)
+        if self.trace_path:
+            if self._fh is None:
+                self._fh = open(self.trace_path, "w", encoding="utf-8")
+            self._fh.write(json.dumps(rec) + "\n")
+
+    def summary(self):
+        # Per-stage aggregate rows in first-seen order
+        agg = {}
+        for r in self.records:
+            a = agg.setdefault(r["stage"], {"stage": r["stage"], "count": 0, "wall_s": 0.0, "wall_max_s": 0.0,
+                                            "cpu_s": 0.0, "rss_delta_max_mb": None, "peak_rise_mb": None,
+                                            "process_peak_mb": None, "cells": 0, "vertices": 0})
+            a["count"] += 1
+            a["wall_s"] += r["wall_s"]
+            a["wall_max_s"] = max(a["wall_max_s"], r["wall_s"])
+            a["cpu_s"] += r["cpu_s"]
+            if r["rss_delta_mb"] is not None:
+                a["rss_delta_max_mb"] = r["rss_delta_mb"] if a["rss_delta_max_mb"] is None \
+                    else max(a["rss_delta_max_mb"], r["rss_delta_mb"])
+            if r["peak_rise_mb"] is not None:
+                a["peak_rise_mb"] = round((a["peak_rise_mb"] or 0.0) + r["peak_rise_mb"], 1)
+            if r["process_peak_mb"] is not None:
+                a["process_peak_mb"] = max(a["process_peak_mb"] or 0.0, r["process_peak_mb"])
+            a["cells"] += r["cells"]
+            a["vertices"] += r["vertices"]
+        total = sum(a["wall_s"] for a in agg.values() if a["stage"] != "run") or 1.0
+        for a in agg.values():
+            a["share_pct"] = round(100.0 * a["wall_s"] / total, 1) if a["stage"] != "run" else 100.0
+        return list(agg.values())
+
+    def write_summary(self, path):
+        # rss_delta_max_mb: largest RSS change over one execution; peak_rise_mb: total rise in
+        # the process peak across executions; process_peak_mb: lifetime peak (not per stage)
+        cols = ["stage", "count", "wall_s", "wall_max_s", "cpu_s", "share_pct", "rss_delta_max_mb",
+                "peak_rise_mb", "process_peak_mb", "cells", "vertices"]
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(",".join(cols) + "\n")
+            for a in self.summary():
+                f.write(",".join("" if a[c] is None else (str(round(a[c], 6)) if isinstance(a[c], float) else str(a[c]))
+                                 for c in cols) + "\n")
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
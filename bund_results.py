@@ -0,0 +1,169 @@
+# bund_results.py
+# Typed columnar store for the result tables (BundVolumes, sweeps, solver runs).
+#  • Rows go into a NumPy structured array typed by the same (name, type, length) schema
+#    as the GDB table, so every export is one bulk call: CSV, Parquet (pyarrow, optional)
+#    and, in the arcpy script, arcpy.da.NumPyArrayToTable.
+#  • With a journal path each append lands in an .npy file straight away (records first,
+#    then the count in the header), so a run that dies part way leaves the rows done so far
+#    loadable with np.load — and a finished run leaves the whole table there for notebooks.
+#  • Nulls: NaN in DOUBLE columns, NULL_LONG in LONG columns, "" in TEXT columns. TEXT
+#    values longer than their field raise ValueError rather than being cut short.
+# No arcpy in here.
+
+import os
+
+import numpy as np
+
+NULL_LONG = np.iinfo("int32").min
+
+_MAGIC = b"\x93NUMPY\x01\x00"
+_COUNT_W = 12      # digits kept for the record count, so the header never changes length
+
+
+def dtype_of(schema):
+    # (name, "LONG" | "DOUBLE" | "TEXT", length) → structured dtype (TEXT width defaults to 255)
+    out = []
+    for name, tp, ln in schema:
+        if tp == "LONG":
+            out.append((name, "<i4"))
+        elif tp == "DOUBLE":
+            out.append((name, "<f8"))
+        elif tp == "TEXT":
+            out.append((name, f"<U{ln or 255}"))
+        else:
+            raise ValueError(f"Unknown field type '{tp}' for {name}.")
+    return np.dtype(out)
+
+
+def records(schema, rows):
+    # Rows (lists in schema order, None = null; short rows are null-padded) → structured array
+    dt = dtype_of(schema)
+    null = [NULL_LONG if tp == "LONG" else (np.nan if tp == "DOUBLE" else "") for _, tp, _ in schema]
+    text = [(k, name, dt[name].itemsize // 4) for k, (name, tp, _) in enumerate(schema) if tp == "TEXT"]
+    out = []
+    for r in rows:
+        r = list(r)
+        r = [n if v is None else v for v, n in zip(r + [None] * (len(null) - len(r)), null)]
+        for k, name, width in text:
+            if len(str(r[k])) > width:
+                raise ValueError(f"{name} '{r[k]}' is longer than its {width}-character field.")
+        out.append(tuple(r))
+    return np.array(out, dtype=dt)
+
+
+def fit_text(schema, rows):
+    # schema with every TEXT field widened to its longest value in rows, for tables only
+    # held in memory (never written to a fixed-width field)
+    out = []
+    for k, (name, tp, ln) in enumerate(schema):
+        if tp == "TEXT":
+            ln = max([ln or 255] + [len(str(r[k])) for r in rows if len(r) > k and r[k] is not None])
+        out.append((name, tp, ln))
+    return out
+
+
+def _header(dtype, n):
+    # .npy v1.0 header with a fixed-width count, padded to 64 bytes like numpy's own
+    d = "{'descr': %r, 'fortran_order': False, 'shape': (%s,), }" % (
+        np.lib.format.dtype_to_descr(dtype), str(n).rjust(_COUNT_W))
+    pad = -(len(_MAGIC) + 2 + len(d) + 1) % 64
+    d = (d + " " * pad + "\n").encode("latin1")
+    return _MAGIC + len(d).to_bytes(2, "little") + d
+
+
+class ResultStore(object):
+    # schema: [(name, type, length)] as _VOLUMES_SCHEMA. path: .npy journal (None = memory
+    # only). append() takes one row, extend() several; array() is the table so far.
+    def __init__(self, schema, path=None):
+        self.schema = list(schema)
+        self.columns = [s[0] for s in self.schema]
+        self.dtype = dtype_of(self.schema)
+        self.path = path
+        self.rows = 0
+        self._parts = []
+        self._fh = None
+        if path:
+            self._fh = open(path, "w+b")
+            self._fh.write(_header(self.dtype, 0))
+            self._fh.flush()
+
+    def append(self, row):
+        self.extend([row])
+
+    def extend(self, rows):
+        rec = records(self.schema, rows)
+        if not rec.size:
+            return
+        self._parts.append(rec)
+        self.rows += rec.size
+        if self._fh is not None:
+            self._fh.seek(0, os.SEEK_END)
+            self._fh.write(rec.tobytes())
+            self._fh.flush()
+            self._fh.seek(0)
+            self._fh.write(_header(self.dtype, self.rows))
+            self._fh.flush()
+
+    def array(self):
+        # One structured array of every row; edits to it (sort, filled-in columns) are what
+        # close() and the exports write
+        if len(self._parts) != 1:
+            self._parts = [np.concatenate(self._parts) if self._parts else np.zeros(0, dtype=self.dtype)]
+        return self._parts[0]
+
+    def sort(self, column):
+        a = self.array()
+        a[:] = a[np.argsort(a[column], kind="stable")]
+
+    def sum(self, column):
+        return float(np.nansum(self.array()[column]))
+
+    def close(self):
+        # Rewrite the journal from the final table (order and later column edits included)
+        if self._fh is None:
+            return
+        a = self.array()
+        self._fh.seek(0)
+        self._fh.write(_header(self.dtype, a.size))
+        self._fh.write(a.tobytes())
+        self._fh.truncate()
+        self._fh.close()
+        self._fh = None
+
+    # ---------- exports ----------
+
+    def to_csv(self, path):
+        # Header + one line per row; nulls are empty fields
+        a = self.array()
+        cols = []
+        for name, tp, _ in self.schema:
+            v = a[name].tolist()
+            if tp == "DOUBLE":
+                cols.append(["" if x != x else str(x) for x in v])
+            elif tp == "LONG":
+                cols.append(["" if x == NULL_LONG else str(x) for x in v])
+            else:
+                cols.append(v)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(",".join(self.columns) + "\n")
+            f.write("".join(",".join(r) + "\n" for r in zip(*cols)))
+
+    def to_parquet(self, path):
+        # Needs pyarrow; nulls become Parquet nulls
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet export needs pyarrow (pip install pyarrow).")
+        a = self.array()
+        cols = {}
+        for name, tp, _ in self.schema:
+            v = a[name]
+            mask = np.isnan(v) if tp == "DOUBLE" else ((v == NULL_LONG) if tp == "LONG" else None)
+            cols[name] = pa.array(v.tolist() if tp == "TEXT" else v, mask=mask)
+        pq.write_table(pa.table(cols), path)
+
+
+def load(path):
+    # The table of a journal (finished or from a run that stopped part way)
+    return np.load(path, allow_pickle=False)
@@ -0,0 +1,154 @@
+# bund_scenarios.py
+# Scenario sweeps on top of bund_engine: the distance fields, chainage and DEM window of
+# a feature are prepared once (PreparedFeature) and every crest / batter / HAG variant is
+# then a handful of array operations, instead of a full run_engine pass per scenario.
+# No arcpy in here.
+
+import itertools
+from collections import namedtuple
+
+import bund_engine as be
+
+# Parameters a scenario may override (anything else comes from the base design)
+SWEEP_KEYS = ("crest_w", "batter", "taper", "crest", "start_h", "end_h", "hag")
+
+
+def scenario_grid(values):
+    # {"batter": [2, 3], "hag": [1.0, 1.5]} → cartesian product as a list of dicts
+    bad = [k for k in values if k not in SWEEP_KEYS]
+    if bad:
+        raise ValueError(f"Unknown sweep parameter(s): {', '.join(bad)} (allowed: {', '.join(SWEEP_KEYS)})")
+    keys = list(values)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*[list(values[k]) for k in keys])]
+
+
+def effective(base, scenario):
+    p = dict(base)
+    p.update(scenario or {})
+    return p
+
+
+def scenario_reach(base, scenarios):
+    # Largest processing reach over the scenarios (sizes the shared DEM window)
+    return max(be.feature_reach(p["crest_w"], p["batter"], p["taper"], p["extra_buf"])
+               for p in [effective(base, s) for s in (scenarios or [{}])])
+
+
+def _ground_profile(parts, base, sampler):
+    # HAG modes: ground sampled once along the line; each scenario shifts it by its HAG
+    return be.hag_profile(parts, base["step"], sampler, 0.0)
+
+
+def crest_for(p, parts, ground=None):
+    # Crest RL spec of one effective parameter set (scalar or CrestProfile)
+    mode = p["mode"]
+    if mode == "CONST_ABS":
+        return float(p["crest"])
+    if mode == "GRADIENT":
+        return be.gradient_profile(parts, p["start_h"], p["end_h"])
+    hag = float(p["hag"])
+    return be.CrestProfile(ground.chainage, ground.z + hag, ground.hag_fallback + hag)
+
+
+def prepare(dem, xs, ys, parts, base, scenarios, sampler=None):
+    # → (PreparedFeature, ground profile or None) covering every scenario's crest half-width
+    # and reach in one distance pass
+    ps = [effective(base, s) for s in (scenarios or [{}])]
+    cell = base["cell"]
+    bufs = [be.crest_buffer(p["crest_w"], p["keep_crest"], cell) for p in ps]
+    reaches = [be.feature_reach(p["crest_w"], p["batter"], p["taper"], p["extra_buf"]) for p in ps]
+    need_chain = base["mode"] != "CONST_ABS"
+    pf = be.PreparedFeature(dem, xs, ys, parts, bufs, reaches, chainage=need_chain)
+    ground = None
+    if base["mode"] in ("HAG_FIELD", "HAG_VALUE"):
+        if sampler is None:
+            raise ValueError("HAG modes need a ground sampler for the crest profile.")
+        ground = _ground_profile(parts, base, sampler)
+    return pf, ground
+
+
+def evaluate(pf, ground, base, scenario, cell_area):
+    # One scenario on a prepared feature → (FeatureSurface, (A, V, S))
+    p = effective(base, scenario)
+    cell = p["cell"]
+    surf = pf.surface(
+        crest_for(p, pf.parts, ground),
+        be.crest_buffer(p["crest_w"], p["keep_crest"], cell),
+        be.feature_reach(p["crest_w"], p["batter"], p["taper"], p["extra_buf"]),
+        p["batter"], p["taper"], p["keep_crest"], cell,
+        smooth_crest=p.get("smooth_crest", 0.0), smooth_design=p.get("smooth_design", 0.0),
+        smooth_kernel=p.get("smooth_kernel", "disc"),
+    )
+    return surf, be.fill_stats(surf.fill, cell_area, p.get("strip", 0.0))
+
+
+def sweep_feature(dem, xs, ys, parts, base, scenarios, cell_area, sampler=None):
+    # base: mode ("CONST_ABS" / "GRADIENT" / "HAG_FIELD" / "HAG_VALUE"), crest, start_h, end_h,
+    #       hag, crest_w, batter, taper, keep_crest, extra_buf, cell, step, strip,
+    #       smooth_crest, smooth_design
+    # Returns [(effective params, (A, V, S)), ...] in scenario order.
+    pf, ground = prepare(dem, xs, ys, parts, base, scenarios, sampler)
+    out = []
+    for s in (scenarios or [{}]):
+        _, stats = evaluate(pf, ground, base, s, cell_area)
+        out.append((effective(base, s), stats))
+    return out
+
+
+# ---------- target-volume solver ----------
+
+SolveResult = namedtuple("SolveResult", "dz value iterations converged error")
+
+
+def level_scenario(base, dz):
+    # Shift the design level of a feature by dz: crest RL (Use Field), both ends of the
+    # gradient (Use Start/End) or the HAG (HAG modes)
+    mode = base["mode"]
+    if mode == "CONST_ABS":
+        return {"crest": float(base["crest"]) + dz}
+    if mode == "GRADIENT":
+        return {"start_h": float(base["start_h"]) + dz, "end_h": float(base["end_h"]) + dz}
+    return {"hag": float(base["hag"]) + dz}
+
+
+def solve_level(fn, target, tol, step=0.5, dz_tol=1e-3, max_iter=60, max_dz=1000.0):
+    # Find dz with fn(dz) ≈ target for a non-decreasing fn (fill volume vs crest level):
+    # bracket outwards from dz = 0 with doubling steps, then bisect. Stops when
+    # |fn - target| <= tol, the bracket is narrower than dz_tol, or max_iter evaluations.
+    it = 1
+    v0 = fn(0.0)
+    if abs(v0 - target) <= tol:
+        return SolveResult(0.0, v0, it, True, abs(v0 - target))
+    sgn = 1.0 if v0 < target else -1.0
+    a, va, s = 0.0, v0, float(step)
+    while True:
+        b = a + sgn * s
+        vb = fn(b)
+        it += 1
+        if abs(vb - target) <= tol:
+            return SolveResult(b, vb, it, True, abs(vb - target))
+        if (vb - target) * sgn > 0:
+            break
+        a, va, s = b, vb, s * 2.0
+        if it >= max_iter or abs(a) > max_dz:
+            return SolveResult(a, va, it, False, abs(va - target))
+    lo, hi = (a, b) if a < b else (b, a)
+    best = (a, va) if abs(va - target) < abs(vb - target) else (b, vb)
+    while it < max_iter and (hi - lo) > dz_tol:
+        m = 0.5 * (lo + hi)
+        vm = fn(m)
+        it += 1
+        if abs(vm - target) < abs(best[1] - target):
+            best = (m, vm)
+        if abs(vm - target) <= tol:
+            return SolveResult(m, vm, it, True, abs(vm - target))
+        if vm < target:
+            lo = m
+        else:
+            hi = m
+    return SolveResult(best[0], best[1], it, abs(best[1] - target) <= tol, abs(best[1] - target))
+
+
+def feature_volume_fn(pf, ground, base, cell_area):
+    # dz → FillVolume_m3 of one prepared feature (one vectorised evaluation per call)
+    return lambda dz: evaluate(pf, ground, base, level_scenario(base, dz), cell_area)[1][1]
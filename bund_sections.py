@@ -0,0 +1,124 @@
+# bund_sections.py
+# Chainage-stationed cross-sections and long-sections from a feature's DEM / bund window
+# arrays (no raster sampling afterwards). Stations use the same chainage as the crest
+# profiles (bund_engine.stations); every station × offset sample is taken in one
+# vectorised bilinear pass, and the sections are integrated into an average-end-area
+# volume to check the raster FillVolume_m3.
+# No arcpy in here.
+
+import numpy as np
+
+import bund_engine as be
+
+
+def station_frames(parts, spacing, chainage=None):
+    # Stations every `spacing` m (plus the end) → station no., chainage, x, y, unit tangent.
+    # chainage=(from, to, last) keeps the stations of one chunk: from <= ch < to (<= to
+    # for the last chunk)
+    ch, x, y = be.stations(parts, spacing)
+    st = np.arange(ch.size)
+    if chainage is not None:
+        a, b, last = chainage
+        keep = (ch >= a) & ((ch <= b) if last else (ch < b))
+        st, ch, x, y = st[keep], ch[keep], x[keep], y[keep]
+    at, vx, vy = [], [], []
+    cum = 0.0
+    for pts in parts:
+        pts = np.asarray(pts, dtype="float64")
+        a = cum + np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(pts, axis=0).T))])
+        at.append(a)
+        vx.append(pts[:, 0])
+        vy.append(pts[:, 1])
+        cum = a[-1]
+    at, vx, vy = np.concatenate(at), np.concatenate(vx), np.concatenate(vy)
+    # segment under each station; zero-length joins between parts are skipped by "right"
+    seg = np.clip(np.searchsorted(at, ch, "right") - 1, 0, at.size - 2)
+    dx, dy = vx[seg + 1] - vx[seg], vy[seg + 1] - vy[seg]
+    L = np.hypot(dx, dy)
+    L[L == 0] = 1.0
+    return st, ch, x, y, dx / L, dy / L
+
+
+def sample_window(arr, x0, y1, cell, x, y):
+    # Bilinear value of a window array at map points (x0 / y1 = west / north edge); falls
+    # back to the containing cell where a neighbour is NaN, NaN off the window
+    nr, nc = arr.shape
+    fc = (x - x0) / cell - 0.5
+    fr = (y1 - y) / cell - 0.5
+    c0 = np.floor(fc).astype("int64")
+    r0 = np.floor(fr).astype("int64")
+    tc, tr = fc - c0, fr - r0
+    pad = np.full((nr + 2, nc + 2), np.nan)
+    pad[1:-1, 1:-1] = arr
+    i = np.clip(r0 + 1, 0, nr)
+    j = np.clip(c0 + 1, 0, nc)
+    z00, z01, z10, z11 = pad[i, j], pad[i, j + 1], pad[i + 1, j], pad[i + 1, j + 1]
+    v = z00 * (1 - tr) * (1 - tc) + z01 * (1 - tr) * tc + z10 * tr * (1 - tc) + z11 * tr * tc
+    near = pad[np.clip(r0 + 1 + (tr >= 0.5), 0, nr + 1), np.clip(c0 + 1 + (tc >= 0.5), 0, nc + 1)]
+    out = np.where(np.isnan(v), near, v)
+    off = (fc < -0.5) | (fr < -0.5) | (fc > nc - 0.5) | (fr > nr - 0.5)
+    out[off] = np.nan
+    return out
+
+
+def sections(parts, dem, bund, x0, y1, cell, spacing, half_width, step=None, chainage=None):
+    # → (long, cross) column dicts for one feature (or one chunk of it, see station_frames)
+    #   long : Station, Chainage, X, Y, Ground, Design, Fill, EndArea_m2 (one row per station)
+    #   cross: Station, Chainage, Offset, X, Y, Ground, Design, Fill (station × offset rows;
+    #          offsets are + to the right of the direction of travel)
+    step = float(step or cell)
+    st, ch, sx, sy, tx, ty = station_frames(parts, spacing, chainage)
+    n = int(np.floor(half_width / step))
+    off = np.arange(-n, n + 1) * step
+    # right-hand normal of (tx, ty) is (ty, -tx)
+    X = sx[:, None] + off[None, :] * ty[:, None]
+    Y = sy[:, None] - off[None, :] * tx[:, None]
+    g = sample_window(dem, x0, y1, cell, X, Y)
+    d = sample_window(bund, x0, y1, cell, X, Y)
+    f = d - g
+    with np.errstate(invalid="ignore"):
+        area = np.where(np.isnan(f), 0.0, f).sum(1) * step
+    c = n
+    long = {"Station": st, "Chainage": ch, "X": sx, "Y": sy, "Ground": g[:, c], "Design": d[:, c],
+            "Fill": f[:, c], "EndArea_m2": area}
+    cross = {"Station": np.repeat(st, off.size), "Chainage": np.repeat(ch, off.size),
+             "Offset": np.tile(off, ch.size), "X": X.ravel(), "Y": Y.ravel(),
+             "Ground": g.ravel(), "Design": d.ravel(), "Fill": f.ravel()}
+    return long, cross
+
+
+def end_area_volume(chainage, area):
+    # Average-end-area volume Σ (A_i + A_i+1) / 2 × Δchainage
+    if chainage.size < 2:
+        return 0.0
+    return float(np.sum(0.5 * (area[1:] + area[:-1]) * np.diff(chainage)))
+
+
+class ColumnCsv(object):
+    # Append-only CSV fed with column dicts of equal-length arrays, one block per call, so
+    # tables stream to disk feature by feature. fmt: {column: printf format}; constant
+    # columns (e.g. IDs) can be passed as scalars. NaN is written as an empty field.
+    def __init__(self, path, columns, fmt=None):
+        self.path = path
+        self.columns = list(columns)
+        self.fmt = [(fmt or {}).get(c, "%.3f") for c in self.columns]
+        self.rows = 0
+        self._fh = open(path, "w", encoding="utf-8")
+        self._fh.write(",".join(self.columns) + "\n")
+
+    def append(self, cols):
+        n = max(np.size(v) for v in cols.values())
+        strs = []
+        for c, f in zip(self.columns, self.fmt):
+            v = np.broadcast_to(np.asarray(cols[c]), (n,))
+            s = np.char.mod(f, v).astype(object)
+            if v.dtype.kind == "f":
+                s[np.isnan(v)] = ""
+            strs.append(s)
+        self._fh.write("".join(",".join(r) + "\n" for r in zip(*strs)))
+        self.rows += n
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
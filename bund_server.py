@@ -0,0 +1,416 @@
+# bund_server.py
+# Resident design server: the DEM tile cache, the engine and a per-feature result cache
+# stay loaded between requests, so trying one centreline costs the design alone — no
+# arcpy import, extension checkout, DEM open or scratch setup per run.
+#  • asyncio, newline-delimited JSON over a localhost TCP socket (asyncio has no AF_UNIX
+#    server on Windows).
+#  • "design" requests: centreline GeoJSON + design parameters → per-feature volumes,
+#    merged totals (overlaps counted once), footprint polygons as GeoJSON and, on request,
+#    the merged bund surface tiles (base64 float32).
+#  • A semaphore caps designs running at once; with max_pending requests already waiting,
+#    new ones are answered "busy" straight away instead of queueing without bound.
+#  • request() / design() are the client side; BundDesigner_v5_2e.run_engine_remote is the
+#    run_engine-compatible shim.
+# No arcpy in here, except the --dem loader in main(), which reuses the script's readers.
+#
+# Usage:
+#   python bund_server.py --dem D:\dem\lidar_1m.tif [--port 8765] [--concurrency 1]
+#   python bund_server.py --synthetic sloped:3000:1.0     (headless, bund_bench terrain)
+
+import argparse
+import asyncio
+import base64
+import json
+import socket
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import bund_engine as be
+import bund_footprint as bf
+from bund_cache import feature_key
+from bund_dem import DemTileCache
+from bund_tiles import TileCompositor
+
+DEFAULT_PORT = 8765
+
+# Design parameters of a request (run_engine's knobs and tool parameters); per-feature
+# crest / HAG values come from the feature properties named by height_field / hag_field
+DEFAULTS = {
+    "design_mode": "Use Field", "start_h": None, "end_h": None, "hag_value": None,
+    "height_field": "height", "hag_field": "hag", "id_field": "CentrelineID",
+    "crest_w": 2.0, "keep_crest": False, "batter": 5.0, "taper": 0.0, "strip": 0.0,
+    "extra_buf": 20.0, "datum": "", "smooth_crest": 2.0, "smooth_design": 0.0,
+    "smooth_kernel": "disc", "footprint_simplify_cells": 1.0,
+}
+
+_MODES = {"Use Field": "CONST_ABS", "Use Start/End": "GRADIENT",
+          "Use HAG Field": "HAG_FIELD", "Use HAG Value": "HAG_VALUE"}
+
+
+# ---------- GeoJSON ----------
+
+def geojson_parts(geom):
+    # LineString / MultiLineString → list of (n, 2) float arrays (z dropped)
+    t = geom.get("type")
+    if t == "LineString":
+        lines = [geom["coordinates"]]
+    elif t == "MultiLineString":
+        lines = geom["coordinates"]
+    else:
+        raise ValueError(f"centreline geometry must be a LineString or MultiLineString (got {t})")
+    return [np.asarray(ln, dtype="float64")[:, :2] for ln in lines if len(ln) >= 2]
+
+
+def geojson_polygon(rings):
+    # Esri-ordered rings (outer clockwise) → GeoJSON Polygon / MultiPolygon with RFC 7946
+    # winding (outer counter-clockwise, holes clockwise); each hole goes with the outer
+    # ring that contains its first vertex
+    outers, holes = [], []
+    for r in rings:
+        (outers if bf.ring_area(r) < 0 else holes).append(r[::-1])
+    polys = [[o] for o in outers]
+    for h in holes:
+        x, y = h[0]
+        for p in polys:
+            if _inside(p[0], x, y):
+                p.append(h)
+                break
+    coords = [[r.tolist() for r in p] for p in polys]
+    if len(coords) == 1:
+        return {"type": "Polygon", "coordinates": coords[0]}
+    return {"type": "MultiPolygon", "coordinates": coords}
+
+
+def _inside(ring, x, y):
+    # Even-odd point-in-ring test
+    xs, ys = ring[:-1, 0], ring[:-1, 1]
+    xe, ye = np.roll(xs, -1), np.roll(ys, -1)
+    cross = (ys > y) != (ye > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xi = xs + (y - ys) * (xe - xs) / (ye - ys)
+    return bool(np.count_nonzero(cross & (x < xi)) % 2)
+
+
+def encode_tile(tw, arr):
+    return {"row0": tw.row0, "col0": tw.col0, "nrows": tw.nrows, "ncols": tw.ncols,
+            "data": base64.b64encode(np.ascontiguousarray(arr, dtype="<f4").tobytes()).decode("ascii")}
+
+
+def decode_tile(t):
+    # → (Window, float32 array) of a surface tile in a design response
+    win = be.Window(t["row0"], t["col0"], t["nrows"], t["ncols"])
+    return win, np.frombuffer(base64.b64decode(t["data"]), dtype="<f4").reshape(win.nrows, win.ncols)
+
+
+# ---------- design service ----------
+
+class DesignService(object):
+    # grid / dem_cache : the resident DEM (bund_engine.Grid + bund_dem.DemTileCache)
+    # dem_fp           : DEM fingerprint folded into the result-cache keys
+    # cache_entries    : per-feature results kept in memory (LRU); 0 = off
+    # Thread-safe: DEM reads and the result cache are behind locks, the NumPy design is not.
+    def __init__(self, grid, dem_cache, dem_fp="", cache_entries=256, tile=512):
+        self.grid = grid
+        self.dem_cache = dem_cache
+        self.dem_fp = dem_fp
+        self.cache_entries = int(cache_entries)
+        self.tile = int(tile)
+        self._results = OrderedDict()
+        self._dem_lock = threading.Lock()
+        self._res_lock = threading.Lock()
+        self.requests = 0
+        self.features = 0
+        self.hits = 0
+
+    def _read(self, win):
+        with self._dem_lock:
+            return self.dem_cache.read(win)
+
+    def _sample(self, x, y):
+        with self._dem_lock:
+            return self.dem_cache.sample(x, y)
+
+    def _cached(self, key, res=None):
+        with self._res_lock:
+            if res is None:
+                hit = self._results.get(key)
+                if hit is not None:
+                    self._results.move_to_end(key)
+                return hit
+            self._results[key] = res
+            while len(self._results) > self.cache_entries:
+                self._results.popitem(last=False)
+
+    def stats(self):
+        st = {"requests": self.requests, "features": self.features, "cache_hits": self.hits,
+              "cached_results": len(self._results)}
+        st.update({f"dem_{k}": v for k, v in self.dem_cache.stats().items()})
+        return st
+
+    def design(self, req):
+        # One design request (see DEFAULTS for "params") → response dict
+        t0 = time.perf_counter()
+        p = dict(DEFAULTS, **(req.get("params") or {}))
+        mode_name = p["design_mode"]
+        if mode_name not in _MODES:
+            raise ValueError(f"Unknown design_mode: {mode_name}")
+        mode = _MODES[mode_name]
+        fc = req.get("features") or {}
+        feats = fc.get("features", []) if isinstance(fc, dict) else list(fc)
+        g = self.grid
+        cell = g.cellx
+        reach = be.feature_reach(p["crest_w"], p["batter"], p["taper"], p["extra_buf"])
+        warnings = []
+
+        # Parse and plan: one window per feature around its buffered envelope
+        todo = []
+        for i, f in enumerate(feats):
+            props = f.get("properties") or {}
+            oid = int(props.get("oid", i + 1))
+            cid = str(props.get(p["id_field"], oid))
+            val = None
+            if mode in ("CONST_ABS", "HAG_FIELD"):
+                val = props.get(p["height_field"] if mode == "CONST_ABS" else p["hag_field"])
+                if val is None:
+                    warnings.append(f"OID {oid}: NULL {'design height' if mode == 'CONST_ABS' else 'HAG'}; skipped.")
+                    continue
+                val = float(val)
+            parts = geojson_parts(f["geometry"])
+            if not parts:
+                warnings.append(f"OID {oid}: empty centreline; skipped.")
+                continue
+            pts = np.vstack(parts)
+            win = g.window(pts[:, 0].min(), pts[:, 1].min(), pts[:, 0].max(), pts[:, 1].max(), pad=reach + cell)
+            if win.nrows == 0 or win.ncols == 0:
+                warnings.append(f"OID {oid}: centreline lies outside the DEM; skipped.")
+                continue
+            todo.append((oid, cid, parts, val, win))
+
+        layers = ("surface", "fill") if req.get("surface") else ("fill",)
+        tiles = []
+        comp = TileCompositor(g, layers, tile=self.tile, label_layer="fill",
+                              on_tile=lambda ly, tw, arr: tiles.append(encode_tile(tw, arr)) if ly == "surface" else None,
+                              backfill={"surface": self._read})
+        for t in todo:
+            comp.plan(t[4])
+
+        rows, footprints, ids = [], [], {}
+        tol = float(p["footprint_simplify_cells"]) * cell
+        for oid, cid, parts, val, win in todo:
+            kp = {k: p[k] for k in ("design_mode", "start_h", "end_h", "hag_value", "crest_w", "keep_crest", "batter",
+                                    "taper", "strip", "extra_buf", "datum", "smooth_crest", "smooth_design",
+                                    "smooth_kernel")}
+            kp.update(oid=oid, cid=cid, val=val)
+            key = feature_key(json.dumps([pt.tolist() for pt in parts]).encode("utf-8"), kp, self.dem_fp)
+            res = self._cached(key) if self.cache_entries else None
+            hit = res is not None
+            if not hit:
+                dem = self._read(win)
+                xs, ys = g.centres(win)
+                if mode == "CONST_ABS":
+                    crest_z = val
+                elif mode == "GRADIENT":
+                    crest_z = be.gradient_profile(parts, p["start_h"], p["end_h"])
+                else:
+                    hag = val if mode == "HAG_FIELD" else float(p["hag_value"])
+                    crest_z = be.hag_profile(parts, max(cell, 2 * cell), self._sample, hag)
+                res = be.run_feature({
+                    "oid": oid, "cid": cid, "window": win, "dem": dem, "xs": xs, "ys": ys, "parts": parts,
+                    "crest_z": crest_z, "crest_w": p["crest_w"], "batter": p["batter"], "taper": p["taper"],
+                    "keep_crest": p["keep_crest"], "reach": reach, "cell": cell, "cell_area": g.cell_area,
+                    "strip": p["strip"], "smooth_crest": p["smooth_crest"], "smooth_design": p["smooth_design"],
+                    "smooth_kernel": p["smooth_kernel"], "datum": p["datum"], "row": [oid, cid, be.line_length(parts), mode_name],
+                })
+                if self.cache_entries:
+                    self._cached(key, res)
+            self.hits += hit
+            A, V, S = res.row[-4:-1]
+            rows.append({"oid": oid, "CentrelineID": cid, "Length_m": res.row[2], "FillArea_m2": A,
+                         "FillVolume_m3": V, "StripVolume_m3": S, "cached": hit})
+            x0, _, _, y1 = g.extent(res.window)
+            rings, area = bf.footprint_rings(res.fill, x0, y1, cell, tol)
+            if rings:
+                footprints.append({"type": "Feature", "geometry": geojson_polygon(rings),
+                                   "properties": {"CentrelineID": cid, "Area_ha": area / 10000.0}})
+            lab = ids.setdefault(cid, len(ids) + 1)
+            comp.add(res.window, {"surface": res.bund, "fill": res.fill}, lab)
+        comp.close()
+
+        (id_A, id_V, id_S), (A, V, S) = comp.totals(g.cell_area, len(ids), p["strip"])
+        self.requests += 1
+        self.features += len(rows)
+        out = {
+            "ok": True, "features": rows, "warnings": warnings,
+            "totals": {"FillArea_m2": A, "FillVolume_m3": V, "StripVolume_m3": S},
+            "ids": {cid: {"FillArea_m2": float(id_A[lab]), "FillVolume_m3": float(id_V[lab]),
+                          "StripVolume_m3": float(id_S[lab])} for cid, lab in ids.items()},
+            "footprints": {"type": "FeatureCollection", "features": footprints},
+            "cell": cell, "elapsed_s": round(time.perf_counter() - t0, 4),
+        }
+        if req.get("surface"):
+            out["tiles"] = tiles
+            out["grid"] = {"xmin": g.xmin, "ymax": g.ymax, "cellx": g.cellx, "celly": g.celly}
+        return out
+
+
+# ---------- asyncio server ----------
+
+class DesignServer(object):
+    # concurrency : designs running at once (worker threads)
+    # max_pending : requests allowed to wait for a slot before new ones get "busy"
+    def __init__(self, service, host="127.0.0.1", port=DEFAULT_PORT, concurrency=1, max_pending=8):
+        self.service = service
+        self.host = host
+        self.port = int(port)
+        self.concurrency = max(int(concurrency), 1)
+        self.max_pending = max(int(max_pending), 0)
+        self.waiting = 0
+        self.running = 0
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency)
+        self._sem = None
+        self._stop = None
+
+    async def _dispatch(self, req):
+        op = req.get("op", "design")
+        if op == "ping":
+            return {"ok": True, "op": "ping"}
+        if op == "stats":
+            return dict(self.service.stats(), ok=True, running=self.running, waiting=self.waiting)
+        if op == "shutdown":
+            self._stop.set()
+            return {"ok": True, "op": "shutdown"}
+        if op != "design":
+            return {"ok": False, "error": f"unknown op '{op}'"}
+        if self._sem.locked() and self.waiting >= self.max_pending:
+            return {"ok": False, "error": "busy", "running": self.running, "waiting": self.waiting}
+        self.waiting += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.waiting -= 1
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, self.service.design, req)
+        finally:
+            self.running -= 1
+            self._sem.release()
+
+    async def _handle(self, reader, writer):
+        # One connection may send several requests, one JSON document per line
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                req = None
+                try:
+                    req = json.loads(line)
+                    resp = await self._dispatch(req)
+                except Exception as ex:
+                    resp = {"ok": False, "error": f"{type(ex).__name__}: {ex}"}
+                if isinstance(req, dict) and "id" in req:
+                    resp["id"] = req["id"]
+                writer.write(json.dumps(resp).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass    # client went away, or the server is shutting down
+        finally:
+            writer.close()
+
+    async def serve(self, ready=None):
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._stop = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port, limit=256 * 1024 * 1024)
+        self.port = server.sockets[0].getsockname()[1]
+        if ready is not None:
+            ready(self)
+        async with server:
+            await self._stop.wait()
+        self._pool.shutdown(wait=False)
+
+    def run(self, ready=None):
+        asyncio.run(self.serve(ready))
+
+
+# ---------- client ----------
+
+def request(payload, host="127.0.0.1", port=DEFAULT_PORT, timeout=300.0):
+    # One request / response round trip
+    with socket.create_connection((host, int(port)), timeout=timeout) as s:
+        s.sendall(json.dumps(payload).encode("utf-8") + b"\n")
+        with s.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("design server closed the connection")
+    return json.loads(line)
+
+
+def design(features, params=None, surface=False, **kw):
+    # features: GeoJSON FeatureCollection (or list of Features); raises on a failed design
+    resp = request({"op": "design", "features": features, "params": params or {}, "surface": bool(surface)}, **kw)
+    if not resp.get("ok"):
+        raise RuntimeError(f"design server: {resp.get('error')}")
+    return resp
+
+
+def parse_address(addr):
+    # "host:port" / "port" / "" → (host, port)
+    addr = str(addr or "").strip()
+    host, _, port = addr.rpartition(":")
+    return (host or "127.0.0.1"), int(port or DEFAULT_PORT)
+
+
+# ---------- entry point ----------
+
+def _arcpy_dem(path, dem_tile, dem_mb):
+    # DEM via the script tool's own readers (pays the arcpy import once, at start-up)
+    import arcpy
+    import BundDesigner_v5_2e as bd
+    dem = arcpy.Raster(path)
+    grid = bd._dem_grid(dem)
+    cache = DemTileCache(grid, lambda w: bd._read_window(dem, grid, w), tile=dem_tile, budget_mb=dem_mb)
+    return grid, cache, bd._dem_fingerprint(path, dem)
+
+
+def _synthetic_dem(spec, dem_tile, dem_mb):
+    # "kind[:size[:cell]]" → bund_bench terrain (headless testing / benchmarking)
+    import bund_bench as bb
+    kind, size, cell = (spec.split(":") + ["3000", "1.0"])[:3]
+    n, c = int(size), float(cell)
+    grid = be.Grid(0.0, n * c, c, c, n, n)
+    terrain = bb.SyntheticDem(kind, grid)
+    return grid, DemTileCache(grid, terrain.read, tile=dem_tile, budget_mb=dem_mb), f"synthetic:{spec}"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Resident bund design server")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--dem", help="DEM raster (read with arcpy)")
+    src.add_argument("--synthetic", help="synthetic terrain kind[:size[:cell]], e.g. sloped:3000:1.0")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=DEFAULT_PORT)
+    ap.add_argument("--concurrency", type=int, default=1, help="designs running at once")
+    ap.add_argument("--max-pending", type=int, default=8, help="waiting requests before 'busy'")
+    ap.add_argument("--dem-tile", type=int, default=512)
+    ap.add_argument("--dem-mb", type=float, default=1024.0)
+    ap.add_argument("--cache-entries", type=int, default=256, help="per-feature results kept; 0 = off")
+    a = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if a.dem:
+        grid, cache, fp = _arcpy_dem(a.dem, a.dem_tile, a.dem_mb)
+    else:
+        grid, cache, fp = _synthetic_dem(a.synthetic, a.dem_tile, a.dem_mb)
+    svc = DesignService(grid, cache, fp, a.cache_entries)
+    srv = DesignServer(svc, a.host, a.port, a.concurrency, a.max_pending)
+    srv.run(lambda s: print(f"bund design server on {s.host}:{s.port} "
+                            f"({grid.ncols} x {grid.nrows} DEM, ready in {time.perf_counter() - t0:.1f} s)", flush=True))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
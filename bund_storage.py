@@ -0,0 +1,184 @@
+# bund_storage.py
+# Stage–storage–area of the pond each bund impounds, from the merged design surface.
+#  • One priority-flood fill-and-spill from the pond's pit: cells are taken lowest-first
+#    from the flood front, so the pond grows in stage order until the front drops below
+#    the level reached (the spill point), or reaches the window edge / NoData that runs
+#    off it. NoData holes inside the DEM are walls. Dips and pits shallower than a noise
+#    tolerance are flooded over / passed on.
+#  • The flood is a heapq loop in Python, one push / pop per cell: about a second per
+#    million pond cells, which STORAGE_PAD_M keeps well within for one bund's pond.
+#  • The pond cells come out sorted by the stage that reaches them, so every stage of the
+#    curve is one searchsorted into cumulative sums (no flood per level).
+#  • Seeds: a given pour point, or probes either side of the bund's crest low point; the
+#    side holding the most water is taken as upstream.
+# No arcpy in here.
+
+import heapq
+from collections import namedtuple
+
+import numpy as np
+
+import bund_sections as bsec
+
+# Pond of one pit: pit cell (row, col) and elevation, spill stage, why it stops ("pass",
+# "edge", "nodata", "full"), and per pond cell (in flood order) the stage at which it is
+# reached (ascending) and its elevation
+Pond = namedtuple("Pond", "seed pit spill cause key z")
+
+_N4 = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def descend(z, r, c):
+    # Steepest 4-neighbour descent from (r, c) to a pit → (row, col), or None on NoData
+    nr, nc = z.shape
+    if not (0 <= r < nr and 0 <= c < nc) or np.isnan(z[r, c]):
+        return None
+    while True:
+        best, br, bc = z[r, c], r, c
+        for dr, dc in _N4:
+            rr, cc = r + dr, c + dc
+            if 0 <= rr < nr and 0 <= cc < nc and z[rr, cc] < best:
+                best, br, bc = z[rr, cc], rr, cc
+        if (br, bc) == (r, c):
+            return r, c
+        r, c = br, bc
+
+
+def edge_nodata(z):
+    # NoData cells joined to the window edge through NoData (off the DEM), as opposed to
+    # holes inside it: row and column sweeps spread the edge cells along NoData runs until
+    # nothing changes
+    nd = np.isnan(z)
+    out = np.zeros_like(nd)
+    out[0], out[-1], out[:, 0], out[:, -1] = nd[0], nd[-1], nd[:, 0], nd[:, -1]
+    n = -1
+    while n != int(out.sum()):
+        n = int(out.sum())
+        for o, m in ((out, nd), (out.T, nd.T)):
+            lab = np.cumsum(~m, axis=1) + (np.arange(m.shape[0]) * (m.shape[1] + 1))[:, None]
+            hit = np.zeros(lab.max() + 1, bool)
+            hit[lab[o]] = True
+            o |= m & hit[lab]
+    return out
+
+
+def flood(z, seed, tol=0.0):
+    # Priority-flood from a pit (4-connected, so thin diagonal crests don't leak) → Pond.
+    # The front is taken lowest-first; a cell more than `tol` below the level reached lies
+    # past a pass, so the pond spills there. Shallower dips (DEM noise) are flooded over.
+    # NoData running off the window is an outlet ("nodata"); NoData holes are walls.
+    nr, nc = z.shape
+    flat = z.ravel()
+    outlet = None
+    s = seed[0] * nc + seed[1]
+    seen = np.zeros(flat.size, bool)
+    seen[s] = True
+    heap = [(float(flat[s]), s)]
+    level = float(flat[s])
+    keys, zs = [], []
+    cause, past = "full", None
+    while heap:
+        zi, i = heapq.heappop(heap)
+        if zi == -np.inf:
+            cause = "nodata"
+            break
+        if zi < level - tol:
+            cause, past = "pass", divmod(i, nc)
+            break
+        level = max(level, zi)
+        keys.append(level)
+        zs.append(zi)
+        r, c = divmod(i, nc)
+        if r == 0 or c == 0 or r == nr - 1 or c == nc - 1:
+            cause = "edge"
+            break
+        for j in (i - nc, i + nc, i - 1, i + 1):
+            if not seen[j]:
+                seen[j] = True
+                zj = flat[j]
+                if zj != zj:
+                    if outlet is None:
+                        outlet = edge_nodata(z).ravel()
+                    if outlet[j]:
+                        heapq.heappush(heap, (-np.inf, j))
+                    continue
+                heapq.heappush(heap, (float(zj), j))
+    return Pond(seed, float(flat[s]), level, cause, np.asarray(keys), np.asarray(zs)), past
+
+
+def pond_from(z, r, c, tol=0.0):
+    # Water poured at (r, c): descend to a pit and flood it; a pond no deeper than `tol` is
+    # a noise pit, so the water moves on past its pass (always to a lower pit) → Pond or None
+    pit = descend(z, r, c)
+    pond = None
+    while pit is not None:
+        pond, past = flood(z, pit, tol)
+        if past is None or pond.spill - pond.pit > tol:
+            break
+        pit = descend(z, *past)
+    return pond
+
+
+def stage_storage(pond, stages, cell_area):
+    # Flooded area and stored volume at each stage (clipped to the spill stage): cells
+    # reached at or below the stage count, volume Σ (stage − z)
+    h = np.minimum(np.asarray(stages, dtype="float64"), pond.spill)
+    n = np.searchsorted(pond.key, h, "right")
+    cz = np.concatenate([[0.0], np.cumsum(pond.z)])
+    return n * cell_area, (h * n - cz[n]) * cell_area
+
+
+def storage_curve(pond, step, cell_area):
+    # → column dict Stage, Depth, Area_m2, Storage_m3 from the pit to the spill stage every
+    # `step` m (the spill stage itself always last)
+    stages = np.arange(pond.pit, pond.spill, step) if step > 0 else np.zeros(0)
+    stages = np.append(stages, pond.spill)
+    area, vol = stage_storage(pond, stages, cell_area)
+    return {"Stage": stages, "Depth": stages - pond.pit, "Area_m2": area, "Storage_m3": vol}
+
+
+def max_storage(pond, cell_area):
+    return float(stage_storage(pond, [pond.spill], cell_area)[1][0])
+
+
+def crest_low_point(lines, surf, x0, y1, cell, end_skip):
+    # Lowest surface point on the centrelines (station every cell), ignoring `end_skip` m at
+    # each line end where the crest tapers to ground → (x, y, tx, ty) or None
+    best = None
+    for parts in lines:
+        st, ch, x, y, tx, ty = bsec.station_frames(parts, cell)
+        keep = (ch >= end_skip) & (ch <= ch[-1] - end_skip)
+        if not keep.any():
+            keep[:] = True
+        zc = bsec.sample_window(surf, x0, y1, cell, x[keep], y[keep])
+        if np.isnan(zc).all():
+            continue
+        k = int(np.nanargmin(zc))
+        if best is None or zc[k] < best[0]:
+            best = (zc[k], x[keep][k], y[keep][k], tx[keep][k], ty[keep][k])
+    return None if best is None else best[1:]
+
+
+def seed_cells(surf, x0, y1, cell, points):
+    # Map points → (row, col) cells of the window, dropping those off it
+    nr, nc = surf.shape
+    out = []
+    for x, y in points:
+        r, c = int(np.floor((y1 - y) / cell)), int(np.floor((x - x0) / cell))
+        if 0 <= r < nr and 0 <= c < nc:
+            out.append((r, c))
+    return out
+
+
+def best_pond(surf, cells, cell_area, tol=0.0):
+    # Pour at each seed cell; the pond storing the most wins
+    best, best_v, pits = None, -1.0, set()
+    for r, c in cells:
+        p = pond_from(surf, r, c, tol)
+        if p is None or p.seed in pits:
+            continue
+        pits.add(p.seed)
+        v = max_storage(p, cell_area)
+        if v > best_v:
+            best, best_v = p, v
+    return best
@@ -0,0 +1,135 @@
+# bund_tiles.py
+# Tiled, memory-bounded max-composite for the merged surface / fill products.
+# No arcpy in here. Each feature's window arrays are max-merged into fixed-size tiles of
+# the DEM grid; tiles are created when first touched and handed to a sink (and dropped)
+# as soon as no planned feature still overlaps them, so resident memory follows the bund
+# footprint rather than feature count × DEM size.
+
+import numpy as np
+
+from bund_engine import Window, merge_max
+
+
+class TileCompositor(object):
+    # grid     : bund_engine.Grid of the DEM
+    # layers   : names of the max-merged layers, e.g. ("surface", "fill")
+    # on_tile  : sink(layer, tile_window, array) called once per finished tile
+    # backfill : optional {layer: fn(tile_window) -> array} filling NaN cells on flush
+    #            (the DEM backfill of the merged surface)
+    # label_layer : layer whose merge winner is tracked in an int label tile, reduced with
+    #            bincount into per-label/global fill totals as tiles finish
+    def __init__(self, grid, layers, tile=1024, on_tile=None, backfill=None, label_layer=None):
+        self.grid = grid
+        self.layers = tuple(layers)
+        self.tile = int(tile)
+        self.on_tile = on_tile
+        self.backfill = backfill or {}
+        self.label_layer = label_layer
+        self.tiles = {}        # (ti, tj) -> {layer: array, "_label": array}
+        self.pending = {}      # (ti, tj) -> planned features still to come
+        self.written = 0
+        self.peak_tiles = 0
+        self._cnt = np.zeros(1)
+        self._dep = np.zeros(1)
+
+    # ----- tile geometry -----
+
+    def tile_window(self, key):
+        ti, tj = key
+        r0, c0 = ti * self.tile, tj * self.tile
+        return Window(r0, c0, min(self.tile, self.grid.nrows - r0), min(self.tile, self.grid.ncols - c0))
+
+    def keys(self, win):
+        if win.nrows <= 0 or win.ncols <= 0:
+            return []
+        t = self.tile
+        return [(ti, tj)
+                for ti in range(win.row0 // t, (win.row0 + win.nrows - 1) // t + 1)
+                for tj in range(win.col0 // t, (win.col0 + win.ncols - 1) // t + 1)]
+
+    # ----- planning -----
+
+    def plan(self, win):
+        # Register a window that will be added later; its tiles are held until it arrives.
+        for k in self.keys(win):
+            self.pending[k] = self.pending.get(k, 0) + 1
+
+    # ----- merging -----
+
+    def add(self, win, arrays, label=0):
+        # arrays: {layer: window array}; missing layers are skipped
+        for k in self.keys(win):
+            tw = self.tile_window(k)
+            r0, r1 = max(win.row0, tw.row0), min(win.row0 + win.nrows, tw.row0 + tw.nrows)
+            c0, c1 = max(win.col0, tw.col0), min(win.col0 + win.ncols, tw.col0 + tw.ncols)
+            src = (slice(r0 - win.row0, r1 - win.row0), slice(c0 - win.col0, c1 - win.col0))
+            dst = (slice(r0 - tw.row0, r1 - tw.row0), slice(c0 - tw.col0, c1 - tw.col0))
+            t = self.tiles.get(k)
+            if t is None:
+                t = self.tiles[k] = {ly: np.full((tw.nrows, tw.ncols), np.nan) for ly in self.layers}
+                if self.label_layer:
+                    t["_label"] = np.zeros((tw.nrows, tw.ncols), dtype="int64")
+                self.peak_tiles = max(self.peak_tiles, len(self.tiles))
+            for ly, arr in arrays.items():
+                if arr is None or ly not in t:
+                    continue
+                lab = t["_label"][dst] if ly == self.label_layer else None
+                merge_max(t[ly][dst], lab, arr[src], label)
+        for k in self.keys(win):
+            if k in self.pending:
+                self.pending[k] -= 1
+                if self.pending[k] <= 0:
+                    del self.pending[k]
+                    self._flush(k)
+
+    def _flush(self, k):
+        t = self.tiles.pop(k, None)
+        if t is None:
+            return
+        tw = self.tile_window(k)
+        if self.label_layer:
+            self._reduce(t["_label"], t[self.label_layer])
+        for ly in self.layers:
+            arr = t[ly]
+            if np.isnan(arr).all():
+                continue
+            fn = self.backfill.get(ly)
+            if fn is not None:
+                hole = np.isnan(arr)
+                if hole.any():
+                    arr[hole] = fn(tw)[hole]
+            if self.on_tile is not None:
+                self.on_tile(ly, tw, arr)
+            self.written += 1
+
+    def close(self):
+        for k in sorted(self.tiles):
+            self._flush(k)
+        self.pending.clear()
+
+    # ----- labelled fill totals -----
+
+    def _reduce(self, labels, fill):
+        ok = ~np.isnan(fill) & (fill != 0.0) & (labels > 0)
+        if not ok.any():
+            return
+        lab = labels[ok]
+        n = max(int(lab.max()) + 1, self._cnt.size)
+        cnt = np.bincount(lab, minlength=n).astype("float64")
+        dep = np.bincount(lab, weights=fill[ok], minlength=n)
+        cnt[:self._cnt.size] += self._cnt
+        dep[:self._dep.size] += self._dep
+        self._cnt, self._dep = cnt, dep
+
+    def totals(self, cell_area, nlabels, strip=0.0):
+        # ((A, V, S) per label, (A, V, S) global) over the finished tiles, from the cell
+        # counts and fill depths _reduce accumulates as each tile is written
+        cnt = np.zeros(nlabels + 1)
+        dep = np.zeros(nlabels + 1)
+        m = min(cnt.size, self._cnt.size)
+        cnt[:m] = self._cnt[:m]
+        dep[:m] = self._dep[:m]
+        s = strip if strip else 0.0
+        A = cnt * cell_area
+        V = dep * cell_area
+        return (A, V, A * s), (float(A.sum()), float(V.sum()), float(A.sum()) * s)
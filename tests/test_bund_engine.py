@@ -0,0 +1,122 @@
+# bund_engine design surfaces on small synthetic grids with closed-form answers: a straight
+# bund on flat ground is a prism of crest (w × H) plus two b·H²/2 batters, cut square at the
+# ends; tapers scale it by the distance to the nearest end; chunked runs match unchunked.
+
+import numpy as np
+import pytest
+
+import bund_engine as be
+
+CELL = 1.0
+N = 100
+H, W, B = 2.0, 4.0, 2.0        # crest height, crest width, batter (kinks fall on cell edges)
+LINE = [np.array([[20.0, 50.0], [80.0, 50.0]])]
+L = 60.0
+
+
+def _flat():
+    grid = be.Grid(0.0, N * CELL, CELL, CELL, N, N)
+    xs, ys = grid.centres(be.Window(0, 0, N, N))
+    return grid, np.zeros((N, N)), xs, ys
+
+
+def _surface(keep_crest=False, taper=0.0):
+    grid, dem, xs, ys = _flat()
+    reach = be.feature_reach(W, B, taper, 0.0)
+    return grid, xs, ys, be.design_surface(dem, xs, ys, LINE, H, W, B, taper, keep_crest, reach, CELL)
+
+
+def test_flat_prism_volume_and_area():
+    grid, _, _, surf = _surface()
+    A, V, _ = be.fill_stats(surf.fill, grid.cell_area)
+    assert V == pytest.approx(L * (W * H + B * H * H), abs=1e-9)
+    assert A == pytest.approx(L * (W + 2 * B * H), abs=1e-9)
+
+
+def test_flat_prism_cross_section():
+    _, _, ys, surf = _surface()
+    col = surf.fill[:, 50]                     # x = 50.5, mid-line
+    v = np.abs(ys - 50.0)
+    expect = H - np.maximum(v - W / 2, 0.0) / B
+    on = expect > 0
+    np.testing.assert_allclose(col[on], expect[on])
+    assert np.isnan(col[~on]).all()
+
+
+def test_square_ends():
+    _, xs, _, surf = _surface()
+    built = ~np.isnan(surf.fill).all(axis=0)
+    np.testing.assert_array_equal(built, (xs > 20.0) & (xs < 80.0))
+
+
+def test_keep_crest_widens_crest_by_one_cell():
+    grid, _, ys, surf = _surface(keep_crest=True)
+    A, V, _ = be.fill_stats(surf.fill, grid.cell_area)
+    assert V == pytest.approx(L * ((W + CELL) * H + B * H * H), abs=1e-9)
+    assert A == pytest.approx(L * (W + 2 * B * H), abs=1e-9)
+    crest = np.abs(ys - 50.0) <= W / 2 + CELL / 2
+    assert (surf.inside[:, 50] == crest).all()
+    np.testing.assert_array_equal(surf.bund[crest, 50], H)
+
+
+def test_keep_crest_off_has_no_inside_cells():
+    _, _, _, surf = _surface(keep_crest=False)
+    assert not surf.inside.any()
+
+
+@pytest.mark.parametrize("taper", [5.0, 12.0])
+def test_taper_scales_by_end_distance(taper):
+    grid, xs, ys, surf = _surface(taper=taper)
+    X, Y = np.meshgrid(xs, ys)
+    de = np.minimum(np.hypot(X - 20.0, Y - 50.0), np.hypot(X - 80.0, Y - 50.0))
+    v = np.abs(Y - 50.0)
+    full = H - np.maximum(v - W / 2, 0.0) / B
+    expect = full * np.minimum(de / taper, 1.0)
+    on = surf.mask & (expect > 0)
+    np.testing.assert_allclose(surf.fill[on], expect[on])
+    assert np.isnan(surf.fill[surf.mask & ~on]).all()
+
+    # the middle, further than the taper from both ends, is the untapered prism
+    mid = (xs > 20.0 + taper + W / 2 + B * H) & (xs < 80.0 - taper - W / 2 - B * H)
+    np.testing.assert_allclose(np.nansum(surf.fill[:, mid], axis=0), W * H + B * H * H)
+    _, V, _ = be.fill_stats(surf.fill, grid.cell_area)
+    assert V < L * (W * H + B * H * H)
+
+
+def _terrain(grid, win):
+    xs, ys = grid.centres(win)
+    X, Y = np.meshgrid(xs, ys)
+    return 0.01 * X - 0.02 * Y + 0.5 * np.sin(X / 7.0) * np.cos(Y / 11.0)
+
+
+@pytest.mark.parametrize("smooth", [(0.0, 0.0), (3.0, 2.0)])
+def test_chunked_matches_unchunked(smooth):
+    n = 240
+    grid = be.Grid(0.0, n * CELL, CELL, CELL, n, n)
+    parts = [np.array([[15.0, 20.0], [120.0, 130.0], [225.0, 210.0]])]
+    crest = be.gradient_profile(parts, 3.0, 1.0)
+    reach = be.feature_reach(W, B, 4.0, 0.0)
+    margin = be.smooth_margin(smooth[0], smooth[1], CELL)
+
+    def job(win, **kw):
+        xs, ys = grid.centres(win)
+        return dict({"oid": 1, "cid": "A", "window": win, "dem": _terrain(grid, win), "xs": xs, "ys": ys,
+                     "parts": parts, "crest_z": crest, "crest_w": W, "batter": B, "taper": 4.0,
+                     "keep_crest": True, "reach": reach, "cell": CELL, "cell_area": grid.cell_area,
+                     "strip": 0.3, "smooth_crest": smooth[0], "smooth_design": smooth[1], "row": []}, **kw)
+
+    [(_, _, whole)] = be.chunk_plan(grid, parts, reach, 0)
+    ref = be.run_feature(job(whole))
+    chunks = be.chunk_plan(grid, parts, reach, 4000)
+    assert len(chunks) > 3
+
+    got = np.zeros(3)
+    for k, (_, _, core) in enumerate(chunks):
+        res = be.run_feature(job(be.pad_window(grid, core, margin), core=core,
+                                 earlier=[c for _, _, c in chunks[:k]], piece=(k, len(chunks))))
+        assert res.window == core
+        got += res.row[:3]
+        sl = (slice(core.row0 - whole.row0, core.row0 - whole.row0 + core.nrows),
+              slice(core.col0 - whole.col0, core.col0 - whole.col0 + core.ncols))
+        np.testing.assert_allclose(res.fill, ref.fill[sl], rtol=1e-9, atol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(got, ref.row[:3], rtol=1e-9)
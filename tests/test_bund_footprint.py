@@ -0,0 +1,38 @@
+# bund_footprint.map_rings: simplified rings of one footprint must not cross each other
+# (a hole pushed over its outer ring makes an invalid polygon).
+
+import numpy as np
+import pytest
+
+import bund_footprint as bf
+
+
+def _crossings(rings):
+    return [(i, j) for i in range(len(rings)) for j in range(i + 1, len(rings))
+            if bf.rings_cross(rings[i], rings[j])]
+
+
+def _mask(seed, n=30):
+    rng = np.random.default_rng(seed)
+    mask = rng.random((n, n)) < 0.8
+    mask[rng.random(mask.shape) < 0.08] = False    # holes, many touching at corners
+    return mask
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_exact_rings_only_touch(seed):
+    rings = bf.map_rings(bf.trace_rings(_mask(seed)), 0.0, 30.0, 1.0)
+    assert _crossings(rings) == []
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("tol", [1.0, 2.0, 4.0])
+def test_simplified_rings_do_not_cross(seed, tol):
+    rings = bf.map_rings(bf.trace_rings(_mask(seed)), 0.0, 30.0, 1.0, tol)
+    assert _crossings(rings) == []
+
+
+def test_crossing_detected():
+    a = np.array([[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]], float)
+    assert bf.rings_cross(a, a + 1.0)
+    assert not bf.rings_cross(a, a + 2.0)      # shares one corner only
@@ -0,0 +1,43 @@
+# Edge-manifold check of bund_mesh.heightfield_solid: every directed edge of a closed,
+# consistently wound solid appears exactly once, and its reverse exactly once.
+
+import numpy as np
+import pytest
+
+import bund_mesh as bm
+
+
+def _directed_edges(mesh):
+    f = mesh.faces
+    return np.concatenate([f[:, [0, 1]], f[:, [1, 2]], f[:, [2, 0]]])
+
+
+def _assert_manifold(mesh):
+    e = _directed_edges(mesh)
+    uniq, count = np.unique(e, axis=0, return_counts=True)
+    assert (count == 1).all(), f"{(count > 1).sum()} directed edge(s) used more than once"
+    fwd = {tuple(x) for x in uniq.tolist()}
+    assert all((b, a) in fwd for a, b in fwd), "open edge (no reverse twin)"
+
+
+def _solid(mask, ztol=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    bottom = 10.0 + rng.random(mask.shape)
+    top = np.where(mask, bottom + 1.0 + rng.random(mask.shape), np.nan)
+    return bm.heightfield_solid(top, bottom, 0.0, float(mask.shape[0]), 1.0, ztol=ztol), top, bottom
+
+
+def test_diagonal_pinch():
+    for mask in (np.array([[1, 0], [0, 1]], bool), np.array([[0, 1], [1, 0]], bool)):
+        mesh, _, _ = _solid(mask)
+        _assert_manifold(mesh)
+        assert bm.mesh_volume(mesh) > 0
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize("ztol", [0.0, 0.5])
+def test_random_masks(seed, ztol):
+    rng = np.random.default_rng(seed)
+    mask = rng.random((24, 24)) < 0.75
+    mask[rng.random(mask.shape) < 0.1] = False    # NoData holes
+    _assert_manifold(_solid(mask, ztol, seed)[0])
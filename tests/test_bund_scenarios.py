@@ -0,0 +1,47 @@
+# bund_scenarios.solve_level: the solved level offset must reproduce the target fill volume
+# (within tol_m3) when the design is evaluated again from scratch.
+
+import numpy as np
+import pytest
+
+import bund_engine as be
+import bund_scenarios as bs
+
+CELL = 1.0
+N = 120
+
+
+def _feature(terrain, mode):
+    grid = be.Grid(0.0, N * CELL, CELL, CELL, N, N)
+    xs, ys = grid.centres(grid.window(0.0, 0.0, N * CELL, N * CELL))
+    X, Y = np.meshgrid(xs, ys)
+    dem = {"flat": np.zeros_like(X), "slope": 0.02 * X + 0.01 * Y}[terrain].astype("float32")
+    parts = [np.array([[30.0, 60.0], [90.0, 60.0]])]
+    base = {"mode": mode, "crest": 1.0, "start_h": 1.0, "end_h": 2.0, "hag": 1.0,
+            "crest_w": 3.0, "batter": 3.0, "taper": 5.0, "keep_crest": True, "extra_buf": 0.0,
+            "strip": 0.0, "cell": CELL, "step": 2 * CELL}
+    return grid, dem, xs, ys, parts, base
+
+
+@pytest.mark.parametrize("terrain", ["flat", "slope"])
+@pytest.mark.parametrize("mode", ["CONST_ABS", "GRADIENT"])
+@pytest.mark.parametrize("target", [250.0, 1500.0])
+def test_solved_level_reproduces_target(terrain, mode, target):
+    grid, dem, xs, ys, parts, base = _feature(terrain, mode)
+    tol = max(target * 1e-3, 0.01)
+    pf, ground = bs.prepare(dem, xs, ys, parts, base, [{}])
+    res = bs.solve_level(bs.feature_volume_fn(pf, ground, base, grid.cell_area), target, tol)
+    assert res.converged
+
+    # fresh evaluation of the solved design, not the solver's own record of it
+    p = bs.effective(base, bs.level_scenario(base, res.dz))
+    [(_, (_, vol, _))] = bs.sweep_feature(dem, xs, ys, parts, p, [{}], grid.cell_area)
+    assert abs(vol - target) <= tol
+    assert abs(vol - res.value) <= 1e-6 * max(target, 1.0)
+
+
+def test_unreachable_target_not_converged():
+    grid, dem, xs, ys, parts, base = _feature("flat", "CONST_ABS")
+    pf, ground = bs.prepare(dem, xs, ys, parts, base, [{}])
+    res = bs.solve_level(bs.feature_volume_fn(pf, ground, base, grid.cell_area), -10.0, 0.01, max_iter=20)
+    assert not res.converged
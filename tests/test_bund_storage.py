@@ -0,0 +1,47 @@
+# bund_storage.flood: NoData holes inside the DEM are walls the pond wraps around; NoData
+# running off the window is an outlet.
+
+import numpy as np
+
+import bund_storage as st
+
+
+def _bowl(n=41):
+    y, x = np.mgrid[0:n, 0:n]
+    return ((x - n // 2) ** 2 + (y - n // 2) ** 2) / 100.0
+
+
+def test_interior_hole_is_a_wall():
+    z = _bowl()
+    ref, _ = st.flood(z, (20, 20))
+    z[24:28, 24:28] = np.nan
+    pond, _ = st.flood(z, (20, 20))
+    assert pond.cause == ref.cause == "edge"
+    assert pond.spill == ref.spill
+    assert len(pond.key) == len(ref.key) - 16
+
+
+def test_interior_hole_next_to_pit():
+    z = _bowl()
+    z[21, 20] = np.nan                 # right beside the seed; the cells behind it are dips
+    pond, _ = st.flood(z, (20, 20), tol=0.1)
+    assert pond.cause == "edge"
+    assert len(pond.key) > 100
+
+
+def test_nodata_off_the_window_is_an_outlet():
+    z = _bowl()
+    z[20, 30:] = np.nan                # channel of NoData out to the right edge
+    pond, _ = st.flood(z, (20, 20))
+    assert pond.cause == "nodata"
+    assert pond.spill < st.flood(_bowl(), (20, 20))[0].spill
+
+
+def test_edge_nodata_follows_winding_runs():
+    z = np.zeros((9, 9))
+    z[0, 1] = z[1, 1:8] = z[2:8, 7] = z[7, 2:7] = np.nan     # hook from the top edge
+    z[4, 3] = np.nan                                         # isolated hole
+    out = st.edge_nodata(z)
+    assert out[7, 2] and out[0, 1]
+    assert not out[4, 3]
+    assert out.sum() == np.isnan(z).sum() - 1